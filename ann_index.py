@@ -0,0 +1,184 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#       OS : GNU/Linux Ubuntu 16.04 or 18.04
+# LANGUAGE : Python 3.5.2 or later
+#   AUTHOR : Klim V. O.
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+'''
+Индекс для приближённого поиска ближайших слов (IVF, inverted file index) при декодировании ответа сети. Строится заранее по модели
+word2vec и сохраняется в .npz файл рядом с ней.
+'''
+
+import os
+import sys
+import time
+import curses
+import numpy as np
+
+
+curses.setupterm()
+
+
+class AnnIndex:
+    ''' Предназначен для приближённого поиска ближайших (по косинусному расстоянию) слов в словаре word2vec. Словарь разбивается
+    на number_lists кластеров (сферический k-means), при поиске вектор сравнивается только со словами из nprobe ближайших кластеров.
+    1. f_name_ann_index - имя .npz файла с построенным индексом (если None - индекс нужно построить с помощью build())
+    2. nprobe - количество просматриваемых при поиске кластеров (больше - точнее, но медленнее) '''
+    def __init__(self, f_name_ann_index=None, nprobe=8):
+        self.centroids = None
+        self.list_ids = None
+        self.list_offsets = None
+        self.nprobe = nprobe
+        if f_name_ann_index is not None:
+            self.load(f_name_ann_index)
+
+
+    def build(self, decode_matrix, number_lists=None, number_iterations=10, max_train_size=100000):
+        ''' Построение индекса по матрице нормированных векторов словаря.
+        1. decode_matrix - матрица нормированных векторов словаря (WordToVec.decode_matrix)
+        2. number_lists - количество кластеров (по умолчанию 4*sqrt(размер словаря))
+        3. number_iterations - количество итераций k-means
+        4. max_train_size - максимальное количество векторов, на которых обучается k-means '''
+
+        vocab_size = len(decode_matrix)
+        if number_lists is None:
+            number_lists = int(4 * np.sqrt(vocab_size))
+        number_lists = max(1, min(number_lists, vocab_size))
+
+        print('[i] Построение индекса: %i слов, %i кластеров...' % (vocab_size, number_lists))
+        random_state = np.random.RandomState(0)
+        train_ids = np.arange(vocab_size)
+        if vocab_size > max_train_size:
+            train_ids = random_state.choice(vocab_size, max_train_size, replace=False)
+        train_vectors = np.asarray(decode_matrix[np.sort(train_ids)], dtype=np.float32)
+
+        self.centroids = train_vectors[random_state.choice(len(train_vectors), number_lists, replace=False)].copy()
+        for i in range(number_iterations):
+            os.write(sys.stdout.fileno(), curses.tigetstr('cuu1'))
+            print('[i] Построение индекса: %i слов, %i кластеров... итерация %i из %i' % (vocab_size, number_lists, i+1, number_iterations))
+            assignment = self.__assign(train_vectors)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assignment, train_vectors)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Пустые кластеры сохраняют старые центроиды
+            not_empty = norms[:, 0] > 0.0
+            self.centroids[not_empty] = sums[not_empty] / norms[not_empty]
+
+        assignment = self.__assign(decode_matrix)
+        self.list_ids = np.argsort(assignment, kind='stable').astype(np.int32)
+        self.list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=number_lists))]).astype(np.int64)
+
+
+    def search(self, vectors, decode_matrix, nprobe=None, decode_scale=None):
+        ''' Поиск индексов ближайших слов для каждого вектора.
+        1. vectors - array из векторов размерностью (number_vectors, size)
+        2. decode_matrix - матрица нормированных векторов словаря, по которой выполняется уточнение среди кандидатов
+        3. nprobe - количество просматриваемых кластеров (по умолчанию self.nprobe)
+        4. decode_scale - масштабы строк decode_matrix, если она квантована в int8 (WordToVec.decode_scale)
+        5. возвращает array из индексов слов размерностью (number_vectors,) '''
+
+        if nprobe is None:
+            nprobe = self.nprobe
+        nprobe = min(nprobe, len(self.centroids))
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        centroid_scores = np.dot(vectors, self.centroids.T)
+        probes = np.argpartition(-centroid_scores, nprobe - 1, axis=1)[:, :nprobe]
+
+        ids = np.empty(len(vectors), dtype=np.int64)
+        for i in range(len(vectors)):
+            candidates = np.concatenate([ self.list_ids[self.list_offsets[l]:self.list_offsets[l+1]] for l in probes[i] ])
+            scores = np.dot(np.asarray(decode_matrix[candidates], dtype=np.float32), vectors[i])
+            if decode_scale is not None:
+                scores *= decode_scale[candidates]
+            ids[i] = candidates[scores.argmax()]
+        return ids
+
+
+    def save(self, f_name_ann_index):
+        ''' Сохранение индекса в .npz файл f_name_ann_index. '''
+        print('[i] Сохранение индекса в %s' % f_name_ann_index)
+        np.savez(f_name_ann_index, centroids=self.centroids, list_ids=self.list_ids, list_offsets=self.list_offsets)
+
+
+    def load(self, f_name_ann_index):
+        ''' Загрузка индекса из .npz файла f_name_ann_index. '''
+        print('[i] Загрузка индекса из %s' % f_name_ann_index)
+        npzfile = np.load(f_name_ann_index)
+        self.centroids = npzfile['centroids']
+        self.list_ids = npzfile['list_ids']
+        self.list_offsets = npzfile['list_offsets']
+
+
+    def __assign(self, vectors, max_scores_size=2**24):
+        ''' Поиск ближайшего центроида для каждого вектора (по частям, что бы ограничить потребление памяти). '''
+        assignment = np.empty(len(vectors), dtype=np.int64)
+        step = max(1, max_scores_size // len(self.centroids))
+        for i in range(0, len(vectors), step):
+            assignment[i:i+step] = np.dot(np.asarray(vectors[i:i+step], dtype=np.float32), self.centroids.T).argmax(axis=1)
+        return assignment
+
+
+def get_f_name_ann_index(f_name_w2v_model):
+    ''' Возвращает имя .npz файла с индексом для модели word2vec f_name_w2v_model (например, data/plays_ru/ann_index_plays_ru.npz). '''
+    f_name_ann_index = f_name_w2v_model[:f_name_w2v_model.rfind('/')+1] + \
+                       f_name_w2v_model[f_name_w2v_model.rfind('/')+1:].replace('w2v_model_', 'ann_index_')
+    return f_name_ann_index[:f_name_ann_index.rfind('.')] + '.npz'
+
+
+def ann_benchmark(w2v, ann_index, vectors, nprobes=(1, 2, 4, 8, 16, 32, 64)):
+    ''' Сравнение приближённого поиска с точным: выводит recall@1 и время декодирования одного вектора для каждого значения nprobe. Точный
+    поиск выполняется с помощью WordToVec.vec2ids() (по частям, с учётом квантования матрицы нормированных векторов), при приближённом
+    поиске учитывается масштаб строк квантованной матрицы.
+    1. w2v - WordToVec с моделью word2vec, для которой построен ann_index
+    2. ann_index - построенный AnnIndex
+    3. vectors - array из векторов размерностью (number_vectors, size), например ответы сети на вопросы из обучающей выборки
+    4. nprobes - проверяемые значения nprobe
+    5. возвращает list из [nprobe, recall@1, время в мс на вектор] '''
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    start_time = time.time()
+    exact_ids = w2v.vec2ids(vectors, exact=True)
+    exact_time = (time.time() - start_time) * 1000.0 / len(vectors)
+
+    print('[i] Сравнение приближённого и точного поиска на %i векторах:' % len(vectors))
+    print('\tточный поиск: recall@1 1.0000, %.4f мс на вектор' % exact_time)
+    result = []
+    for nprobe in nprobes:
+        if nprobe > len(ann_index.centroids):
+            break
+        start_time = time.time()
+        ids = ann_index.search(vectors, w2v.decode_matrix, nprobe, decode_scale=w2v.decode_scale)
+        ann_time = (time.time() - start_time) * 1000.0 / len(vectors)
+        recall = np.mean(ids == exact_ids)
+        print('\tnprobe %i: recall@1 %.4f, %.4f мс на вектор' % (nprobe, recall, ann_time))
+        result.append([nprobe, recall, ann_time])
+    return result
+
+
+def main():
+    from word_to_vec import WordToVec
+
+    f_name_w2v_model_plays = 'data/plays_ru/w2v_model_plays_ru.bin'
+    f_name_w2v_model_conversations = 'data/conversations_ru/w2v_model_conversations_ru.bin'
+    f_name_w2v_model_subtitles = 'data/subtitles_ru/w2v_model_subtitles_ru.bin'
+
+    f_name_w2v_model = f_name_w2v_model_subtitles
+    w2v = WordToVec(f_name_w2v_model)
+
+    print()
+    ann_index = AnnIndex()
+    ann_index.build(w2v.decode_matrix)
+    ann_index.save(get_f_name_ann_index(f_name_w2v_model))
+
+    # Проверка на векторах слов словаря с шумом (ответы сети проверяются с помощью TextToText.assessment_ann_index())
+    random_state = np.random.RandomState(0)
+    vectors = w2v.decode_matrix[random_state.choice(len(w2v.decode_matrix), min(1000, len(w2v.decode_matrix)), replace=False)]
+    vectors = vectors + random_state.normal(0.0, 0.5 / np.sqrt(vectors.shape[1]), vectors.shape).astype(np.float32)
+    ann_benchmark(w2v, ann_index, vectors)
+
+
+if __name__ == '__main__':
+    main()
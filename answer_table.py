@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#       OS : GNU/Linux Ubuntu 16.04 or 18.04
+# LANGUAGE : Python 3.5.2 or later
+#   AUTHOR : Klim V. O.
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+'''
+Таблица заранее вычисленных ответов сети на все вопросы из обучающей выборки. Строится один раз после обучения модели и сохраняется в
+.json файл рядом с ней, после чего ответы на известные вопросы выдаются без прохода через сеть.
+'''
+
+import os
+import sys
+import json
+import time
+import threading
+import curses
+
+from prepared_corpus import iter_prepared_pairs
+
+
+curses.setupterm()
+
+
+class AnswerTable:
+    ''' Предназначен для хранения ответов сети на известные вопросы. Ключ - вопрос после предварительной обработки
+    (SourceToPrepared.prepare_question()) без слов-наполнителей <PAD>. get() может использоваться из нескольких потоков одновременно.
+    1. f_name_answer_table - имя .json файла с построенной таблицей (если None - таблицу нужно построить с помощью build()) '''
+    def __init__(self, f_name_answer_table=None):
+        self.answers = {}
+        self.model_version = None
+        self.number_hits = 0
+        self.number_misses = 0
+        self.__lock = threading.Lock()
+        if f_name_answer_table is not None:
+            self.load(f_name_answer_table)
+
+
+    def build(self, ttt, f_name_training_sample, batch_size=256):
+        ''' Построение таблицы: все уникальные вопросы из f_name_training_sample пакетами по batch_size проходят через сеть.
+        1. ttt - TextToText с загруженной моделью
+        2. f_name_training_sample - имя .pkl файла с предварительно обработанными парами [вопрос,ответ]
+        3. batch_size - количество вопросов, обрабатываемых за один раз '''
+
+        questions = {}
+        for question, answer in iter_prepared_pairs(f_name_training_sample):
+            questions.setdefault(get_answer_table_key(question), question)
+        questions = list(questions.values())
+
+        print('[i] Построение таблицы ответов для %i вопросов...' % len(questions))
+        start_time = time.time()
+        self.answers = {}
+        for i in range(0, len(questions), batch_size):
+            os.write(sys.stdout.fileno(), curses.tigetstr('cuu1'))
+            print('[i] Построение таблицы ответов для %i вопросов... %i из %i' % (len(questions), i, len(questions)))
+            batch = questions[i:i+batch_size]
+            answers = ttt.predict_prepared(batch, batch_size, use_lookups=False)
+            for question, answer in zip(batch, answers):
+                self.answers[get_answer_table_key(question)] = answer
+        os.write(sys.stdout.fileno(), curses.tigetstr('cuu1'))
+        print('[i] Построение таблицы ответов для %i вопросов... %i из %i' % (len(questions), len(questions), len(questions)))
+        print('[i] Время построения: %.2f мин' % ((time.time() - start_time)/60.0))
+        self.model_version = ttt.model_version
+
+
+    def get(self, question):
+        ''' Возвращает ответ на вопрос question (после предварительной обработки) или None, если его нет в таблице. '''
+        answer = self.answers.get(get_answer_table_key(question))
+        with self.__lock:
+            if answer is None:
+                self.number_misses += 1
+            else:
+                self.number_hits += 1
+        return answer
+
+
+    def get_statistics(self):
+        ''' Возвращает dict с размером таблицы, количеством попаданий и промахов и долей попаданий (как ResponseCache.get_statistics()). '''
+        with self.__lock:
+            number_requests = self.number_hits + self.number_misses
+            return {'size': len(self.answers), 'number_hits': self.number_hits, 'number_misses': self.number_misses,
+                    'hit_ratio': self.number_hits / number_requests if number_requests > 0 else 0.0}
+
+
+    def save(self, f_name_answer_table):
+        ''' Сохранение таблицы в .json файл f_name_answer_table. '''
+        print('[i] Сохранение таблицы ответов в %s' % f_name_answer_table)
+        with open(f_name_answer_table, 'w') as f_answer_table:
+            json.dump({'model_version': self.model_version, 'answers': self.answers}, f_answer_table, ensure_ascii=False, separators=(',', ':'))
+
+
+    def load(self, f_name_answer_table):
+        ''' Загрузка таблицы из .json файла f_name_answer_table. '''
+        print('[i] Загрузка таблицы ответов из %s' % f_name_answer_table)
+        with open(f_name_answer_table, 'r') as f_answer_table:
+            answer_table = json.load(f_answer_table)
+        self.answers = answer_table['answers']
+        self.model_version = answer_table['model_version']
+        if self.model_version is not None:
+            self.model_version = tuple(self.model_version)
+        print('[i] Размер таблицы ответов: %i вопросов' % len(self.answers))
+
+
+def get_answer_table_key(question):
+    ''' Возвращает ключ таблицы ответов для вопроса question (list из слов после предварительной обработки): слова без <PAD> через пробел. '''
+    return ' '.join([ word for word in question if word != '<PAD>' ])
+
+
+def get_f_name_answer_table(f_name_model_weights):
+    ''' Возвращает имя .json файла с таблицей ответов для весов модели f_name_model_weights (например, для
+    data/plays_ru/model_weights_plays_ru.h5 - data/plays_ru/answer_table_plays_ru.json). '''
+    f_name_answer_table = f_name_model_weights[:f_name_model_weights.rfind('/')+1] + \
+                          f_name_model_weights[f_name_model_weights.rfind('/')+1:].replace('model_weights_', 'answer_table_')
+    return os.path.splitext(f_name_answer_table)[0] + '.json'
+
+
+def main():
+    from text_to_text import TextToText
+
+    f_name_training_sample = 'data/plays_ru/prepared_plays_ru.pkl'
+    f_name_model_weights = 'data/plays_ru/model_weights_plays_ru.h5'
+
+    ttt = TextToText(f_name_model_weights=f_name_model_weights)
+    print()
+    answer_table = AnswerTable()
+    answer_table.build(ttt, f_name_training_sample)
+    answer_table.save(get_f_name_answer_table(f_name_model_weights))
+
+
+if __name__ == '__main__':
+    main()
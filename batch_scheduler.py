@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#       OS : GNU/Linux Ubuntu 16.04 or 18.04
+# LANGUAGE : Python 3.5.2 or later
+#   AUTHOR : Klim V. O.
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+'''
+Объединение одновременных запросов к сети в пакеты (micro-batching). Запросы из разных потоков собираются в очередь, отдельный поток
+забирает из неё до max_batch_size запросов (ожидая следующий не дольше max_delay_ms) и выполняет для них один проход сети.
+'''
+
+import time
+import threading
+import queue
+import numpy as np
+from collections import OrderedDict
+
+
+class BatchScheduler:
+    ''' Предназначен для объединения одновременных запросов к сети в пакеты.
+    1. predict_function - функция, которая принимает array размерностью (batch_size, ...) и возвращает array из batch_size результатов
+    (например, model.predict)
+    2. max_batch_size - максимальный размер пакета
+    3. max_delay_ms - максимальное время ожидания следующего запроса (в мс) после получения первого запроса пакета
+    4. context - функция, возвращающая контекст, в котором выполняется predict_function (например, graph.as_default для tensorflow) '''
+    def __init__(self, predict_function, max_batch_size=32, max_delay_ms=5, context=None):
+        self.predict_function = predict_function
+        self.max_batch_size = max_batch_size
+        self.max_delay_ms = max_delay_ms
+        self.context = context
+        self.number_batches = 0
+        self.number_items = 0
+        self.__queue = queue.Queue()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+
+    def predict(self, item):
+        ''' Добавление item в очередь и ожидание результата (вызывается из любого потока).
+        1. item - array с одним входом сети (без размерности пакета)
+        2. возвращает array с результатом сети для item '''
+        return self.predict_many([item])[0]
+
+
+    def predict_many(self, items):
+        ''' Добавление всех items в очередь и ожидание результатов (items могут попасть в разные пакеты, в том числе вместе с запросами из
+        других потоков).
+        1. items - list или array из входов сети
+        2. возвращает list из результатов сети в порядке items '''
+
+        requests = [ {'item': item, 'done': threading.Event(), 'result': None, 'error': None} for item in items ]
+        for request in requests:
+            self.__queue.put(request)
+        for request in requests:
+            request['done'].wait()
+            if request['error'] is not None:
+                raise request['error']
+        return [ request['result'] for request in requests ]
+
+
+    def stop(self):
+        ''' Остановка потока, выполняющего пакеты (запросы, уже находящиеся в очереди, будут выполнены). '''
+        self.__queue.put(None)
+        self.__thread.join()
+
+
+    def get_statistics(self):
+        ''' Возвращает dict с количеством выполненных пакетов и запросов и средним размером пакета. '''
+        return {'number_batches': self.number_batches, 'number_items': self.number_items,
+                'average_batch_size': self.number_items / max(self.number_batches, 1)}
+
+
+    def __run(self):
+        ''' Сбор запросов из очереди в пакеты и их выполнение. '''
+        while True:
+            request = self.__queue.get()
+            if request is None:
+                return
+            requests = [request]
+            stop = False
+            deadline = time.time() + self.max_delay_ms / 1000.0
+            while len(requests) < self.max_batch_size:
+                timeout = deadline - time.time()
+                try:
+                    request = self.__queue.get(timeout=timeout) if timeout > 0 else self.__queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                requests.append(request)
+
+            # Входы разной размерности (например, вопросы разной длины при использовании групп по длине) выполняются отдельными пакетами
+            groups = OrderedDict()
+            for request in requests:
+                groups.setdefault(np.shape(request['item']), []).append(request)
+            for group in groups.values():
+                try:
+                    batch = np.stack([ request['item'] for request in group ])
+                    if self.context is not None:
+                        with self.context():
+                            results = self.predict_function(batch)
+                    else:
+                        results = self.predict_function(batch)
+                    for request, result in zip(group, results):
+                        request['result'] = result
+                except Exception as error:
+                    for request in group:
+                        request['error'] = error
+            self.number_batches += len(groups)
+            self.number_items += len(requests)
+            for request in requests:
+                request['done'].set()
+            if stop:
+                return
+
+
+def load_test(predict, questions, number_threads=32, number_requests=1000):
+    ''' Нагрузочный тест: number_threads потоков одновременно отправляют в сумме number_requests вопросов в predict.
+    1. predict - функция, которая принимает строку с вопросом и возвращает ответ (например, TextToText.predict)
+    2. questions - list из вопросов, которые отправляются по кругу
+    3. возвращает количество обработанных вопросов в секунду '''
+
+    counter = iter(range(number_requests))
+    lock = threading.Lock()
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            predict(questions[i % len(questions)])
+
+    start_time = time.time()
+    threads = [ threading.Thread(target=worker) for i in range(number_threads) ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return number_requests / (time.time() - start_time)
+
+
+def main():
+    from text_to_text import TextToText
+
+    ttt = TextToText()
+    questions = ['Привет', 'Как дела?', 'Что ты умеешь?', 'Кто ты?']
+
+    print('[i] Без объединения запросов: %.2f вопросов/с' % load_test(ttt.predict, questions, number_threads=1, number_requests=200))
+    for max_batch_size in [8, 32, 64]:
+        ttt.start_batch_scheduler(max_batch_size=max_batch_size)
+        print('[i] Пакеты до %i запросов: %.2f вопросов/с, средний размер пакета %.2f' % (max_batch_size, load_test(ttt.predict, questions),
+              ttt.batch_scheduler.get_statistics()['average_batch_size']))
+        ttt.stop_batch_scheduler()
+
+
+if __name__ == '__main__':
+    main()
@@ -20,6 +20,7 @@ from text_to_text import TextToText
 from text_to_speech import TextToSpeech
 from speech_to_text import SpeechToText
 from preparing_speech_to_text import LanguageModel
+from frozen_model import get_f_name_frozen_model, is_frozen_model_current
 
 
 f_name_source_data = 'data/plays_ru/plays_ru.txt'
@@ -141,7 +142,12 @@ def predict(speech_recognition=False, speech_synthesis=False):
     2. speech_synthesis - включение озвучивания ответов с помощью RHVoice '''
     name_dataset = configure_file_names()
 
-    ttt = TextToText(f_name_w2v_model=f_name_w2v_model, f_name_model=f_name_model, f_name_model_weights=f_name_model_weights)
+    # Если модель была экспортирована в замороженный граф (frozen_model.py) из текущих весов, то загружается он
+    f_name_frozen_model = get_f_name_frozen_model(f_name_model_weights)
+    if is_frozen_model_current(f_name_frozen_model, f_name_model_weights):
+        ttt = TextToText(f_name_w2v_model=f_name_w2v_model, f_name_frozen_model=f_name_frozen_model)
+    else:
+        ttt = TextToText(f_name_w2v_model=f_name_w2v_model, f_name_model=f_name_model, f_name_model_weights=f_name_model_weights)
 
     if speech_recognition:
         print('[i] Загрузка языковой модели для распознавания речи...')
@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#       OS : GNU/Linux Ubuntu 16.04 or 18.04
+# LANGUAGE : Python 3.5.2 or later
+#   AUTHOR : Klim V. O.
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+'''
+Контрольные точки обучения модели: веса модели, состояние оптимизатора и номер выполненного цикла обучения сохраняются в .npz файл,
+по которому TextToText.train() продолжает прерванное обучение. Запись выполняется отдельным потоком из копии весов, поэтому обучение
+не ждёт окончания записи на диск. Файл сначала записывается во временный и затем переименовывается, поэтому при падении во время записи
+остаётся предыдущая контрольная точка.
+'''
+
+import os
+import time
+import threading
+import queue
+import numpy as np
+
+
+class CheckpointWriter:
+    ''' Предназначен для записи контрольных точек в отдельном потоке. Одновременно записывается не больше одной контрольной точки: если
+    предыдущая ещё записывается, save() дожидается её окончания. Что бы в памяти, кроме весов самой модели, находилась не больше чем одна
+    копия весов и состояния оптимизатора (для Adam - около 3 размеров модели), перед их копированием нужно вызвать wait().
+    1. f_name_checkpoint - имя .npz файла контрольной точки
+    2. on_saved - функция, которая вызывается (из потока записи) после записи каждой контрольной точки с номером цикла и временем записи в секундах '''
+    def __init__(self, f_name_checkpoint, on_saved=None):
+        self.f_name_checkpoint = f_name_checkpoint
+        self.on_saved = on_saved
+        self.error = None
+        self.__queue = queue.Queue()
+        self.__is_idle = threading.Event()
+        self.__is_idle.set()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+
+    def save(self, cycle, model_weights, optimizer_weights):
+        ''' Добавление контрольной точки в очередь на запись.
+        1. cycle - номер выполненного цикла обучения
+        2. model_weights - list из array с весами модели (model.get_weights() возвращает их копию)
+        3. optimizer_weights - list из array с состоянием оптимизатора (model.optimizer.get_weights()) '''
+        self.wait()
+        self.__is_idle.clear()
+        self.__queue.put([cycle, model_weights, optimizer_weights])
+
+
+    def wait(self):
+        ''' Ожидание окончания записи предыдущей контрольной точки. '''
+        self.__is_idle.wait()
+
+
+    def close(self):
+        ''' Ожидание записи последней контрольной точки и остановка потока. '''
+        self.__queue.put(None)
+        self.__thread.join()
+
+
+    def __run(self):
+        ''' Запись контрольных точек из очереди. '''
+        while True:
+            checkpoint = self.__queue.get()
+            if checkpoint is None:
+                return
+            try:
+                start_time = time.time()
+                save_checkpoint(self.f_name_checkpoint, *checkpoint)
+                if self.on_saved is not None:
+                    self.on_saved(checkpoint[0], time.time() - start_time)
+            except Exception as error:
+                self.error = error
+                print('\n[E] Не удалось сохранить контрольную точку %s: %s\n' % (self.f_name_checkpoint, error))
+            finally:
+                checkpoint = None
+                self.__is_idle.set()
+
+
+def save_checkpoint(f_name_checkpoint, cycle, model_weights, optimizer_weights):
+    ''' Запись контрольной точки в .npz файл f_name_checkpoint (через временный файл). '''
+    arrays = {'cycle': np.array(cycle)}
+    for i, weight in enumerate(model_weights):
+        arrays['model_weight_%i' % i] = weight
+    for i, weight in enumerate(optimizer_weights):
+        arrays['optimizer_weight_%i' % i] = weight
+
+    f_name_tmp = f_name_checkpoint + '.tmp'
+    with open(f_name_tmp, 'wb') as f_checkpoint:
+        np.savez(f_checkpoint, number_model_weights=np.array(len(model_weights)),
+                 number_optimizer_weights=np.array(len(optimizer_weights)), **arrays)
+        f_checkpoint.flush()
+        os.fsync(f_checkpoint.fileno())
+    os.replace(f_name_tmp, f_name_checkpoint)
+
+
+def load_checkpoint(f_name_checkpoint):
+    ''' Загрузка контрольной точки из .npz файла f_name_checkpoint.
+    1. возвращает номер выполненного цикла обучения, list из весов модели и list из состояния оптимизатора '''
+    with np.load(f_name_checkpoint) as checkpoint:
+        model_weights = [ checkpoint['model_weight_%i' % i] for i in range(int(checkpoint['number_model_weights'])) ]
+        optimizer_weights = [ checkpoint['optimizer_weight_%i' % i] for i in range(int(checkpoint['number_optimizer_weights'])) ]
+        return int(checkpoint['cycle']), model_weights, optimizer_weights
+
+
+def get_f_name_checkpoint(f_name_model_weights):
+    ''' Возвращает имя .npz файла контрольной точки для весов модели f_name_model_weights (например, для
+    data/plays_ru/model_weights_plays_ru.h5 - data/plays_ru/model_weights_plays_ru_checkpoint.npz). '''
+    return os.path.splitext(f_name_model_weights)[0] + '_checkpoint.npz'
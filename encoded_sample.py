@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#       OS : GNU/Linux Ubuntu 16.04 or 18.04
+# LANGUAGE : Python 3.5.2 or later
+#   AUTHOR : Klim V. O.
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+'''
+Доступ к закодированной обучающей выборке. Выборка хранится в двух .npy файлах (вопросы и ответы), которые открываются через mmap,
+поэтому её размер не ограничен объёмом оперативной памяти. Вопросы и ответы хранятся либо в виде индексов слов (вместе с .json файлом,
+в котором указана модель word2vec, по которой индексы переводятся в вектора), либо в виде векторов. Также поддерживается старый
+формат (один .npz файл).
+'''
+
+import os
+import json
+import numpy as np
+try:
+    from keras.utils import Sequence
+except ImportError:
+    # Без keras EncodedSampleSequence можно использовать как обычную последовательность пакетов
+    Sequence = object
+
+
+class EncodedSample:
+    ''' Предназначен для чтения закодированной обучающей выборки, сохранённой с помощью WordToVec.data_w2v_encode().
+    1. f_name_enc_training_sample - имя закодированной выборки, например data/plays_ru/encoded_plays_ru.npz (по нему определяются имена
+    файлов data/plays_ru/encoded_plays_ru_questions.npy и data/plays_ru/encoded_plays_ru_answers.npy)
+    2. mmap_mode - режим открытия .npy файлов (по умолчанию 'r' - только чтение, без загрузки в оперативную память)
+
+    Если выборка хранится в виде индексов слов, то questions и answers содержат индексы размерностью (num_examples, sequence_length),
+    а get_batch() возвращает уже вектора. '''
+    def __init__(self, f_name_enc_training_sample, mmap_mode='r'):
+        self.w2v = None
+        f_name_questions, f_name_answers = get_f_names_enc_training_sample(f_name_enc_training_sample)
+        if os.path.isfile(f_name_questions) and os.path.isfile(f_name_answers):
+            self.questions = np.load(f_name_questions, mmap_mode=mmap_mode)
+            self.answers = np.load(f_name_answers, mmap_mode=mmap_mode)
+        else:
+            print('[W] Выборка %s в старом формате загружается в оперативную память целиком (для чтения через mmap закодируйте её заново)' %
+                  f_name_enc_training_sample)
+            npzfile = np.load(f_name_enc_training_sample)
+            self.questions, self.answers = npzfile['questions'], npzfile['answers']
+        self.num_examples, self.sequence_length = self.questions.shape[:2]
+
+        if self.questions.ndim == 2:
+            from word_to_vec import WordToVec
+            with open(get_f_name_enc_training_sample_info(f_name_enc_training_sample), 'r') as f_enc_training_sample_info:
+                info = json.load(f_enc_training_sample_info)
+            self.w2v = WordToVec(info['f_name_w2v_model'])
+            if len(self.w2v.index2word) != info['vocabulary_size']:
+                print('[W] Размер словаря модели word2vec %s не совпадает с использованным при кодировании выборки' % info['f_name_w2v_model'])
+            self.vec_size = self.w2v.vectors.shape[1]
+        else:
+            self.vec_size = self.questions.shape[2]
+
+
+    def is_ids(self):
+        ''' Возвращает True, если выборка хранится в виде индексов слов. '''
+        return self.w2v is not None
+
+
+    def get_batch(self, start, end=None, sequence_length=None):
+        ''' Возвращает вопросы и ответы с индексами start:end (или с индексами из list/array start, если end=None) в виде array float32
+        размерностью (number_examples, sequence_length, vec_size). Если задан sequence_length, то у вопросов остаются последние
+        sequence_length слов, а у ответов - первые (т.е. удаляются лишние <PAD>, подробнее в get_sequence_lengths()). '''
+        indexes = slice(start, end) if end is not None else start
+        questions, answers = self.questions[indexes], self.answers[indexes]
+        if sequence_length is not None:
+            questions, answers = questions[:, -sequence_length:], answers[:, :sequence_length]
+        if self.w2v is not None:
+            return self.w2v.ids2vec(questions), self.w2v.ids2vec(answers)
+        return np.asarray(questions, dtype=np.float32), np.asarray(answers, dtype=np.float32)
+
+
+    def get_sequence_lengths(self, chunk_size=100000):
+        ''' Возвращает array с длиной последовательности, необходимой каждой паре (подробнее в get_sequence_lengths()), или None, если выборка
+        хранится в виде векторов. '''
+        if self.w2v is None:
+            return
+        pad_id = self.w2v.word_index['<PAD>']
+        sequence_lengths = np.empty(self.num_examples, dtype=np.int64)
+        for i in range(0, self.num_examples, chunk_size):
+            sequence_lengths[i:i+chunk_size] = get_sequence_lengths(pad_id, np.asarray(self.questions[i:i+chunk_size]),
+                                                                    np.asarray(self.answers[i:i+chunk_size]))
+        return sequence_lengths
+
+
+class EncodedSampleSequence(Sequence):
+    ''' Последовательность пакетов [вопросы, ответы] из закодированной выборки для fit_generator() и evaluate_generator(). Каждый пакет
+    читается из .npy файлов (через mmap) и масштабируется в диапазон [0, 1] при обращении к нему, поэтому потребление оперативной памяти не
+    зависит от размера выборки. В отличие от генератора, пакеты можно безопасно получать из нескольких потоков, поэтому keras может
+    готовить следующие пакеты в фоне (параметры workers и max_queue_size в fit_generator()).
+    1. enc_training_sample - EncodedSample
+    2. batch_size - размер пакета
+    3. shuffle - True: перемешивать примеры перед каждой эпохой
+    4. examples - array из индексов используемых примеров (если None - используются все примеры)
+    5. sequence_length - длина последовательностей в пакетах (если None - полная длина, подробнее в EncodedSample.get_batch()) '''
+    def __init__(self, enc_training_sample, batch_size=32, shuffle=True, examples=None, sequence_length=None):
+        self.enc_training_sample = enc_training_sample
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.sequence_length = sequence_length
+        self.examples = np.arange(enc_training_sample.num_examples) if examples is None else np.asarray(examples)
+        self.indexes = self.examples
+        self.on_epoch_end()
+
+
+    def __len__(self):
+        return int(np.ceil(len(self.examples) / self.batch_size))
+
+
+    def __getitem__(self, i):
+        # Индексы внутри пакета сортируются, что бы чтение из .npy файлов шло по возрастанию смещения
+        questions, answers = self.enc_training_sample.get_batch(np.sort(self.indexes[i*self.batch_size:(i+1)*self.batch_size]),
+                                                                sequence_length=self.sequence_length)
+        return (questions + 1.0) * 0.5, (answers + 1.0) * 0.5
+
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            self.indexes = np.random.permutation(self.examples)
+
+
+def get_sequence_lengths(pad_id, questions_ids, answers_ids=None):
+    ''' Возвращает array с длиной последовательности, необходимой каждой паре: наибольшее количество слов в вопросе и ответе + 2 (как при
+    выравнивании в SourceToPrepared.prepare_all()). Количество слов определяется по количеству <PAD> в начале вопроса и в конце ответа, поэтому
+    вопрос можно обрезать до последних, а ответ - до первых sequence_length слов без потери слов.
+    1. pad_id - индекс <PAD> в словаре
+    2. questions_ids - array из индексов слов вопросов размерностью (number_examples, sequence_length)
+    3. answers_ids - array из индексов слов ответов той же размерности (если None - учитываются только вопросы) '''
+
+    full_length = questions_ids.shape[1]
+    number_pads = get_number_leading(questions_ids != pad_id)
+    if answers_ids is not None:
+        number_pads = np.minimum(number_pads, get_number_leading(answers_ids[:, ::-1] != pad_id))
+    return np.minimum(full_length - number_pads + 1, full_length)
+
+
+def get_number_leading(is_word):
+    ''' Возвращает количество элементов до первого True в каждой строке is_word (длину строки, если True нет). '''
+    return np.where(is_word.any(axis=1), is_word.argmax(axis=1), is_word.shape[1])
+
+
+def get_f_names_enc_training_sample(f_name_enc_training_sample):
+    ''' Возвращает имена .npy файлов с закодированными вопросами и ответами для выборки f_name_enc_training_sample (например, для
+    data/plays_ru/encoded_plays_ru.npz - data/plays_ru/encoded_plays_ru_questions.npy и data/plays_ru/encoded_plays_ru_answers.npy). '''
+    f_name_base = os.path.splitext(f_name_enc_training_sample)[0]
+    return f_name_base + '_questions.npy', f_name_base + '_answers.npy'
+
+
+def get_f_name_enc_training_sample_info(f_name_enc_training_sample):
+    ''' Возвращает имя .json файла с информацией о выборке, закодированной в индексы слов (например, data/plays_ru/encoded_plays_ru.json). '''
+    return os.path.splitext(f_name_enc_training_sample)[0] + '.json'
+
+
+def is_enc_training_sample(f_name_enc_training_sample):
+    ''' Проверяет, существует ли закодированная выборка f_name_enc_training_sample (в новом или старом формате). '''
+    f_name_questions, f_name_answers = get_f_names_enc_training_sample(f_name_enc_training_sample)
+    return (os.path.isfile(f_name_questions) and os.path.isfile(f_name_answers)) or os.path.isfile(f_name_enc_training_sample)
@@ -0,0 +1,190 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#       OS : GNU/Linux Ubuntu 16.04 or 18.04
+# LANGUAGE : Python 3.5.2 or later
+#   AUTHOR : Klim V. O.
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+'''
+Экспорт обученной модели seq2seq в замороженный граф tensorflow (.pb файл), который содержит только операции, необходимые для получения
+ответа сети, веса в виде констант и информацию о модели (имена входа и выхода, max_sequence_length). Загрузка такого графа не требует
+восстановления модели из .json с помощью keras и recurrentshop и не создаёт объектов, нужных только для обучения.
+'''
+
+import os
+import sys
+import json
+import time
+import multiprocessing
+import numpy as np
+try:
+    import tensorflow as tf
+except ImportError:
+    # Без tensorflow замороженный граф недоступен (ответы сети можно получать с помощью TextToText(backend='numpy'))
+    tf = None
+
+
+# Имя узла графа, в котором хранится информация о модели
+FROZEN_MODEL_INFO = 'frozen_model_info'
+
+
+class FrozenModel:
+    ''' Предназначен для получения ответов сети с помощью замороженного графа, сохранённого export_frozen_model(). Поддерживает тот же
+    predict(), что и модель keras.
+    1. f_name_frozen_model - имя .pb файла с замороженным графом '''
+    def __init__(self, f_name_frozen_model):
+        graph_def = tf.GraphDef()
+        with open(f_name_frozen_model, 'rb') as f_frozen_model:
+            graph_def.ParseFromString(f_frozen_model.read())
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(graph_def, name='')
+        self.session = tf.Session(graph=self.graph)
+
+        info = json.loads(self.session.run(FROZEN_MODEL_INFO + ':0').decode())
+        self.input = self.graph.get_tensor_by_name(info['input'])
+        self.output = self.graph.get_tensor_by_name(info['output'])
+        self.max_sequence_length = info['max_sequence_length']
+        self.model_version = tuple(info['model_version']) if info['model_version'] is not None else None
+
+        # Если фаза обучения keras сохранилась в графе как placeholder без значения по умолчанию, то она передаётся явно
+        self.feed_dict = {}
+        for operation in self.graph.get_operations():
+            if operation.name.endswith('keras_learning_phase') and operation.type == 'Placeholder':
+                self.feed_dict[operation.outputs[0]] = False
+
+
+    def predict(self, x, batch_size=32):
+        ''' Получение ответов сети.
+        1. x - array из входов сети размерностью (number_examples, max_sequence_length, size)
+        2. batch_size - количество входов, обрабатываемых за один проход
+        3. возвращает array из ответов сети размерностью (number_examples, max_sequence_length, size) '''
+
+        results = []
+        for i in range(0, len(x), batch_size):
+            feed_dict = {self.input: x[i:i+batch_size]}
+            feed_dict.update(self.feed_dict)
+            results.append(self.session.run(self.output, feed_dict=feed_dict))
+        return np.concatenate(results)
+
+
+def export_frozen_model(model, f_name_frozen_model, max_sequence_length, model_version=None):
+    ''' Сохранение модели keras в виде замороженного графа: переменные заменяются константами, из графа удаляется всё, что не нужно для
+    вычисления выхода сети.
+    1. model - обученная модель keras (граф должен находиться в сессии keras по умолчанию)
+    2. f_name_frozen_model - имя выходного .pb файла
+    3. max_sequence_length - максимальная длина предложения (размер входа сети)
+    4. model_version - версия весов модели (TextToText.model_version), сохраняется для проверки таблицы и кэша ответов '''
+
+    from keras import backend as K
+
+    print('[i] Экспорт модели в %s...' % f_name_frozen_model)
+    session = K.get_session()
+    info = {'input': model.inputs[0].name, 'output': model.outputs[0].name, 'max_sequence_length': int(max_sequence_length),
+            'model_version': model_version}
+    graph_def = tf.graph_util.convert_variables_to_constants(session, session.graph.as_graph_def(), [model.outputs[0].op.name])
+
+    # Информация о модели добавляется в граф отдельной константой, что бы весь результат хранился в одном файле
+    with tf.Graph().as_default() as info_graph:
+        tf.constant(json.dumps(info), name=FROZEN_MODEL_INFO)
+    graph_def.node.extend(info_graph.as_graph_def().node)
+
+    with open(f_name_frozen_model, 'wb') as f_frozen_model:
+        f_frozen_model.write(graph_def.SerializeToString())
+    print('[i] Размер замороженного графа: %.2f Мб, %i операций' % (os.path.getsize(f_name_frozen_model) / 1024 / 1024, len(graph_def.node)))
+
+
+def get_frozen_model_info(f_name_frozen_model):
+    ''' Возвращает dict с информацией о модели, сохранённой в замороженном графе f_name_frozen_model (без создания сессии tensorflow). '''
+    graph_def = tf.GraphDef()
+    with open(f_name_frozen_model, 'rb') as f_frozen_model:
+        graph_def.ParseFromString(f_frozen_model.read())
+    for node in graph_def.node:
+        if node.name == FROZEN_MODEL_INFO:
+            return json.loads(node.attr['value'].tensor.string_val[0].decode())
+
+
+def is_frozen_model_current(f_name_frozen_model, f_name_model_weights):
+    ''' Возвращает True, если замороженный граф f_name_frozen_model есть и экспортирован из текущих весов f_name_model_weights (версия модели
+    в графе совпадает с (f_name_model_weights, время изменения f_name_model_weights)). Если файла весов нет, используется граф. Если граф
+    устарел (например, после обучения), выводится предупреждение и возвращается False - модель нужно загружать из .json и .h5 файлов. '''
+    if tf is None or not os.path.isfile(f_name_frozen_model):
+        return False
+    if not os.path.isfile(f_name_model_weights):
+        return True
+
+    info = get_frozen_model_info(f_name_frozen_model)
+    model_version = tuple(info['model_version']) if info is not None and info['model_version'] is not None else None
+    if model_version != (f_name_model_weights, os.path.getmtime(f_name_model_weights)):
+        print('[W] Замороженный граф %s экспортирован не из текущих весов %s и не будет использоваться (экспортируйте модель заново с ' \
+              'помощью TextToText.export_frozen_model())' % (f_name_frozen_model, f_name_model_weights))
+        return False
+    return True
+
+
+def get_f_name_frozen_model(f_name_model_weights):
+    ''' Возвращает имя .pb файла с замороженным графом для весов модели f_name_model_weights (например, для
+    data/plays_ru/model_weights_plays_ru.h5 - data/plays_ru/frozen_model_plays_ru.pb). '''
+    f_name_frozen_model = f_name_model_weights[:f_name_model_weights.rfind('/')+1] + \
+                          f_name_model_weights[f_name_model_weights.rfind('/')+1:].replace('model_weights_', 'frozen_model_')
+    return os.path.splitext(f_name_frozen_model)[0] + '.pb'
+
+
+def get_rss_mb():
+    ''' Возвращает объём оперативной памяти, занимаемый текущим процессом (VmRSS из /proc/self/status), в Мб. '''
+    with open('/proc/self/status', 'r') as f_status:
+        for line in f_status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def measure_startup(kwargs, result_queue):
+    ''' Создание TextToText с параметрами kwargs и передача в result_queue времени загрузки (без учёта импорта модулей) и занимаемой процессом
+    оперативной памяти до и после загрузки. Выполняется в отдельном процессе. '''
+    from text_to_text import TextToText
+    rss_before = get_rss_mb()
+    start_time = time.time()
+    ttt = TextToText(**kwargs)
+    ttt.predict('привет')
+    result_queue.put([time.time() - start_time, rss_before, get_rss_mb()])
+
+
+def compare_startup(f_name_model, f_name_model_weights, f_name_frozen_model):
+    ''' Сравнение времени загрузки и потребления оперативной памяти при загрузке модели из .json и .h5 и из замороженного графа (каждый
+    вариант запускается в отдельном процессе). '''
+
+    context = multiprocessing.get_context('spawn')
+    variants = [['.json + .h5', {'f_name_model': f_name_model, 'f_name_model_weights': f_name_model_weights}],
+                ['замороженный граф', {'f_name_frozen_model': f_name_frozen_model}]]
+    results = []
+    for name, kwargs in variants:
+        result_queue = context.Queue()
+        process = context.Process(target=measure_startup, args=(kwargs, result_queue))
+        process.start()
+        results.append([name] + result_queue.get())
+        process.join()
+
+    print('[i] Сравнение загрузки модели:')
+    for name, startup_time, rss_before, rss_after in results:
+        print('\t%s: загрузка %.2f с, память процесса %.2f Мб (модель и word2vec %.2f Мб)' % (name, startup_time, rss_after, rss_after - rss_before))
+    return results
+
+
+def main():
+    f_name_model = 'data/plays_ru/model_plays_ru.json'
+    f_name_model_weights = 'data/plays_ru/model_weights_plays_ru.h5'
+    f_name_frozen_model = get_f_name_frozen_model(f_name_model_weights)
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'compare':
+        compare_startup(f_name_model, f_name_model_weights, f_name_frozen_model)
+        return
+
+    from text_to_text import TextToText
+    ttt = TextToText(f_name_model=f_name_model, f_name_model_weights=f_name_model_weights)
+    ttt.export_frozen_model(f_name_frozen_model)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#       OS : GNU/Linux Ubuntu 16.04 or 18.04
+# LANGUAGE : Python 3.5.2 or later
+#   AUTHOR : Klim V. O.
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+'''
+Получение ответов обученной модели AttentionSeq2Seq средствами numpy: веса читаются из .h5 файла (сохранённого model.save_weights()),
+а прямой проход сети (двунаправленный LSTM кодер и декодер с вниманием из seq2seq.cells) повторяет вычисления keras. Для работы нужны
+только numpy и h5py, поэтому получение ответов возможно без tensorflow, keras, seq2seq и recurrentshop.
+
+Результат совпадает с keras с точностью до TOLERANCE. Проверка выполняется с помощью compare_with_keras() на сохранённой модели, её результат
+записывается в .json файл рядом с весами (get_f_name_numpy_check()) и проверяется перед запуском нескольких процессов-обработчиков в
+rest_server.py (is_numpy_check_passed()).
+'''
+
+import os
+import re
+import json
+import time
+import numpy as np
+import h5py
+
+
+# Максимальное допустимое отклонение выхода сети от результата keras (выход сети лежит в диапазоне [-1, 1])
+TOLERANCE = 1e-4
+
+
+class NumpySeq2Seq:
+    ''' Предназначен для получения ответов обученной модели AttentionSeq2Seq без tensorflow. Поддерживает тот же predict(), что и модель keras.
+    Используются функции активации по умолчанию из recurrentshop и seq2seq (tanh и hard_sigmoid).
+    1. f_name_model - имя .json файла с моделью сети (из него берутся длины входной и выходной последовательностей)
+    2. f_name_model_weights - имя .h5 файла с весами обученной модели (если None - веса нужно загрузить с помощью load_weights()) '''
+    def __init__(self, f_name_model, f_name_model_weights=None):
+        with open(f_name_model, 'r') as f_model:
+            layers = json.load(f_model)['config']['layers']
+        self.max_sequence_length = layers[0]['config']['batch_input_shape'][1]
+        self.output_length = self.max_sequence_length
+        for layer in layers:
+            if layer['config'].get('decode') and layer['config'].get('output_length') is not None:
+                self.output_length = layer['config']['output_length']
+
+        self.forward_cells = None
+        self.backward_cells = None
+        self.decoder_cells = None
+        if f_name_model_weights is not None:
+            self.load_weights(f_name_model_weights)
+
+
+    def load_weights(self, f_name_model_weights):
+        ''' Загрузка весов модели из .h5 файла f_name_model_weights. Веса каждой ячейки (LSTMCell, AttentionDecoderCell, LSTMDecoderCell)
+        хранятся как веса нескольких слоёв Dense, назначение которых определяется по порядку создания слоёв (по номеру в имени слоя,
+        например dense_12, подробнее в get_denses()). '''
+
+        layers_weights = []
+        with h5py.File(f_name_model_weights, 'r') as f_model_weights:
+            if 'model_weights' in f_model_weights:
+                f_model_weights = f_model_weights['model_weights']
+            for layer_name in f_model_weights.attrs['layer_names']:
+                layer_name = layer_name.decode() if isinstance(layer_name, bytes) else layer_name
+                weight_names = f_model_weights[layer_name].attrs['weight_names']
+                if len(weight_names) > 0:
+                    weights = []
+                    for weight_name in weight_names:
+                        weight_name = weight_name.decode() if isinstance(weight_name, bytes) else weight_name
+                        weights.append([weight_name, np.asarray(f_model_weights[layer_name][weight_name], dtype=np.float32)])
+                    layers_weights.append([layer_name, weights])
+
+        if len(layers_weights) != 2:
+            raise ValueError('%s не является файлом с весами модели AttentionSeq2Seq' % f_name_model_weights)
+        (encoder_name, encoder_weights), (decoder_name, decoder_weights) = layers_weights
+
+        # У двунаправленного кодера слои прямого прохода созданы раньше слоёв обратного
+        encoder_denses = get_denses(encoder_weights)
+        if encoder_name.startswith('bidirectional'):
+            half = len(encoder_denses) // 2
+            self.forward_cells = get_encoder_cells(encoder_denses[:half])
+            self.backward_cells = get_encoder_cells(encoder_denses[half:])
+        else:
+            self.forward_cells = get_encoder_cells(encoder_denses)
+            self.backward_cells = None
+
+        # Первая ячейка декодера - AttentionDecoderCell (4 слоя Dense), остальные - LSTMDecoderCell (по 3 слоя Dense)
+        decoder_denses = get_denses(decoder_weights)
+        if len(decoder_denses) < 4 or (len(decoder_denses) - 4) % 3 != 0:
+            raise ValueError('Неожиданное количество слоёв Dense в декодере: %i' % len(decoder_denses))
+        self.decoder_cells = [get_decoder_cell(decoder_denses[:4], ['W1', 'W2', 'W3', 'U'])]
+        for i in range(4, len(decoder_denses), 3):
+            self.decoder_cells.append(get_decoder_cell(decoder_denses[i:i+3], ['W1', 'W2', 'U']))
+
+
+    def predict(self, x, batch_size=32):
+        ''' Получение ответов сети.
+        1. x - array из входов сети размерностью (number_examples, max_sequence_length, size)
+        2. batch_size - количество входов, обрабатываемых за один проход
+        3. возвращает array из ответов сети размерностью (number_examples, output_length, size) '''
+
+        if self.decoder_cells is None:
+            raise ValueError('Веса модели не загружены')
+        x = np.asarray(x, dtype=np.float32)
+        results = []
+        for i in range(0, len(x), batch_size):
+            encoded = self.__encode(x[i:i+batch_size], self.forward_cells)
+            if self.backward_cells is not None:
+                encoded += self.__encode(x[i:i+batch_size, ::-1], self.backward_cells)[:, ::-1]
+            results.append(self.__decode(encoded))
+        return np.concatenate(results)
+
+
+    def __encode(self, x, cells):
+        ''' Проход многослойного LSTM кодера по последовательности x. Слои вычисляются по очереди для всей последовательности (результат тот же,
+        что и при пошаговом вычислении всех слоёв), поэтому входная часть каждого слоя считается одним умножением матриц.
+        1. x - array размерностью (batch_size, sequence_length, size)
+        2. cells - list из [kernel, bias, recurrent_kernel] для каждого слоя
+        3. возвращает array из выходов последнего слоя размерностью (batch_size, sequence_length, hidden_dim) '''
+
+        for kernel, bias, recurrent_kernel in cells:
+            hidden_dim = recurrent_kernel.shape[0]
+            z_x = np.dot(x, kernel) + bias
+            h = np.zeros((x.shape[0], hidden_dim), dtype=np.float32)
+            c = np.zeros((x.shape[0], hidden_dim), dtype=np.float32)
+            outputs = np.empty((x.shape[0], x.shape[1], hidden_dim), dtype=np.float32)
+            for t in range(x.shape[1]):
+                z = z_x[:, t] + np.dot(h, recurrent_kernel)
+                i = hard_sigmoid(z[:, :hidden_dim])
+                f = hard_sigmoid(z[:, hidden_dim:2*hidden_dim])
+                c = f * c + i * np.tanh(z[:, 2*hidden_dim:3*hidden_dim])
+                o = hard_sigmoid(z[:, 3*hidden_dim:])
+                h = o * np.tanh(c)
+                outputs[:, t] = h
+            x = outputs
+        return x
+
+
+    def __decode(self, encoded):
+        ''' Проход декодера: на каждом шаге AttentionDecoderCell получает всю закодированную последовательность, а каждая следующая
+        LSTMDecoderCell - выход предыдущей ячейки. Начальные состояния всех ячеек нулевые.
+        1. encoded - array размерностью (batch_size, sequence_length, hidden_dim) (выход кодера)
+        2. возвращает array размерностью (batch_size, output_length, output_dim) '''
+
+        batch_size, sequence_length, input_dim = encoded.shape
+        attention = self.decoder_cells[0]
+        # Часть оценки внимания, которая зависит только от выхода кодера, одинакова на всех шагах
+        scores_x = dense(encoded, [attention['W3'][0][:input_dim], attention['W3'][1]])[:, :, 0]
+        states = [ [np.zeros((batch_size, cell['U'][0].shape[0]), dtype=np.float32)] * 2 for cell in self.decoder_cells ]
+        outputs = np.empty((batch_size, self.output_length, self.decoder_cells[-1]['W2'][0].shape[1]), dtype=np.float32)
+
+        for t in range(self.output_length):
+            h, c = states[0]
+            scores = scores_x + np.dot(c, attention['W3'][0][input_dim:])
+            alpha = np.exp(scores - np.max(scores, axis=1, keepdims=True))
+            alpha /= np.sum(alpha, axis=1, keepdims=True)
+            y = np.einsum('bt,btd->bd', alpha, encoded)
+            # Как и в AttentionDecoderCell из seq2seq, входной и забывающий вентили вычисляются из одной части z
+            y, states[0] = lstm_decoder_step(y, h, c, attention, forget_slice=0)
+            for k in range(1, len(self.decoder_cells)):
+                y, states[k] = lstm_decoder_step(y, states[k][0], states[k][1], self.decoder_cells[k], forget_slice=1)
+            outputs[:, t] = y
+        return outputs
+
+
+def hard_sigmoid(x):
+    ''' hard_sigmoid из keras: 0.2*x + 0.5, ограниченное диапазоном [0, 1]. '''
+    return np.clip(0.2 * x + 0.5, 0.0, 1.0)
+
+
+def lstm_decoder_step(x, h, c, cell, forget_slice=1):
+    ''' Один шаг ячейки декодера (LSTMDecoderCell или AttentionDecoderCell после вычисления внимания).
+    1. x - вход ячейки размерностью (batch_size, input_dim)
+    2. h, c - состояния ячейки на предыдущем шаге
+    3. cell - dict с весами ячейки ('W1', 'W2', 'U', каждый - [kernel, bias])
+    4. forget_slice - номер части z, из которой вычисляется забывающий вентиль
+    5. возвращает выход ячейки и list из новых состояний [h, c] '''
+
+    hidden_dim = h.shape[1]
+    z = dense(x, cell['W1']) + dense(h, cell['U'])
+    i = hard_sigmoid(z[:, :hidden_dim])
+    f = hard_sigmoid(z[:, forget_slice*hidden_dim:(forget_slice+1)*hidden_dim])
+    c = f * c + i * np.tanh(z[:, 2*hidden_dim:3*hidden_dim])
+    o = hard_sigmoid(z[:, 3*hidden_dim:])
+    h = o * np.tanh(c)
+    y = np.tanh(dense(h, cell['W2']))
+    return y, [h, c]
+
+
+def dense(x, weights):
+    ''' Слой Dense без функции активации: x*kernel + bias (если смещение есть).
+    1. weights - [kernel, bias] (bias равен None, если слой без смещения) '''
+    if weights[1] is None:
+        return np.dot(x, weights[0])
+    return np.dot(x, weights[0]) + weights[1]
+
+
+def get_denses(weights):
+    ''' Разбиение весов слоя на веса слоёв Dense, из которых состоят ячейки. Имя каждого веса имеет вид .../dense_12/kernel:0 или
+    .../dense_12/bias:0, слои Dense упорядочиваются по номеру в имени, т.е. в порядке их создания в build_model() ячеек (порядок хранения
+    в .h5 файле зависит от порядка слоёв в графе ячейки и для этого не подходит).
+    1. weights - list из [имя, array] с весами
+    2. возвращает list из [kernel, bias] в порядке создания слоёв (bias равен None, если слой без смещения) '''
+
+    denses = {}
+    for weight_name, weight in weights:
+        match = re.search(r'(?:^|/)([^/]*?)_(\d+)/(kernel|bias)(?::\d+)?$', weight_name)
+        if match is None:
+            raise ValueError('Не удалось определить слой Dense по имени веса %s' % weight_name)
+        dense = denses.setdefault((match.group(1), int(match.group(2))), [None, None])
+        dense[0 if match.group(3) == 'kernel' else 1] = weight
+
+    result = []
+    for key in sorted(denses, key=lambda key: key[1]):
+        kernel, bias = denses[key]
+        if kernel is None or kernel.ndim != 2 or (bias is not None and bias.shape != (kernel.shape[1],)):
+            raise ValueError('Неожиданные веса слоя %s_%i' % key)
+        result.append([kernel, bias])
+    return result
+
+
+def get_encoder_cells(denses):
+    ''' Возвращает list из [kernel, bias, recurrent_kernel] для каждой LSTMCell кодера (в recurrentshop сначала создаётся kernel,
+    затем recurrent_kernel без смещения). '''
+    if len(denses) % 2 != 0:
+        raise ValueError('Неожиданное количество слоёв Dense в кодере: %i' % len(denses))
+    cells = []
+    for i in range(0, len(denses), 2):
+        kernel, recurrent_kernel = denses[i:i+2]
+        hidden_dim = recurrent_kernel[0].shape[0]
+        if kernel[0].shape[1] != 4 * hidden_dim or recurrent_kernel[0].shape[1] != 4 * hidden_dim:
+            raise ValueError('Неожиданная размерность весов LSTMCell кодера')
+        bias = kernel[1] if kernel[1] is not None else np.zeros(kernel[0].shape[1], dtype=np.float32)
+        if recurrent_kernel[1] is not None:
+            bias = bias + recurrent_kernel[1]
+        cells.append([kernel[0], bias, recurrent_kernel[0]])
+    return cells
+
+
+def get_decoder_cell(denses, names):
+    ''' Возвращает dict с весами ячейки декодера ([kernel, bias] для каждого слоя Dense): 'W1' - вход, 'W2' - выход ячейки, 'U' - рекуррентные
+    веса и, для AttentionDecoderCell, 'W3' - оценка внимания.
+    1. denses - list из [kernel, bias] в порядке создания слоёв
+    2. names - имена слоёв в порядке их создания в build_model() ячейки (['W1', 'W2', 'W3', 'U'] или ['W1', 'W2', 'U']) '''
+
+    cell = dict(zip(names, denses))
+    hidden_dim = cell['U'][0].shape[0]
+    if cell['U'][0].shape[1] != 4 * hidden_dim or cell['W1'][0].shape[1] != 4 * hidden_dim or cell['W2'][0].shape[0] != hidden_dim or \
+       ('W3' in cell and cell['W3'][0].shape[1] != 1):
+        raise ValueError('Неожиданная размерность весов ячейки декодера')
+    return cell
+
+
+def compare_with_keras(f_name_model, f_name_model_weights, number_examples=100, batch_size=32):
+    ''' Сравнение ответов NumpySeq2Seq с ответами модели keras на случайных входах (в диапазоне входа сети [0, 1]). Результат (допустимое и
+    полученное отклонение) записывается в .json файл get_f_name_numpy_check(f_name_model_weights).
+    1. f_name_model - имя .json файла с моделью сети
+    2. f_name_model_weights - имя .h5 файла с весами обученной модели
+    3. number_examples - количество входов
+    4. batch_size - количество входов, обрабатываемых за один проход
+    5. возвращает максимальное отклонение ответов NumpySeq2Seq от ответов keras '''
+
+    from text_to_text import load_keras_model, keras_version
+
+    start_time = time.time()
+    model = NumpySeq2Seq(f_name_model, f_name_model_weights)
+    print('[i] Загрузка NumpySeq2Seq: %.2f с' % (time.time() - start_time))
+    start_time = time.time()
+    keras_model = load_keras_model(f_name_model)
+    keras_model.load_weights(f_name_model_weights)
+    print('[i] Загрузка модели keras: %.2f с' % (time.time() - start_time))
+
+    x = np.random.rand(number_examples, model.max_sequence_length, model.forward_cells[0][0].shape[0]).astype(np.float32)
+    start_time = time.time()
+    y_numpy = model.predict(x, batch_size)
+    print('[i] NumpySeq2Seq: %.2f входов/с' % (number_examples / (time.time() - start_time)))
+    start_time = time.time()
+    y_keras = keras_model.predict(x, batch_size=batch_size)
+    print('[i] keras: %.2f входов/с' % (number_examples / (time.time() - start_time)))
+
+    max_difference = float(np.max(np.abs(y_numpy - y_keras)))
+    if max_difference <= TOLERANCE:
+        print('[i] Максимальное отклонение от keras: %.2e (допустимое %.0e)' % (max_difference, TOLERANCE))
+    else:
+        print('[E] Максимальное отклонение от keras: %.2e превышает допустимое %.0e' % (max_difference, TOLERANCE))
+
+    f_name_numpy_check = get_f_name_numpy_check(f_name_model_weights)
+    with open(f_name_numpy_check, 'w') as f_numpy_check:
+        json.dump({'f_name_model': f_name_model, 'f_name_model_weights': f_name_model_weights,
+                   'model_weights_mtime': os.path.getmtime(f_name_model_weights), 'keras_version': keras_version,
+                   'number_examples': number_examples, 'tolerance': TOLERANCE, 'max_difference': max_difference,
+                   'passed': max_difference <= TOLERANCE, 'date': time.strftime('%Y-%m-%d %H:%M:%S')}, f_numpy_check, indent=4)
+    print('[i] Результат сравнения сохранён в %s' % f_name_numpy_check)
+    return max_difference
+
+
+def get_f_name_numpy_check(f_name_model_weights):
+    ''' Возвращает имя .json файла с результатом compare_with_keras() для весов модели f_name_model_weights (например, для
+    data/plays_ru/model_weights_plays_ru.h5 - data/plays_ru/numpy_check_plays_ru.json). '''
+    f_name_numpy_check = f_name_model_weights[:f_name_model_weights.rfind('/')+1] + \
+                         f_name_model_weights[f_name_model_weights.rfind('/')+1:].replace('model_weights_', 'numpy_check_')
+    return os.path.splitext(f_name_numpy_check)[0] + '.json'
+
+
+def is_numpy_check_passed(f_name_model_weights):
+    ''' Возвращает True, если compare_with_keras() выполнялся для текущей версии весов f_name_model_weights и отклонение не превысило
+    TOLERANCE. '''
+    f_name_numpy_check = get_f_name_numpy_check(f_name_model_weights)
+    if not os.path.isfile(f_name_numpy_check) or not os.path.isfile(f_name_model_weights):
+        return False
+    with open(f_name_numpy_check, 'r') as f_numpy_check:
+        numpy_check = json.load(f_numpy_check)
+    return numpy_check.get('passed', False) and numpy_check.get('tolerance', 1.0) <= TOLERANCE and \
+           numpy_check.get('model_weights_mtime') == os.path.getmtime(f_name_model_weights)
+
+
+def main():
+    f_name_model = 'data/plays_ru/model_plays_ru.json'
+    f_name_model_weights = 'data/plays_ru/model_weights_plays_ru.h5'
+    compare_with_keras(f_name_model, f_name_model_weights)
+
+
+if __name__ == '__main__':
+    main()
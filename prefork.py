@@ -0,0 +1,154 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#       OS : GNU/Linux Ubuntu 16.04 or 18.04
+# LANGUAGE : Python 3.5.2 or later
+#   AUTHOR : Klim V. O.
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+'''
+Запуск нескольких процессов-обработчиков (pre-fork): модели загружаются один раз в главном процессе, после чего он создаёт дочерние процессы
+с помощью fork(). Дочерние процессы не копируют веса сети и матрицы word2vec, а разделяют их страницы памяти с главным процессом до первой
+записи (copy-on-write). Что бы сборщик мусора в дочерних процессах не записывал в заголовки загруженных объектов и не вызывал копирование
+страниц, перед fork() все объекты переводятся в постоянное поколение (gc.freeze(), Python 3.7 или новее).
+'''
+
+import os
+import sys
+import gc
+import time
+import signal
+import traceback
+
+
+class PreforkWorkers:
+    ''' Предназначен для запуска и перезапуска дочерних процессов-обработчиков. Перед start() в главном процессе не должно быть запущенных
+    потоков (после fork() в дочернем процессе остаётся только поток, вызвавший fork()).
+    1. number_workers - количество дочерних процессов
+    2. worker_function - функция, которая выполняется в каждом дочернем процессе, принимает номер процесса (от 0 до number_workers-1) '''
+    def __init__(self, number_workers, worker_function):
+        self.number_workers = number_workers
+        self.worker_function = worker_function
+        self.master_pid = os.getpid()
+        self.workers = {}
+        self.is_stopping = False
+
+
+    def start(self):
+        ''' Перевод объектов главного процесса в постоянное поколение сборщика мусора и создание дочерних процессов. '''
+        freeze_gc()
+        for worker_id in range(self.number_workers):
+            self.__fork(worker_id)
+
+
+    def wait(self, restart=True):
+        ''' Ожидание завершения всех дочерних процессов (вызывается в главном процессе).
+        1. restart - True: перезапускать процессы, которые завершились до вызова stop() '''
+        while len(self.workers) > 0:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                return
+            worker_id = self.workers.pop(pid, None)
+            if worker_id is None:
+                continue
+            if restart and not self.is_stopping:
+                print('[W] Процесс-обработчик %i (pid %i) завершился с кодом %i, перезапуск' % (worker_id, pid, get_exit_code(status)))
+                self.__fork(worker_id)
+
+
+    def stop(self, timeout=10):
+        ''' Завершение дочерних процессов: отправка SIGTERM и, если процесс не завершился за timeout секунд, SIGKILL. В дочерних процессах
+        ничего не делает. '''
+        if os.getpid() != self.master_pid:
+            return
+        self.is_stopping = True
+        for pid in list(self.workers):
+            kill(pid, signal.SIGTERM)
+
+        start_time = time.time()
+        while len(self.workers) > 0 and time.time() - start_time < timeout:
+            for pid in list(self.workers):
+                if wait_pid(pid):
+                    del self.workers[pid]
+            time.sleep(0.05)
+        for pid in list(self.workers):
+            kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            del self.workers[pid]
+
+
+    def get_memory(self):
+        ''' Возвращает list из [номер процесса, pid, RSS в Мб, PSS в Мб] для каждого дочернего процесса (подробнее в get_memory_mb()). '''
+        return [ [worker_id, pid] + get_memory_mb(pid) for pid, worker_id in sorted(self.workers.items(), key=lambda item: item[1]) ]
+
+
+    def __fork(self, worker_id):
+        ''' Создание дочернего процесса с номером worker_id. '''
+        pid = os.fork()
+        if pid != 0:
+            self.workers[pid] = worker_id
+            return
+
+        exit_code = 0
+        try:
+            self.worker_function(worker_id)
+        except SystemExit as error:
+            exit_code = error.code if isinstance(error.code, int) else 0
+        except BaseException:
+            traceback.print_exc()
+            exit_code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(exit_code)
+
+
+def freeze_gc():
+    ''' Сборка мусора и перевод всех оставшихся объектов в постоянное поколение, которое сборщик мусора больше не просматривает (в Python
+    старше 3.7 gc.freeze() нет, выполняется только сборка мусора). '''
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+
+def get_memory_mb(pid=None):
+    ''' Возвращает [RSS, PSS] процесса pid в Мб. PSS (proportional set size) учитывает разделяемые страницы пропорционально количеству
+    использующих их процессов, поэтому сумма PSS всех процессов равна реально занятой ими памяти (RSS учитывает разделяемые страницы в каждом
+    процессе полностью). PSS читается из /proc/pid/smaps_rollup (Linux 4.14 или новее) или /proc/pid/smaps.
+    1. pid - идентификатор процесса (None - текущий процесс) '''
+
+    f_name_proc = '/proc/%s/' % (pid if pid is not None else 'self')
+    f_name_smaps = f_name_proc + 'smaps_rollup' if os.path.isfile(f_name_proc + 'smaps_rollup') else f_name_proc + 'smaps'
+    rss = 0
+    pss = 0
+    with open(f_name_smaps, 'r') as f_smaps:
+        for line in f_smaps:
+            if line.startswith('Rss:'):
+                rss += int(line.split()[1])
+            elif line.startswith('Pss:'):
+                pss += int(line.split()[1])
+    return [rss / 1024, pss / 1024]
+
+
+def get_exit_code(status):
+    ''' Возвращает код завершения процесса по status из os.wait() (для процесса, завершённого сигналом - минус номер сигнала). '''
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def kill(pid, sig):
+    ''' Отправка сигнала sig процессу pid (если процесс уже завершился, ничего не делает). '''
+    try:
+        os.kill(pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+def wait_pid(pid):
+    ''' Возвращает True, если дочерний процесс pid завершился (без ожидания). '''
+    try:
+        return os.waitpid(pid, os.WNOHANG)[0] != 0
+    except ChildProcessError:
+        return True
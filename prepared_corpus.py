@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#       OS : GNU/Linux Ubuntu 16.04 or 18.04
+# LANGUAGE : Python 3.5.2 or later
+#   AUTHOR : Klim V. O.
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+'''
+Потоковое чтение предварительно обработанных пар [вопрос, ответ] из .pkl файлов. SourceToPrepared сохраняет пары частями (несколько
+вызовов pickle.dump() в одном файле), поэтому их можно читать по частям, не загружая весь файл в оперативную память. Файлы старого
+формата (один list из всех пар) тоже поддерживаются - они читаются как одна часть.
+'''
+
+import os
+import sys
+import pickle
+import curses
+from collections import Counter
+
+
+curses.setupterm()
+
+
+class PreparedCorpus:
+    ''' Перезапускаемый итератор по предложениям из .pkl файлов с предварительно обработанными парами [вопрос, ответ] (предложение - вопрос
+    и ответ, объединённые в один list из слов). Каждый вызов iter() заново читает файлы с начала, поэтому объект можно передавать в gensim для
+    нескольких проходов (построение словаря и эпохи обучения). В памяти одновременно находится только одна часть одного файла.
+    1. f_names_prepared - list из имён .pkl файлов (или имя одного файла) '''
+    def __init__(self, f_names_prepared):
+        if isinstance(f_names_prepared, str):
+            f_names_prepared = [f_names_prepared]
+        self.f_names_prepared = [ f_name for f_name in f_names_prepared if f_name is not None ]
+        self.number_sentences = None
+
+
+    def __iter__(self):
+        for f_name_prepared in self.f_names_prepared:
+            for question, answer in iter_prepared_pairs(f_name_prepared):
+                yield question + answer
+
+
+    def count_vocabulary(self):
+        ''' Подсчёт частоты слов за один проход по файлам (заодно запоминается количество предложений в number_sentences).
+        1. возвращает Counter вида {слово: количество повторений} '''
+
+        print('[i] Подсчёт размера полного словаря...')
+        vocabulary = Counter()
+        i = 0
+        for sentence in self:
+            if i % 10000 == 0:
+                os.write(sys.stdout.fileno(), curses.tigetstr('cuu1'))
+                print('[i] Подсчёт размера полного словаря... %i пар' % i)
+            vocabulary.update(sentence)
+            i += 1
+        os.write(sys.stdout.fileno(), curses.tigetstr('cuu1'))
+        print('[i] Подсчёт размера полного словаря... %i пар' % i)
+        self.number_sentences = i
+        return vocabulary
+
+
+def iter_prepared_pairs(f_name_prepared):
+    ''' Генератор пар [вопрос, ответ] из .pkl файла f_name_prepared (пары читаются частями, которые были сохранены отдельными вызовами
+    pickle.dump()). '''
+    with open(f_name_prepared, 'rb') as f_prepared:
+        while True:
+            try:
+                pairs = pickle.load(f_prepared)
+            except EOFError:
+                break
+            for pair in pairs:
+                yield pair
+
+
+def load_prepared_pairs(f_name_prepared, max_pairs=None):
+    ''' Загрузка пар [вопрос, ответ] из .pkl файла f_name_prepared в list.
+    1. f_name_prepared - имя .pkl файла с предварительно обработанными парами
+    2. max_pairs - если None: загрузить все пары, иначе - первые max_pairs пар (остальные части файла не читаются)
+    3. возвращает list из пар [вопрос, ответ] '''
+
+    pairs = []
+    for pair in iter_prepared_pairs(f_name_prepared):
+        if max_pairs is not None and len(pairs) >= max_pairs:
+            break
+        pairs.append(pair)
+    return pairs
+
+
+def write_prepared_pairs(pairs, f_name_prepared, chunk_size=10000, append=False):
+    ''' Запись пар [вопрос, ответ] в .pkl файл f_name_prepared частями по chunk_size пар (для последующего потокового чтения).
+    Если append=True, пары дописываются в конец существующего файла. '''
+    with open(f_name_prepared, 'ab' if append else 'wb') as f_prepared:
+        for i in range(0, len(pairs), chunk_size):
+            pickle.dump(pairs[i:i+chunk_size], f_prepared, protocol=pickle.HIGHEST_PROTOCOL)
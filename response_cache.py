@@ -0,0 +1,66 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#       OS : GNU/Linux Ubuntu 16.04 or 18.04
+# LANGUAGE : Python 3.5.2 or later
+#   AUTHOR : Klim V. O.
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+'''
+Кэш ответов сети с ограниченным размером (вытесняются давно не использованные ответы) и временем жизни записей.
+'''
+
+import time
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    ''' Предназначен для хранения ответов сети на уже заданные вопросы. Может использоваться из нескольких потоков одновременно.
+    1. max_size - максимальное количество хранимых ответов (при переполнении удаляется ответ, который дольше всех не запрашивался)
+    2. ttl - время жизни ответа в секундах (если None - не ограничено) '''
+    def __init__(self, max_size=10000, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.number_hits = 0
+        self.number_misses = 0
+        self.__items = OrderedDict()
+        self.__lock = threading.Lock()
+
+
+    def get(self, key):
+        ''' Возвращает сохранённый для key ответ или None, если его нет или истекло время его жизни. '''
+        with self.__lock:
+            item = self.__items.get(key)
+            if item is not None and self.ttl is not None and time.time() - item[1] > self.ttl:
+                del self.__items[key]
+                item = None
+            if item is None:
+                self.number_misses += 1
+                return
+            self.__items.move_to_end(key)
+            self.number_hits += 1
+            return item[0]
+
+
+    def put(self, key, value):
+        ''' Сохранение ответа value для key. '''
+        with self.__lock:
+            self.__items[key] = (value, time.time())
+            self.__items.move_to_end(key)
+            while len(self.__items) > self.max_size:
+                self.__items.popitem(last=False)
+
+
+    def clear(self):
+        ''' Удаление всех сохранённых ответов (например, после загрузки новых весов модели). '''
+        with self.__lock:
+            self.__items.clear()
+
+
+    def get_statistics(self):
+        ''' Возвращает dict с количеством сохранённых ответов, количеством попаданий и промахов и долей попаданий. '''
+        with self.__lock:
+            number_requests = self.number_hits + self.number_misses
+            return {'size': len(self.__items), 'number_hits': self.number_hits, 'number_misses': self.number_misses,
+                    'hit_ratio': self.number_hits / number_requests if number_requests > 0 else 0.0}
@@ -18,21 +18,31 @@ import base64
 import json
 import subprocess
 import socket
+import urllib.request
+import threading
 from logging.config import dictConfig
 from datetime import datetime
 from functools import wraps
 
 from flask import Flask, redirect, jsonify, abort, request, make_response, __version__ as flask_version
 from flask_httpauth import HTTPBasicAuth
-from gevent import __version__ as wsgi_version
+from gevent import __version__ as wsgi_version, get_hub, reinit
 from gevent.pywsgi import WSGIServer
 
-from tensorflow import get_default_graph
+try:
+    from tensorflow import get_default_graph
+except ImportError:
+    # Без tensorflow ответы сети получаются с помощью NumpySeq2Seq (model_backend = 'numpy')
+    get_default_graph = None
 
 from text_to_text import TextToText
 from text_to_speech import TextToSpeech
 from speech_to_text import SpeechToText
 from source_to_prepared import SourceToPrepared
+from frozen_model import get_rss_mb, is_frozen_model_current
+from batch_scheduler import load_test
+from prefork import PreforkWorkers, get_memory_mb
+from numpy_seq2seq import is_numpy_check_passed, get_f_name_numpy_check
 
 # Создание временной папки, если она была удалена
 if not os.path.exists('temp'):
@@ -98,7 +108,33 @@ f_name_plays = 'data/plays_ru/plays_ru.txt'
 f_name_w2v_model_plays = 'data/plays_ru/w2v_model_plays_ru.bin'
 f_name_model_plays = 'data/plays_ru/model_plays_ru.json'
 f_name_model_weights_plays = 'data/plays_ru/model_weights_plays_ru.h5'
+f_name_answer_table_plays = 'data/plays_ru/answer_table_plays_ru.json'
+f_name_frozen_model_plays = 'data/plays_ru/frozen_model_plays_ru.pb'
+# Способ получения ответов сети: 'keras' (или замороженный граф, если он есть) или 'numpy' (без tensorflow, подробнее в numpy_seq2seq.py)
+model_backend = 'keras'
+# Длины групп для получения ответов без лишних <PAD> (например, [8, 12, 16], подробнее в TextToText.enable_buckets()), None - без групп
+model_buckets = None
+# Декодирование ответов только по словам из ответов обучающей выборки f_name_training_sample_plays (подробнее в WordToVec.restrict_decoding())
+restrict_decoding = False
+f_name_training_sample_plays = 'data/plays_ru/prepared_plays_ru.pkl'
 f_name_audio = 'temp/synthesized_speech.wav'
+# Одновременные запросы к сети объединяются в пакеты до batch_max_size вопросов, ожидая следующий вопрос не дольше batch_max_delay_ms мс
+batch_max_size = 32
+batch_max_delay_ms = 5
+# Кэш ответов сети: до response_cache_max_size ответов, каждый хранится не дольше response_cache_ttl секунд
+response_cache_max_size = 10000
+response_cache_ttl = 3600
+# Статистика таблицы ответов и кэша ответов выводится в лог каждые response_cache_log_interval запросов к /chatbot/text-to-text
+response_cache_log_interval = 100
+# Количество процессов-обработчиков WSGI сервера: модели загружаются один раз и разделяются процессами через fork() (подробнее в prefork.py),
+# все процессы принимают соединения с одного сокета. Больше 1 процесса поддерживается только с model_backend = 'numpy' (сессия tensorflow
+# не может использоваться после fork()) и только после успешной проверки NumpySeq2Seq на текущих весах модели (python3 numpy_seq2seq.py,
+# подробнее в numpy_seq2seq.compare_with_keras())
+number_workers = 1
+# Прогрев моделей после начала приёма соединений (подробнее в warm_up()): вопросы, которые проходят через сеть, и .wav файл с речью для
+# распознавания (если None - распознаётся речь, синтезированная из первого вопроса)
+warmup_questions = ['Привет', 'Как дела?', 'Что ты умеешь?', 'Кто ты?', 'Расскажи что-нибудь о себе']
+f_name_warmup_speech = None
 
 
 def limit_content_length():
@@ -120,6 +156,19 @@ def limit_content_length():
     return decorator
 
 
+def require_ready():
+    ''' Декоратор для отклонения запросов к моделям до окончания их прогрева (код 503, подробнее в warm_up()). '''
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if not is_ready:
+                log('сервер ещё не готов к обработке запросов, выполняется прогрев моделей', request.remote_addr, 'error')
+                return make_response(jsonify({'error': 'The server is warming up, try again later.'}), 503)
+            return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
 def log(message, addr=None, level='info'):
     ''' Запись сообщения в лог файл с уровнем INFO или ERROR. По умолчанию используется INFO.
     1. addr - строка с адресом подключённого клиента
@@ -140,8 +189,12 @@ ttt = None
 stt = None
 tts = None
 http_server = None
+prefork_workers = None
+# Готовность сервера к обработке запросов (True после прогрева моделей, возвращается в /chatbot/ready)
+is_ready = False
+number_text_requests = 0
 # Получение графа вычислений tensorflow по умолчанию (для последующей передачи в другой поток)
-graph = get_default_graph()
+graph = get_default_graph() if get_default_graph is not None else None
 
 
 @app.errorhandler(404)
@@ -178,6 +231,15 @@ def root():
     return redirect('/chatbot/about')
 
 
+@app.route('/chatbot/ready', methods=['GET'])
+def ready():
+    ''' Возвращает готовность сервера к обработке запросов (для балансировщика нагрузки): код 200 после прогрева моделей, иначе 503. Не
+    требует авторизации. '''
+    if not is_ready:
+        return make_response(jsonify({'ready': False}), 503)
+    return jsonify({'ready': True})
+
+
 @app.route('/chatbot/about', methods=['GET'])
 @auth.login_required
 def about():
@@ -198,6 +260,7 @@ def questions():
 
 @app.route('/chatbot/speech-to-text', methods=['POST'])
 @auth.login_required
+@require_ready()
 @limit_content_length()
 def speech_to_text():
     ''' Принимает .wav/.opus файл с записанной речью, распознаёт её с помощью PocketSphinx и возвращает распознанную строку. '''    
@@ -211,12 +274,13 @@ def speech_to_text():
             log('json в теле запроса имеет неправильную структуру', request.remote_addr, 'error')
             return make_response(jsonify({'error': 'Json in the request body has an invalid structure.'}), 415)
     audio = base64.b64decode(audio)
-    with open('temp/speech.' + audio_format, 'wb') as audiofile:
+    f_name_speech = get_f_name_temp('temp/speech.' + audio_format)
+    with open(f_name_speech, 'wb') as audiofile:
         audiofile.write(audio)
-    log('принят .{} размером {:.2f} кБ, сохранено в temp/speech.{}'.format(audio_format, len(audio)/1024, audio_format), request.remote_addr)  
+    log('принят .{} размером {:.2f} кБ, сохранено в {}'.format(audio_format, len(audio)/1024, f_name_speech), request.remote_addr)  
 
-    question = stt.get('temp/speech.' + audio_format) # Первый раз распознаёт не очень, т.к. параллельно подстраиваются фильтры и т.д
-    question = stt.get('temp/speech.' + audio_format) # Когда второй раз одну и ту же фразу - распознавание куда лучше
+    # Фильтры декодера подстроены при прогреве (подробнее в warm_up()), поэтому повторное распознавание той же фразы не нужно
+    question = stt.get(f_name_speech)
 
     if question == 'error':
         log('json в теле запроса содержит некорректные данные', request.remote_addr, 'error')
@@ -227,6 +291,7 @@ def speech_to_text():
 
 @app.route('/chatbot/text-to-speech', methods=['POST'])
 @auth.login_required
+@require_ready()
 @limit_content_length()
 def text_to_speech():
     ''' Принимает строку, синтезирует речь с помощью RHVoice и возвращает .wav файл с синтезированной речью. '''    
@@ -237,17 +302,19 @@ def text_to_speech():
         return make_response(jsonify({'error': 'Json in the request body has an invalid structure.'}), 415)
     log("принято: '" + data + "'", request.remote_addr)
 
-    tts.get(data, f_name_audio)
+    f_name_synthesized_audio = get_f_name_temp(f_name_audio)
+    tts.get(data, f_name_synthesized_audio)
 
-    with open(f_name_audio, 'rb') as audiofile:
+    with open(f_name_synthesized_audio, 'rb') as audiofile:
         audio = audiofile.read()    
-    log('создан .wav размером {:.2f} кБ, сохранено в {}'.format(len(audio)/1024, f_name_audio), request.remote_addr)
+    log('создан .wav размером {:.2f} кБ, сохранено в {}'.format(len(audio)/1024, f_name_synthesized_audio), request.remote_addr)
     audio = base64.b64encode(audio)
     return jsonify({'wav':audio.decode()})
 
 
 @app.route('/chatbot/text-to-text', methods=['POST'])
 @auth.login_required
+@require_ready()
 @limit_content_length()
 def text_to_text():
     ''' Принимает строку с вопросом к боту и возвращает ответ в виде строки. '''
@@ -258,18 +325,51 @@ def text_to_text():
         return make_response(jsonify({'error': 'Json in the request body has an invalid structure.'}), 415)
     log("принято: '" + data + "'", request.remote_addr)
 
-    with graph.as_default():
-        answer = ttt.predict(data)
+    answer = run_in_thread(ttt.predict, data)
 
     log("ответ: '" + answer + "'", request.remote_addr)
+    # Количество обращений к кэшу не подходит: на вопросы из таблицы ответов кэш не проверяется
+    global number_text_requests
+    number_text_requests += 1
+    if number_text_requests % response_cache_log_interval == 0:
+        if ttt.answer_table is not None:
+            statistics = ttt.answer_table.get_statistics()
+            log('таблица ответов: {} вопросов, доля попаданий {:.2f}'.format(statistics['size'], statistics['hit_ratio']))
+        if ttt.response_cache is not None:
+            statistics = ttt.response_cache.get_statistics()
+            log('кэш ответов: {} записей, доля попаданий {:.2f}'.format(statistics['size'], statistics['hit_ratio']))
     return jsonify({'text':answer})
 
-# Всего 5 запросов:
+def run_in_thread(function, *args):
+    ''' Выполнение function(*args) в отдельном потоке из пула потоков gevent (при запуске WSGI сервера), что бы ожидание результата не
+    блокировало обработку других запросов и одновременные вопросы к сети могли объединяться в пакеты. '''
+    if http_server is not None:
+        return get_hub().threadpool.apply(run_in_graph, (function,) + args)
+    return run_in_graph(function, *args)
+
+
+def run_in_graph(function, *args):
+    ''' Выполнение function(*args) с графом вычислений tensorflow по умолчанию (при выполнении не в главном потоке). '''
+    if graph is None:
+        return function(*args)
+    with graph.as_default():
+        return function(*args)
+
+
+def get_f_name_temp(f_name):
+    ''' Возвращает имя временного файла f_name для текущего процесса: при работе нескольких процессов-обработчиков к имени добавляется pid,
+    что бы процессы не перезаписывали файлы друг друга. '''
+    if prefork_workers is None:
+        return f_name
+    return os.path.splitext(f_name)[0] + '_' + str(os.getpid()) + os.path.splitext(f_name)[1]
+
+# Всего 6 запросов:
 # 1. GET-запрос на /chatbot/about, вернёт инфу о проекте
 # 2. GET-запрос на /chatbot/questions, вернёт список всех вопросов
 # 3. POST-запрос на /chatbot/speech-to-text, принимает .wav/.opus-файл и возвращает распознанную строку
 # 4. POST-запрос на /chatbot/text-to-speech, принимает строку и возвращает .wav-файл с синтезированной речью
 # 5. POST-запрос на /chatbot/text-to-text, принимает строку и возвращает ответ бота в виде строки
+# 6. GET-запрос на /chatbot/ready, вернёт готовность сервера к обработке запросов (без авторизации)
 
 def run(host, port, wsgi=False, https_mode=False):
     ''' Автовыбор доступного порта (если указан порт 0), загрузка языковой модели и нейронной сети и запуск сервера.
@@ -297,20 +397,20 @@ def run(host, port, wsgi=False, https_mode=False):
     log('Flask v.' + flask_version + ', WSGIServer v.' + wsgi_version)
     log('установлен максимальный размер принимаемых данных: {:.2f} Кб'.format(max_content_length/1024))
     
-    name_dataset = f_name_w2v_model_plays[f_name_w2v_model_plays.rfind('w2v_model_')+len('w2v_model_'):f_name_w2v_model_plays.rfind('.bin')]
-    log('загрузка обученной на наборе данных ' + name_dataset + ' модели seq2seq...')
-    global ttt
-    print()
-    ttt = TextToText(f_name_w2v_model=f_name_w2v_model_plays, f_name_model=f_name_model_plays, f_name_model_weights=f_name_model_weights_plays)
-    print()
+    load_models()
+
+    if wsgi and number_workers > 1:
+        if model_backend != 'numpy':
+            log("несколько процессов-обработчиков поддерживаются только с model_backend = 'numpy', будет запущен 1 процесс", level='error')
+        elif not is_numpy_check_passed(f_name_model_weights_plays):
+            log('NumpySeq2Seq не проверен на текущих весах модели (нет успешного результата в ' + get_f_name_numpy_check(f_name_model_weights_plays) +
+                ', выполните python3 numpy_seq2seq.py), будет запущен 1 процесс', level='error')
+        else:
+            run_workers(host, port, number_workers, https_mode)
+            return
 
-    log('загрузка языковой модели для распознавания речи...')
-    global stt
-    stt = SpeechToText('from_file', name_dataset)
-
-    log('загрузка синтезатора речи...')
-    global tts
-    tts = TextToSpeech('anna')
+    ttt.start_batch_scheduler(batch_max_size, batch_max_delay_ms)
+    log('запросы к сети объединяются в пакеты до {} вопросов (ожидание до {} мс)'.format(batch_max_size, batch_max_delay_ms))
 
     if wsgi:
         global http_server
@@ -319,16 +419,18 @@ def run(host, port, wsgi=False, https_mode=False):
         else:
             log('WSGI сервер запущен на http://' + host + ':' + str(port) + ' (нажмите Ctrl+C или Ctrl+Z для выхода)')
         try:
-            if https_mode:
-                http_server = WSGIServer((host, port), app, log=app.logger, error_log=app.logger, keyfile='temp/key.pem', certfile='temp/cert.pem')
-            else:
-                http_server = WSGIServer((host, port), app, log=app.logger, error_log=app.logger)
+            http_server = create_http_server((host, port), https_mode)
+            get_hub().threadpool.maxsize = batch_max_size
+            http_server.start()
+            # Прогрев в потоке из пула потоков gevent, что бы сервер отвечал на запросы (/chatbot/ready возвращает 503) до его окончания
+            get_hub().threadpool.spawn(run_warm_up)
             http_server.serve_forever()
         except OSError:
             print()
             log('адрес ' + host + ':' + str(port) + ' недоступен', level='error')
     else:
         log('запуск тестового Flask сервера...')
+        threading.Thread(target=run_warm_up, daemon=True).start()
         try:
             if https_mode:
                 app.run(host=host, port=port, ssl_context=('temp/cert.pem', 'temp/key.pem'), threaded=True, debug=False)
@@ -339,6 +441,181 @@ def run(host, port, wsgi=False, https_mode=False):
             log('адрес ' + host + ':' + str(port) + ' недоступен', level='error')
 
 
+def load_models():
+    ''' Загрузка нейронной сети, языковой модели для распознавания речи и синтезатора речи. Потоки (объединение запросов в пакеты) не
+    запускаются, что бы после загрузки можно было создать процессы-обработчики. '''
+
+    name_dataset = f_name_w2v_model_plays[f_name_w2v_model_plays.rfind('w2v_model_')+len('w2v_model_'):f_name_w2v_model_plays.rfind('.bin')]
+    log('загрузка обученной на наборе данных ' + name_dataset + ' модели seq2seq...')
+    global ttt
+    print()
+    start_time = datetime.now()
+    if model_backend == 'keras' and is_frozen_model_current(f_name_frozen_model_plays, f_name_model_weights_plays):
+        ttt = TextToText(f_name_w2v_model=f_name_w2v_model_plays, f_name_frozen_model=f_name_frozen_model_plays)
+    else:
+        ttt = TextToText(f_name_w2v_model=f_name_w2v_model_plays, f_name_model=f_name_model_plays, f_name_model_weights=f_name_model_weights_plays,
+                         backend=model_backend)
+    if model_buckets is not None:
+        ttt.enable_buckets(model_buckets)
+    if restrict_decoding:
+        ttt.w2v.restrict_decoding(f_name_training_sample_plays)
+    ttt.enable_response_cache(response_cache_max_size, response_cache_ttl)
+    if os.path.isfile(f_name_answer_table_plays):
+        ttt.load_answer_table(f_name_answer_table_plays)
+    print()
+    log('модель загружена за {:.2f} с, занято оперативной памяти: {:.2f} Мб'.format((datetime.now() - start_time).total_seconds(), get_rss_mb()))
+
+    log('загрузка языковой модели для распознавания речи...')
+    global stt
+    stt = SpeechToText('from_file', name_dataset)
+
+    log('загрузка синтезатора речи...')
+    global tts
+    tts = TextToSpeech('anna')
+
+
+def warm_up():
+    ''' Прогрев моделей, что бы первые запросы обрабатывались так же быстро, как последующие: вопросы warmup_questions проходят через сеть
+    (подробнее в TextToText.warm_up()), первый из них синтезируется в речь, а речь распознаётся. Декодер PocketSphinx при первом распознавании
+    подстраивает фильтры, поэтому после прогрева каждый запрос распознаётся один раз. Если не удалось прогреть распознавание речи (например,
+    не установлен RHVoice), ошибка записывается в лог, а сервер всё равно сообщает о готовности (сеть прогрета). Выполняется после начала
+    приёма соединений (при одном процессе): до окончания прогрева /chatbot/ready и запросы к моделям возвращают 503. '''
+
+    global is_ready
+    if len(warmup_questions) > 0:
+        log('прогрев моделей...')
+        start_time = datetime.now()
+        log('прогрев сети: {} вопросов за {:.2f} с'.format(len(warmup_questions), ttt.warm_up(warmup_questions)))
+
+        f_name_speech = f_name_warmup_speech
+        try:
+            if f_name_speech is None:
+                f_name_speech = 'temp/warmup_speech.wav'
+                tts.get(warmup_questions[0], f_name_speech)
+            if not os.path.isfile(f_name_speech) or stt.get(f_name_speech) == 'error':
+                log('не удалось распознать речь из ' + str(f_name_speech) + ', первый запрос будет распознан хуже', level='error')
+        except Exception as error:
+            log('не удалось прогреть распознавание речи: ' + repr(error), level='error')
+        log('прогрев завершён за {:.2f} с'.format((datetime.now() - start_time).total_seconds()))
+    is_ready = True
+
+
+def run_warm_up():
+    ''' Прогрев моделей в отдельном потоке после начала приёма соединений (подробнее в warm_up()). Если не удалось прогреть сеть, ошибка
+    записывается в лог и сервер останавливается, а не остаётся навсегда неготовым (/chatbot/ready возвращал бы 503). '''
+    try:
+        run_in_graph(warm_up)
+    except Exception as error:
+        log('не удалось прогреть сеть, сервер будет остановлен: ' + repr(error), level='error')
+        os.kill(os.getpid(), signal.SIGTERM)
+
+
+def create_http_server(listener, https_mode=False):
+    ''' Создание WSGI сервера.
+    1. listener - (host, port) или сокет, который уже принимает соединения (общий для всех процессов-обработчиков)
+    2. https_mode - True: режим https (сертификат и ключ должны быть в temp/cert.pem и temp/key.pem) '''
+    if https_mode:
+        return WSGIServer(listener, app, log=app.logger, error_log=app.logger, keyfile='temp/key.pem', certfile='temp/cert.pem')
+    return WSGIServer(listener, app, log=app.logger, error_log=app.logger)
+
+
+def create_listener(host, port, backlog=1024):
+    ''' Создание сокета, принимающего соединения на host:port (создаётся в главном процессе до fork(), после чего соединения с него
+    принимают все процессы-обработчики). '''
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(backlog)
+    listener.setblocking(False)
+    return listener
+
+
+def serve_worker(worker_id, listener, https_mode=False):
+    ''' Запуск WSGI сервера в процессе-обработчике worker_id (выполняется в дочернем процессе после fork()). '''
+    reinit()
+    ttt.start_batch_scheduler(batch_max_size, batch_max_delay_ms)
+    global http_server
+    http_server = create_http_server(listener, https_mode)
+    get_hub().threadpool.maxsize = batch_max_size
+    log('процесс-обработчик {} (pid {}) запущен, RSS {:.2f} Мб, PSS {:.2f} Мб'.format(worker_id, os.getpid(), *get_memory_mb()))
+    http_server.serve_forever()
+
+
+def run_workers(host, port, number_workers, https_mode=False):
+    ''' Запуск number_workers процессов-обработчиков, которые разделяют загруженные модели и принимают соединения с одного сокета на
+    host:port. Главный процесс перезапускает завершившиеся процессы до остановки сервера (подробнее в prefork.py). '''
+    try:
+        listener = create_listener(host, port)
+    except OSError:
+        log('адрес ' + host + ':' + str(port) + ' недоступен', level='error')
+        return
+    # Прогрев в главном процессе до fork(), что бы процессы-обработчики разделяли прогретые модели (соединения до его окончания ожидают
+    # в очереди сокета)
+    warm_up()
+
+    log('запросы к сети объединяются в пакеты до {} вопросов (ожидание до {} мс) в каждом процессе'.format(batch_max_size, batch_max_delay_ms))
+    log('WSGI сервер запущен на {}://{}:{} в {} процессах (нажмите Ctrl+C или Ctrl+Z для выхода)'.format('https' if https_mode else 'http',
+        host, port, number_workers))
+    global prefork_workers
+    prefork_workers = PreforkWorkers(number_workers, lambda worker_id: serve_worker(worker_id, listener, https_mode))
+    prefork_workers.start()
+    prefork_workers.wait()
+
+
+def measure_workers(host='127.0.0.1', port=0, numbers_workers=[1, 2, 4], number_threads=32, number_requests=1000):
+    ''' Измерение количества обработанных вопросов в секунду и памяти процессов-обработчиков при разном количестве процессов: для каждого
+    значения из numbers_workers запускаются процессы-обработчики, number_threads потоков главного процесса отправляют в сумме number_requests
+    вопросов на /chatbot/text-to-text, после чего измеряется RSS и PSS каждого процесса. Кэш и таблица ответов отключаются, что бы каждый
+    вопрос проходил через сеть.
+    1. возвращает list из [количество процессов, вопросов в секунду, list из [RSS, PSS] каждого процесса в Мб] '''
+
+    if model_backend != 'numpy':
+        log("несколько процессов-обработчиков поддерживаются только с model_backend = 'numpy'", level='error')
+        return
+    if not is_numpy_check_passed(f_name_model_weights_plays):
+        log('NumpySeq2Seq не проверен на текущих весах модели (нет успешного результата в ' + get_f_name_numpy_check(f_name_model_weights_plays) +
+            ', выполните python3 numpy_seq2seq.py)', level='error')
+        return
+    load_models()
+    warm_up()
+    ttt.response_cache = None
+    ttt.answer_table = None
+
+    listener = create_listener(host, port)
+    url = 'http://{}:{}/chatbot/text-to-text'.format(*listener.getsockname())
+    questions = ['Привет', 'Как дела?', 'Что ты умеешь?', 'Кто ты?']
+    global prefork_workers
+    results = []
+    for number_workers in numbers_workers:
+        prefork_workers = PreforkWorkers(number_workers, lambda worker_id: serve_worker(worker_id, listener))
+        prefork_workers.start()
+        try:
+            post_question(url, questions[0])
+            requests_per_second = load_test(lambda question: post_question(url, question), questions, number_threads, number_requests)
+            memory = [ [rss, pss] for worker_id, pid, rss, pss in prefork_workers.get_memory() ]
+        finally:
+            prefork_workers.stop()
+        results.append([number_workers, requests_per_second, memory])
+
+    master_rss, master_pss = get_memory_mb()
+    print()
+    log('главный процесс: RSS {:.2f} Мб, PSS {:.2f} Мб'.format(master_rss, master_pss))
+    for number_workers, requests_per_second, memory in results:
+        log('{} процессов: {:.2f} вопросов/с, RSS процесса {:.2f} Мб, PSS процесса {:.2f} Мб, всего занято (PSS) {:.2f} Мб'.format(number_workers,
+            requests_per_second, sum([ rss for rss, pss in memory ])/len(memory), sum([ pss for rss, pss in memory ])/len(memory),
+            master_pss + sum([ pss for rss, pss in memory ])))
+    prefork_workers = None
+    return results
+
+
+def post_question(url, question, timeout=60):
+    ''' Отправка вопроса question на url (POST-запрос на /chatbot/text-to-text) и возвращение ответа бота. '''
+    data = json.dumps({'text': question}).encode()
+    headers = {'Content-Type': 'application/json', 'Authorization': 'Basic ' + base64.b64encode(b'bot:test_bot').decode()}
+    with urllib.request.urlopen(urllib.request.Request(url, data=data, headers=headers), timeout=timeout) as response:
+        return json.loads(response.read().decode())['text']
+
+
 def get_address_on_local_network():
     ''' Определение адреса машины в локальной сети с помощью утилиты 'ifconfig' из пакета net-tools.
     1. возвращает строку с адресом или 127.0.0.1, если локальный адрес начинается не с 192.Х.Х.Х или 172.Х.Х.Х
@@ -449,6 +726,8 @@ def main():
             host = sys.argv[1][:sys.argv[1].find(':')]
             port = int(sys.argv[1][sys.argv[1].find(':') + 1:])
             run(host, port, wsgi=True)
+        elif sys.argv[1] == 'measure_workers': # измерение производительности и памяти при разном количестве процессов-обработчиков
+            measure_workers()
         elif sys.argv[1] == 'help':
             print('\nПоддерживаемые варианты работы:')
             print('\tбез аргументов - запуск WSGI сервера с автоопределением адреса машины в локальной сети и портом 5000')
@@ -460,7 +739,8 @@ def main():
             print('\t-s host:port - запуск WSGI сервера с поддержкой https на host:port')
             print('\t-s -d - запуск тестового Flask сервера с поддержкой https на 127.0.0.1:5000')
             print('\t-s -d host:port - запуск тестового Flask сервера с поддержкой https на host:port')
-            print('\t-s -d localaddr:port - запуск тестового Flask сервера с поддержкой https, автоопределением адреса машины в локальной сети и портом port\n')
+            print('\t-s -d localaddr:port - запуск тестового Flask сервера с поддержкой https, автоопределением адреса машины в локальной сети и портом port')
+            print('\tmeasure_workers - измерение количества вопросов в секунду и памяти при разном количестве процессов-обработчиков\n')
         else:
             print("\n[E] Неверный аргумент командной строки '" + sys.argv[1] + "'. Введите help для помощи.\n")
     else: # запуск WSGI сервера с автоопределением адреса машины в локальной сети и портом 5000
@@ -471,6 +751,8 @@ def main():
 def on_stop(*args):
     print()
     log('сервер остановлен')
+    if prefork_workers is not None:
+        prefork_workers.stop()
     if http_server != None:
         http_server.close()
     sys.exit(0)
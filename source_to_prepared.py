@@ -10,15 +10,19 @@
 Предварительная обработка исходных данных в формате "вопрос %% ответ" для обучения нейронной сети.
 '''
 
-import matplotlib.pyplot as plt
+try:
+    import matplotlib.pyplot as plt
+except ImportError:
+    # Без matplotlib гистограмма размеров предложений не строится
+    plt = None
 import numpy as np
 import re
-import pickle
 import sys
 
 import curses
 import os
 
+from prepared_corpus import write_prepared_pairs
 
 curses.setupterm()
 
@@ -38,6 +42,7 @@ class SourceToPrepared:
     Если объект класса используется только для преобразования предложений для работы с обученной сетью, то нужно задать max_sequence_length
     (максимальная длина последовательности (предложения) = размер входа сети). '''
     def __init__(self, max_sequence_length=None):
+        self.max_sequence_length = None
         if max_sequence_length is not None:
             print('[i] Установлена максимальная длина предложения %i слов(-а)' % max_sequence_length)
             self.max_sequence_length = max_sequence_length
@@ -46,7 +51,9 @@ class SourceToPrepared:
     def prepare_all(self, f_name_source_data, f_name_training_sample=None):
         ''' Осуществляет преобразование пар "вопрос %% ответ" в последовательности фиксированного размера.
         1. f_name_source_data - имя входного .txt файла с исходными данными
-        2. f_name_training_sample - имя выходного .pkl файла с предварительно обработанными парами [вопрос,ответ] (по умолчанию prepared_+f_name_source_data+.pkl) '''
+        2. f_name_training_sample - имя выходного .pkl файла с предварительно обработанными парами [вопрос,ответ] (по умолчанию prepared_+f_name_source_data+.pkl)
+        Если max_sequence_length был задан при создании объекта, то пары выравниваются по нему (а более длинные пары удаляются) - используется
+        для дополнения уже существующей обучающей выборки новыми данными. '''
         
         if f_name_training_sample is None:
             f_name_training_sample = f_name_source_data[:f_name_source_data.rfind('/')+1] + 'prepared_' + f_name_source_data[f_name_source_data.rfind('/')+1:]
@@ -61,7 +68,14 @@ class SourceToPrepared:
 
         # Количество слов в каждом вопросе и ответе в каждой паре [вопрос, ответ]
         number_words = np.asarray([[len(q), len(a)] for [q, a] in dataset])
-        self.max_sequence_length = number_words.max() + 2  # количество входов сети
+        if self.max_sequence_length is None:
+            self.max_sequence_length = number_words.max() + 2  # количество входов сети
+        else:
+            fits = number_words.max(axis=1) + 2 <= self.max_sequence_length
+            if not fits.all():
+                print('[W] Удалено пар, длиннее %i слов: %i' % (self.max_sequence_length - 2, len(dataset) - fits.sum()))
+                dataset = [ pair for pair, pair_fits in zip(dataset, fits) if pair_fits ]
+                number_words = number_words[fits]
 
         '''
         # Что бы посмотреть предложения, которые длиннее 25 слов
@@ -229,7 +243,8 @@ class SourceToPrepared:
 
     def prepare_question(self, question):
         ''' Предварительная обработка вопроса: удаление всего, что не является русскими буквами, разбиение на отдельные слова
-        и приведение полученной последовательности к необходимой длине (max_sequence_length).
+        и приведение полученной последовательности к необходимой длине (max_sequence_length). Из слишком длинного вопроса остаются только
+        первые max_sequence_length-1 слов.
         1. question - строка с вопросом
         2. возращает преобразованную строку
 
@@ -507,16 +522,17 @@ class SourceToPrepared:
 
 
     def __fill_cells_question(self, question):
-        ''' Выравнивание вопроса по размеру, заполняя пустые места словом <PAD>. Например: [..., '<PAD>', 'вопрос', '<GO>'] '''
+        ''' Выравнивание вопроса по размеру, заполняя пустые места словом <PAD>. Например: [..., '<PAD>', 'вопрос', '<GO>']. Слова вопроса
+        идут в обратном порядке, поэтому у слишком длинного вопроса удаляются слова в начале последовательности (т.е. в конце вопроса). '''
+        question = question[max(len(question) - self.max_sequence_length + 1, 0):]
         result = ['<PAD>'] * (self.max_sequence_length - len(question) - 1) + question + ['<GO>']
         return result
 
 
     def __dataset_write(self, dataset, f_name_training_sample):
-        ''' Запись полученного набора данных в .pkl файл. '''
+        ''' Запись полученного набора данных в .pkl файл (частями, для потокового чтения с помощью PreparedCorpus). '''
         print('[i] Сохранение результата в %s' % f_name_training_sample)
-        with open(f_name_training_sample, 'wb') as file:
-            pickle.dump(dataset, file)
+        write_prepared_pairs(dataset, f_name_training_sample)
 
 
     def __dataset_info(self, number_words, f_name_histogram=None):
@@ -530,7 +546,19 @@ class SourceToPrepared:
         print('\tминимальный: %i, %i' % (number_words.min(axis=0)[0], number_words.min(axis=0)[1])) # минимальная длинна
         print('\tмeдиана: %i, %i' % (np.median(number_words, axis=0).astype(int)[0], np.median(number_words, axis=0).astype(int)[1])) # медианная длинна
 
+        # Сколько <PAD> останется, если пары разбить на группы по длине (подробнее в TextToText.train())
+        sequence_lengths = number_words.max(axis=1) + 2
+        buckets = get_buckets(sequence_lengths)
+        bucket_lengths = assign_buckets(sequence_lengths, buckets)
+        number_tokens = number_words.sum() + 2 * len(number_words)
+        print('[i] Группы по длине (buckets): %s' % ', '.join([ '%i (%i пар)' % (length, np.sum(bucket_lengths == length)) for length in buckets ]))
+        print('\tдоля <PAD>: %.2f%% без групп, %.2f%% с группами' % ((1 - number_tokens / (2 * len(number_words) * self.max_sequence_length)) * 100,
+              (1 - number_tokens / (2 * bucket_lengths.sum())) * 100))
+
         # Гистограмма размеров предложений
+        if plt is None:
+            print('[W] matplotlib не установлен, гистограмма размеров предложений не построена')
+            return
         print('[i] Построение гистограммы размеров предложений...')
         plt.figure()
         plt.hist(x=number_words, label=['вопросы', 'ответы'])
@@ -541,6 +569,25 @@ class SourceToPrepared:
         plt.savefig(f_name_histogram, dpi=100)
 
 
+def get_buckets(sequence_lengths, number_buckets=4):
+    ''' Подбор длин групп (buckets), на которые разбиваются пары для обучения и получения ответов сети: длины равны квантилям sequence_lengths,
+    поэтому в каждую группу попадает примерно одинаковое количество пар.
+    1. sequence_lengths - array с длиной, необходимой каждой паре (наибольшее количество слов в вопросе и ответе + 2)
+    2. number_buckets - количество групп
+    3. возвращает отсортированный list из длин групп (последняя равна наибольшей из sequence_lengths) '''
+    quantiles = np.percentile(sequence_lengths, np.linspace(100.0 / number_buckets, 100.0, number_buckets))
+    return sorted(set([ int(np.ceil(quantile)) for quantile in quantiles ]))
+
+
+def assign_buckets(sequence_lengths, buckets):
+    ''' Возвращает array с длиной наименьшей группы из buckets, в которую помещается каждая длина из sequence_lengths. '''
+    buckets = np.asarray(sorted(buckets))
+    positions = np.searchsorted(buckets, sequence_lengths)
+    if np.any(positions >= len(buckets)):
+        raise ValueError('Длина последовательности больше наибольшей группы %i' % buckets[-1])
+    return buckets[positions]
+
+
 # Пиковое потребление оперативной памяти:
 # При обработке субтитров - 6.8Гб
 # При обработке диалогов - 250Мб
@@ -0,0 +1,43 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#       OS : GNU/Linux Ubuntu 16.04 or 18.04
+# LANGUAGE : Python 3.5.2 or later
+#   AUTHOR : Klim V. O.
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+'''
+Общие настройки тестов (запуск из корня проекта: python3 -m pytest -q).
+'''
+
+import os
+import sys
+import numpy as np
+import pytest
+
+
+# Модули проекта лежат в корне проекта и при импорте вызывают curses.setupterm(), которому нужен тип терминала
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+os.environ.setdefault('TERM', 'xterm')
+
+from word_to_vec import WordToVec, get_f_name_w2v_store
+
+
+WORDS = ['<PAD>', '<GO>', '<EOS>', 'привет', 'как', 'дела', 'кто', 'ты', 'что', 'умеешь']
+
+
+@pytest.fixture
+def w2v(tmp_path):
+    ''' Модель word2vec из небольшого словаря WORDS, сохранённая в формате save_w2v_store(). Вектора слов ортогональны и имеют разную
+    длину, поэтому ближайшее к вектору слова слово - всегда оно само. '''
+    vectors = np.linalg.qr(np.random.RandomState(0).randn(16, len(WORDS)))[0].T * np.linspace(0.5, 2.0, len(WORDS))[:, np.newaxis]
+    vectors = vectors.astype(np.float32)
+
+    f_name_w2v_model = str(tmp_path / 'w2v_model_test.bin')
+    f_name_w2v_store = get_f_name_w2v_store(f_name_w2v_model)
+    with open(f_name_w2v_store.replace('.npy', '_vocab.txt'), 'w') as f_w2v_vocab:
+        for word in WORDS:
+            print(word, file=f_w2v_vocab)
+    np.save(f_name_w2v_store.replace('.npy', '_norm.npy'), vectors / np.linalg.norm(vectors, axis=1, keepdims=True))
+    np.save(f_name_w2v_store, vectors)
+    return WordToVec(f_name_w2v_model)
@@ -0,0 +1,48 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#       OS : GNU/Linux Ubuntu 16.04 or 18.04
+# LANGUAGE : Python 3.5.2 or later
+#   AUTHOR : Klim V. O.
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+'''
+Тесты таблицы ответов (answer_table.py).
+'''
+
+import threading
+
+from answer_table import AnswerTable, get_answer_table_key
+
+
+def get_answer_table():
+    answer_table = AnswerTable()
+    answer_table.answers = {get_answer_table_key(['<PAD>', 'привет', '<GO>']): 'привет'}
+    return answer_table
+
+
+def test_get_ignores_pad():
+    answer_table = get_answer_table()
+    assert answer_table.get(['<PAD>', '<PAD>', 'привет', '<GO>']) == 'привет'
+    assert answer_table.get(['<PAD>', 'кто', 'ты', '<GO>']) is None
+    assert answer_table.get_statistics() == {'size': 1, 'number_hits': 1, 'number_misses': 1, 'hit_ratio': 0.5}
+
+
+def test_statistics_from_several_threads():
+    answer_table = get_answer_table()
+    number_threads = 8
+    number_requests = 5000
+
+    def send_requests():
+        for i in range(number_requests):
+            answer_table.get(['привет', '<GO>'] if i % 2 == 0 else ['кто', 'ты', '<GO>'])
+
+    threads = [ threading.Thread(target=send_requests) for i in range(number_threads) ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    statistics = answer_table.get_statistics()
+    assert statistics['number_hits'] == number_threads * number_requests // 2
+    assert statistics['number_misses'] == number_threads * number_requests // 2
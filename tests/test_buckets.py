@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#       OS : GNU/Linux Ubuntu 16.04 or 18.04
+# LANGUAGE : Python 3.5.2 or later
+#   AUTHOR : Klim V. O.
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+'''
+Тесты разбиения пар на группы по длине (buckets): длина, необходимая каждой паре (encoded_sample.get_sequence_lengths()), и выбор группы
+(source_to_prepared.get_buckets() и assign_buckets()).
+'''
+
+import numpy as np
+import pytest
+
+from encoded_sample import get_sequence_lengths
+from source_to_prepared import get_buckets, assign_buckets
+
+
+PAD_ID = 0
+SEQUENCE_LENGTH = 8
+
+
+def fill_question(number_words):
+    ''' Индексы вопроса из number_words слов, выровненного как в SourceToPrepared: [<PAD>, ..., слова, <GO>]. '''
+    return [PAD_ID] * (SEQUENCE_LENGTH - number_words - 1) + [2] * number_words + [1]
+
+
+def fill_answer(number_words):
+    ''' Индексы ответа из number_words слов, выровненного как в SourceToPrepared: [слова, <EOS>, <PAD>, ...]. '''
+    return [3] * number_words + [4] + [PAD_ID] * (SEQUENCE_LENGTH - number_words - 1)
+
+
+def test_get_sequence_lengths_words_plus_two():
+    number_words = np.array([[1, 1], [3, 5], [5, 3], [2, 6], [6, 6]])
+    questions_ids = np.array([ fill_question(number) for number in number_words[:, 0] ])
+    answers_ids = np.array([ fill_answer(number) for number in number_words[:, 1] ])
+    lengths = get_sequence_lengths(PAD_ID, questions_ids, answers_ids)
+    assert lengths.tolist() == (number_words.max(axis=1) + 2).tolist()
+
+
+def test_get_sequence_lengths_questions_only():
+    questions_ids = np.array([ fill_question(number) for number in [1, 4, 6] ])
+    assert get_sequence_lengths(PAD_ID, questions_ids).tolist() == [3, 6, 8]
+
+
+def test_get_sequence_lengths_full_length():
+    # Предложение без <PAD> (max_sequence_length-1 слов) занимает всю длину последовательности
+    questions_ids = np.array([fill_question(SEQUENCE_LENGTH - 1), fill_question(1)])
+    answers_ids = np.array([fill_answer(1), fill_answer(SEQUENCE_LENGTH - 1)])
+    assert get_sequence_lengths(PAD_ID, questions_ids, answers_ids).tolist() == [SEQUENCE_LENGTH, SEQUENCE_LENGTH]
+
+
+def test_assign_buckets_boundaries():
+    buckets = [8, 4, 6]
+    lengths = np.array([1, 3, 4, 5, 6, 7, 8])
+    assert assign_buckets(lengths, buckets).tolist() == [4, 4, 4, 6, 6, 8, 8]
+
+
+def test_assign_buckets_longer_than_largest():
+    with pytest.raises(ValueError):
+        assign_buckets(np.array([4, 9]), [4, 8])
+
+
+def test_get_buckets():
+    lengths = np.array([3, 3, 4, 4, 5, 5, 6, 8])
+    buckets = get_buckets(lengths, number_buckets=4)
+    assert buckets == sorted(set(buckets))
+    assert buckets[-1] == lengths.max()
+    assert assign_buckets(lengths, buckets).max() == lengths.max()
+    assert get_buckets(np.array([5, 5, 5]), number_buckets=4) == [5]
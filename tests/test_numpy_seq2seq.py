@@ -0,0 +1,59 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#       OS : GNU/Linux Ubuntu 16.04 or 18.04
+# LANGUAGE : Python 3.5.2 or later
+#   AUTHOR : Klim V. O.
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+'''
+Тесты совпадения ответов NumpySeq2Seq с моделью keras (numpy_seq2seq.py). Выполняются только если установлены keras, seq2seq, recurrentshop
+и h5py.
+'''
+
+import numpy as np
+import pytest
+
+pytest.importorskip('h5py')
+pytest.importorskip('keras')
+pytest.importorskip('recurrentshop')
+seq2seq_models = pytest.importorskip('seq2seq.models')
+
+from numpy_seq2seq import NumpySeq2Seq, TOLERANCE, compare_with_keras, is_numpy_check_passed
+
+
+VEC_SIZE = 6
+SEQUENCE_LENGTH = 5
+
+
+def save_model(tmp_path, depth, seed=0):
+    ''' Создание небольшой модели AttentionSeq2Seq (как в TextToText) со случайными весами и сохранение её в .json и .h5 файлы. Смещения
+    после инициализации нулевые, поэтому случайными делаются все веса - так проверяется и применение смещений. '''
+    model = seq2seq_models.AttentionSeq2Seq(input_dim=VEC_SIZE, hidden_dim=VEC_SIZE, input_length=SEQUENCE_LENGTH,
+                                            output_length=SEQUENCE_LENGTH, output_dim=VEC_SIZE, depth=depth, dropout=0.0)
+    random_state = np.random.RandomState(seed)
+    model.set_weights([ weight + random_state.normal(0.0, 0.3, weight.shape) for weight in model.get_weights() ])
+
+    f_name_model = str(tmp_path / 'model_test.json')
+    f_name_model_weights = str(tmp_path / 'model_weights_test.h5')
+    with open(f_name_model, 'w') as f_model:
+        f_model.write(model.to_json())
+    model.save_weights(f_name_model_weights)
+    return model, f_name_model, f_name_model_weights
+
+
+@pytest.mark.parametrize('depth', [1, 2])
+def test_predict_matches_keras(tmp_path, depth):
+    model, f_name_model, f_name_model_weights = save_model(tmp_path, depth)
+    x = np.random.RandomState(1).rand(8, SEQUENCE_LENGTH, VEC_SIZE).astype(np.float32)
+    y_keras = model.predict(x, batch_size=4)
+    y_numpy = NumpySeq2Seq(f_name_model, f_name_model_weights).predict(x, batch_size=4)
+    assert y_numpy.shape == y_keras.shape
+    assert np.max(np.abs(y_numpy - y_keras)) <= TOLERANCE
+
+
+def test_compare_with_keras_records_check(tmp_path):
+    model, f_name_model, f_name_model_weights = save_model(tmp_path, 2)
+    assert not is_numpy_check_passed(f_name_model_weights)
+    assert compare_with_keras(f_name_model, f_name_model_weights, number_examples=8, batch_size=4) <= TOLERANCE
+    assert is_numpy_check_passed(f_name_model_weights)
@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#       OS : GNU/Linux Ubuntu 16.04 or 18.04
+# LANGUAGE : Python 3.5.2 or later
+#   AUTHOR : Klim V. O.
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+'''
+Тесты кэша ответов сети (response_cache.py).
+'''
+
+import response_cache
+from response_cache import ResponseCache
+
+
+class Clock:
+    ''' Заменяет time.time() в response_cache.py, что бы проверять время жизни ответов без ожидания. '''
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+def get_key(question, model_version=('model_weights.h5', 1.0)):
+    ''' Ключ кэша в том же виде, что и в TextToText.predict_prepared(): (подготовленный вопрос, версия модели). '''
+    return (tuple(question.split()), model_version)
+
+
+def test_lru_eviction():
+    cache = ResponseCache(max_size=2, ttl=None)
+    cache.put(get_key('привет'), 'привет')
+    cache.put(get_key('как дела'), 'хорошо')
+    assert cache.get(get_key('привет')) == 'привет'
+
+    # Дольше всех не запрашивался ответ на 'как дела'
+    cache.put(get_key('кто ты'), 'бот')
+    assert cache.get(get_key('как дела')) is None
+    assert cache.get(get_key('привет')) == 'привет'
+    assert cache.get(get_key('кто ты')) == 'бот'
+    assert cache.get_statistics()['size'] == 2
+
+
+def test_ttl_expiry(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache.time, 'time', clock.time)
+    cache = ResponseCache(max_size=10, ttl=60)
+    cache.put(get_key('привет'), 'привет')
+
+    clock.now += 60
+    assert cache.get(get_key('привет')) == 'привет'
+    clock.now += 1
+    assert cache.get(get_key('привет')) is None
+    assert cache.get_statistics()['size'] == 0
+
+    # Повторное сохранение обновляет время жизни
+    cache.put(get_key('привет'), 'привет')
+    clock.now += 30
+    cache.put(get_key('привет'), 'привет')
+    clock.now += 45
+    assert cache.get(get_key('привет')) == 'привет'
+
+
+def test_model_version_invalidation():
+    cache = ResponseCache(max_size=10, ttl=None)
+    cache.put(get_key('привет', ('model_weights.h5', 1.0)), 'привет')
+    assert cache.get(get_key('привет', ('model_weights.h5', 2.0))) is None
+    assert cache.get(get_key('привет', ('model_weights.h5', 1.0))) == 'привет'
+
+    # После загрузки новых весов TextToText.load_model_weights() очищает кэш
+    cache.clear()
+    assert cache.get(get_key('привет', ('model_weights.h5', 1.0))) is None
+    assert cache.get_statistics()['size'] == 0
+
+
+def test_statistics():
+    cache = ResponseCache(max_size=10, ttl=None)
+    assert cache.get_statistics() == {'size': 0, 'number_hits': 0, 'number_misses': 0, 'hit_ratio': 0.0}
+    cache.put(get_key('привет'), 'привет')
+    cache.get(get_key('привет'))
+    cache.get(get_key('кто ты'))
+    assert cache.get_statistics() == {'size': 1, 'number_hits': 1, 'number_misses': 1, 'hit_ratio': 0.5}
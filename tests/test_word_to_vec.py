@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#       OS : GNU/Linux Ubuntu 16.04 or 18.04
+# LANGUAGE : Python 3.5.2 or later
+#   AUTHOR : Klim V. O.
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+'''
+Тесты кодирования последовательностей в индексы и вектора и декодирования векторов в слова (word_to_vec.py).
+'''
+
+import numpy as np
+import pytest
+
+
+def get_ids(w2v, words):
+    return [ w2v.word_index[word] for word in words ]
+
+
+def test_sentences2ids_question_pad_at_start(w2v):
+    question = ['<PAD>', 'дела', 'неизвестное', 'как', '<GO>']
+    ids, lost_words = w2v.sentences2ids([question], return_lost_words=True)
+    assert ids.tolist() == [get_ids(w2v, ['<PAD>', '<PAD>', 'дела', 'как', '<GO>'])]
+    assert lost_words == ['неизвестное']
+
+
+def test_sentences2ids_answer_pad_before_last_word(w2v):
+    answer = ['<GO>', 'привет', 'неизвестное', '<EOS>', '<PAD>']
+    ids, lost_words = w2v.sentences2ids([answer], is_answers=True, return_lost_words=True)
+    assert ids.tolist() == [get_ids(w2v, ['<GO>', '<PAD>', 'привет', '<EOS>', '<PAD>'])]
+    assert lost_words == ['неизвестное']
+
+
+def test_sentences2ids_without_lost_words(w2v):
+    sentences = [['<PAD>', 'кто', 'ты', '<GO>'], ['как', 'дела', 'что', '<GO>']]
+    assert w2v.sentences2ids(sentences).tolist() == [ get_ids(w2v, sentence) for sentence in sentences ]
+
+
+def test_sentences2ids_fits_sequence_length(w2v):
+    questions = [['кто', 'ты', 'что', 'умеешь', '<GO>'], ['ты', '<GO>']]
+    ids = w2v.sentences2ids(questions, sequence_length=3)
+    assert ids.tolist() == [get_ids(w2v, ['что', 'умеешь', '<GO>']), get_ids(w2v, ['<PAD>', 'ты', '<GO>'])]
+
+    answers = [['<GO>', 'привет', '<EOS>'], ['<GO>', '<EOS>']]
+    ids = w2v.sentences2ids(answers, is_answers=True)
+    assert ids.tolist() == [get_ids(w2v, ['<GO>', 'привет', '<EOS>']), get_ids(w2v, ['<GO>', '<EOS>', '<PAD>'])]
+
+
+@pytest.mark.parametrize('quantization', [None, 'float16', 'int8'])
+def test_ids2vec_vec2ids_round_trip(w2v, quantization):
+    if quantization is not None:
+        w2v.quantize(quantization)
+    ids = np.arange(len(w2v.index2word)).reshape(2, -1)
+    vectors = w2v.ids2vec(ids)
+    assert vectors.shape == ids.shape + (w2v.vectors.shape[1],)
+    assert vectors.dtype == np.float32
+    assert np.array_equal(w2v.vec2ids(vectors), ids)
+    assert np.array_equal(w2v.vec2ids(vectors, max_scores_size=1), ids)
+
+
+def test_vec2word_word2vec_round_trip(w2v):
+    sentence = ['<PAD>', 'кто', 'ты', '<GO>']
+    assert w2v.vec2word(w2v.word2vec(sentence)) == sentence
+
+
+def test_vec2ids_to_eos_stops_at_first_eos(w2v):
+    answer = w2v.ids2vec(get_ids(w2v, ['привет', 'как', '<EOS>', 'дела', 'ты', '<EOS>', 'кто', 'что']))
+    ids = w2v.vec2ids_to_eos(answer)
+    assert ids.tolist() == get_ids(w2v, ['привет', 'как', '<EOS>', '<PAD>', '<PAD>', '<PAD>', '<PAD>', '<PAD>'])
+    assert w2v.vec2word(answer, stop_at_eos=True)[:3] == ['привет', 'как', '<EOS>']
+
+
+def test_vec2ids_to_eos_after_false_eos_candidate(w2v):
+    # Вектор близок к <EOS> (косинусная близость больше eos_threshold), но ближайшее слово - 'дела'
+    eos_vector = w2v.ids2vec(w2v.word_index['<EOS>'])
+    word_vector = w2v.ids2vec(w2v.word_index['дела'])
+    false_eos = eos_vector / np.linalg.norm(eos_vector) + 1.5 * word_vector / np.linalg.norm(word_vector)
+    answer = w2v.ids2vec(get_ids(w2v, ['привет', 'дела', 'как', 'кто', 'ты', '<EOS>', 'что', 'умеешь']))
+    answer[1] = false_eos
+
+    ids = w2v.vec2ids_to_eos(answer, segment_size=2)
+    assert ids.tolist() == get_ids(w2v, ['привет', 'дела', 'как', 'кто', 'ты', '<EOS>', '<PAD>', '<PAD>'])
+
+
+def test_vec2ids_to_eos_matches_vec2ids(w2v):
+    answers = w2v.ids2vec(np.array([get_ids(w2v, ['кто', 'ты', 'что', 'умеешь']), get_ids(w2v, ['как', '<EOS>', 'дела', 'привет'])]))
+    full_ids = w2v.vec2ids(answers)
+    ids = w2v.vec2ids_to_eos(answers)
+    assert ids.shape == full_ids.shape
+    # Ответ без <EOS> декодируется полностью, в ответе с <EOS> совпадают позиции до <EOS> включительно
+    assert ids[0].tolist() == full_ids[0].tolist()
+    assert ids[1, :2].tolist() == full_ids[1, :2].tolist()
+    assert ids[1, 2:].tolist() == [w2v.word_index['<PAD>']] * 2
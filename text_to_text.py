@@ -18,18 +18,39 @@ import sys
 import time
 import curses
 import json
+import copy
 import numpy as np
-from keras import __version__ as keras_version
-from keras.models import model_from_json
-from seq2seq.models import AttentionSeq2Seq
-from seq2seq.cells import LSTMDecoderCell, AttentionDecoderCell
-from recurrentshop import RecurrentSequential
-from recurrentshop.engine import _OptionalInputPlaceHolder
-
-from source_to_prepared import SourceToPrepared
+from collections import OrderedDict
+try:
+    from keras import __version__ as keras_version
+    from keras.models import model_from_json
+    from seq2seq.models import AttentionSeq2Seq
+    from seq2seq.cells import LSTMDecoderCell, AttentionDecoderCell
+    from recurrentshop import RecurrentSequential
+    from recurrentshop.engine import _OptionalInputPlaceHolder
+    from tensorflow import get_default_graph
+except ImportError:
+    # Без tensorflow, keras, seq2seq и recurrentshop доступно только получение ответов сети с помощью backend='numpy'
+    keras_version = None
+
+from source_to_prepared import SourceToPrepared, get_buckets, assign_buckets
 from word_to_vec import WordToVec
-
-import matplotlib.pyplot as plt
+from ann_index import AnnIndex, ann_benchmark
+from encoded_sample import EncodedSample, EncodedSampleSequence, is_enc_training_sample, get_sequence_lengths
+from prepared_corpus import load_prepared_pairs
+from batch_scheduler import BatchScheduler
+from response_cache import ResponseCache
+from answer_table import AnswerTable
+from frozen_model import FrozenModel, export_frozen_model
+from numpy_seq2seq import NumpySeq2Seq
+from checkpoint import CheckpointWriter, load_checkpoint, get_f_name_checkpoint
+from training_telemetry import TrainingTelemetry, TelemetryCallback, get_f_name_telemetry
+
+try:
+    import matplotlib.pyplot as plt
+except ImportError:
+    # matplotlib нужен только для отладочного вывода векторов (закомментирован)
+    plt = None
 
 
 curses.setupterm()
@@ -41,15 +62,35 @@ class TextToText:
     2. f_name_w2v_model - имя .bin файла с обученной моделью wor2vec (по умолчанию data/+name_dataset+/w2v_model_+name_dataset+.bin)
     3. f_name_model - имя .json файла с моделью сети (по умолчанию data/+name_dataset+/model_+name_dataset+.json)
     4. f_name_model_weights - имя .h5 файла с весами обученной модели (по умолчанию data/+name_dataset+/model_weights_+name_dataset+.h5)
-    5. train - True: обучение модели с нуля, False: взаимодействие с обученной моделью '''
-    def __init__(self, name_dataset='plays_ru', f_name_w2v_model=None, f_name_model=None, f_name_model_weights=None, train=False):
+    5. train - True: обучение модели с нуля, False: взаимодействие с обученной моделью
+    6. f_name_ann_index - имя .npz файла с индексом для приближённого декодирования ответов (строится с помощью ann_index.py), если None - 
+    используется точный поиск
+    7. quantization - режим хранения векторов word2vec: None (float32), 'float16' или 'int8' (подробнее в WordToVec.quantize())
+    8. f_name_frozen_model - имя .pb файла с замороженным графом модели (создаётся с помощью export_frozen_model()), если задан - модель
+    загружается из него, а f_name_model и f_name_model_weights не используются
+    9. backend - способ получения ответов сети: 'keras' или 'numpy' (NumpySeq2Seq, не требует tensorflow, подробнее в numpy_seq2seq.py) '''
+    def __init__(self, name_dataset='plays_ru', f_name_w2v_model=None, f_name_model=None, f_name_model_weights=None, train=False,
+                 f_name_ann_index=None, quantization=None, f_name_frozen_model=None, backend='keras'):
         self.stp = None
         self.w2v = None
         self.model = None
+        self.batch_scheduler = None
+        self.response_cache = None
+        self.answer_table = None
+        self.model_version = None
+        self.f_name_model = None
+        self.buckets = None
+        self.bucket_models = {}
         if not train:
             if not (name_dataset == 'plays_ru' or name_dataset == 'subtitles_ru' or name_dataset == 'conversations_ru'):
                 print('\n[E] Неверное значение name_dataset. Возможные варианты: plays_ru, subtitles_ru или conversations_ru\n')
                 return
+            if not (backend == 'keras' or backend == 'numpy'):
+                print('\n[E] Неверное значение backend. Возможные варианты: keras или numpy\n')
+                return
+            if backend == 'keras' and f_name_frozen_model is None and keras_version is None:
+                print('\n[E] Не установлены keras и tensorflow, используйте backend=numpy\n')
+                return
 
             print('[i] Используется набор данных ' + name_dataset)
             if f_name_w2v_model is None:
@@ -57,20 +98,33 @@ class TextToText:
                 if not os.path.isfile(f_name_w2v_model):
                     print("\n[E] Файл '" + f_name_w2v_model + "' не существует\n")
                     return
-            if f_name_model is None:
-                f_name_model = 'data/' + name_dataset + '/model_' + name_dataset + '.json'
-                if not os.path.isfile(f_name_model):
-                    print("\n[E] Файл '" + f_name_model + "' не существует\n")
-                    return
-            if f_name_model_weights is None:
-                f_name_model_weights = 'data/' + name_dataset + '/model_weights_' + name_dataset + '.h5'
-                if not os.path.isfile(f_name_model_weights):
-                    print("\n[E] Файл '" + f_name_model_weights + "' не существует\n")
-                    return
-            
-            print('[i] Загрузка параметров модели из %s и %s' % (f_name_model, f_name_model_weights))
-            self.__load_model(f_name_model)
-            self.model.load_weights(f_name_model_weights)
+            if f_name_frozen_model is not None:
+                print('[i] Загрузка замороженного графа модели из %s' % f_name_frozen_model)
+                self.model = FrozenModel(f_name_frozen_model)
+                self.model_version = self.model.model_version
+                max_sequence_length = self.model.max_sequence_length
+            else:
+                if f_name_model is None:
+                    f_name_model = 'data/' + name_dataset + '/model_' + name_dataset + '.json'
+                    if not os.path.isfile(f_name_model):
+                        print("\n[E] Файл '" + f_name_model + "' не существует\n")
+                        return
+                if f_name_model_weights is None:
+                    f_name_model_weights = 'data/' + name_dataset + '/model_weights_' + name_dataset + '.h5'
+                    if not os.path.isfile(f_name_model_weights):
+                        print("\n[E] Файл '" + f_name_model_weights + "' не существует\n")
+                        return
+                
+                print('[i] Загрузка параметров модели из %s и %s' % (f_name_model, f_name_model_weights))
+                self.f_name_model = f_name_model
+                if backend == 'numpy':
+                    self.model = NumpySeq2Seq(f_name_model)
+                    self.load_model_weights(f_name_model_weights)
+                    max_sequence_length = self.model.max_sequence_length
+                else:
+                    self.__load_model(f_name_model)
+                    self.load_model_weights(f_name_model_weights)
+                    max_sequence_length = self.model.get_layer(index=0).input_shape[1]
 
             #self.model.layers[6].cells.pop()
             #self.model.layers[6].cells.pop()
@@ -86,20 +140,22 @@ class TextToText:
             #plt.matshow(temp, cmap='inferno')
             #plt.show()
             
-            self.stp = SourceToPrepared(self.model.get_layer(index=0).input_shape[1])
-            self.w2v = WordToVec(f_name_w2v_model)
+            self.stp = SourceToPrepared(max_sequence_length)
+            self.w2v = WordToVec(f_name_w2v_model, quantization)
+            if f_name_ann_index is not None:
+                self.w2v.load_ann_index(f_name_ann_index)
 
 
     def prepare(self, f_name_source_data, f_name_training_sample=None, f_name_source_subtitles=None, f_name_prepared_subtitles=None,
                 f_name_enc_training_sample=None, f_name_w2v_model=None, f_name_w2v_vocab=None, len_encode=None, size=500, min_count_repeat=1,
-                window=5, epochs=None, logging=False):
+                window=5, epochs=None, logging=False, incremental=False):
         ''' Осуществляет преобразование пар "вопрос %% ответ" в последовательности фиксированного размера. Затем выполняет построение модели word2vec
         и кодирования обучающей выборки в вектора.
         1. f_name_source_data - имя входного .txt файла с исходными данными (пары "вопрос %% ответ")
         2. f_name_training_sample - имя .pkl файла с предварительно обработанными парами [вопрос,ответ] (по умолчанию prepared_+f_name_source_data+.pkl)
         3. f_name_source_subtitles - имя входного .txt файла с субтитрами (пары "вопрос %% ответ")
         4. f_name_prepared_subtitles - имя .pkl файла с предварительно обработанными субтитрами (для расширения словаря модели word2vec) (по умолчанию prepared_+f_name_source_subtitles+.pkl)
-        5. f_name_enc_training_sample - имя выходного .npz файла с векторным представлением слов в парах [вопрос,ответ] (по умолчанию encoded_+f_name_training_sample+.npz)
+        5. f_name_enc_training_sample - имя выходной закодированной выборки с векторным представлением слов в парах [вопрос,ответ] (по умолчанию encoded_+f_name_training_sample+.npz)
         6. f_name_w2v_model - имя .bin файла для сохранения обученной модели word2vec (по умолчанию w2v_model_+f_name_training_sample+.bin)
         7. f_name_w2v_vocab - имя .txt файла для сохранения словаря word2vec (по умолчанию w2v_vocabulary_+f_name_training_sample+.txt)
         8. len_encode - если None: закодировать весь f_name_training_sample, иначе - первые len_encode элементов
@@ -108,17 +164,35 @@ class TextToText:
         10. min_count - минимальное количество повторений (частота повторений) слова, что бы оно было включено в словарь
         11. window - максимальное расстояние между текущим и прогнозируемым словом в предложении
         12. epochs - число эпох обучения модели word2vec (если None, используется внутренний итератор)
-        13. logging - включение вывода данных в процессе обучения модели word2vec '''
+        13. logging - включение вывода данных в процессе обучения модели word2vec
+        14. incremental - True: f_name_source_data содержит только новые пары, которыми нужно дополнить уже подготовленную выборку
+        f_name_training_sample (обязательно указывать), модель word2vec дообучается на них (подробнее в WordToVec.update_word2vec()), а в
+        закодированную выборку дописываются только новые пары (epochs по умолчанию 5, субтитры не используются) '''
         
         if not os.path.isfile(f_name_source_data):
             print("\n[E] Файл '" + f_name_source_data + "' не существует\n")
             return
         
         start_time = time.time()
+        f_name_prepared_data = f_name_source_data[:f_name_source_data.rfind('/')+1] + 'prepared_' + f_name_source_data[f_name_source_data.rfind('/')+1:]
+        f_name_prepared_data = f_name_prepared_data.replace('.txt', '.pkl')
+        if incremental:
+            if f_name_training_sample is None or not os.path.isfile(f_name_training_sample):
+                print("\n[E] Для дополнения выборки необходимо указать существующий файл f_name_training_sample\n")
+                return
+            # Новые пары выравниваются по длине уже подготовленных, что бы их можно было дописать в закодированную выборку
+            self.stp = SourceToPrepared(len(load_prepared_pairs(f_name_training_sample, 1)[0][0]))
+            self.stp.prepare_all(f_name_source_data, f_name_prepared_data)
+
+            self.w2v = WordToVec()
+            self.w2v.update_word2vec(f_name_prepared_data, f_name_training_sample, f_name_enc_training_sample, f_name_w2v_model, f_name_w2v_vocab,
+                                     epochs if epochs is not None else 5, logging)
+            print('[i] Время обработки: %.2f мин или %.2f ч' % ((time.time() - start_time)/60.0, ((time.time() - start_time)/60.0)/60.0))
+            return
+
         self.stp = SourceToPrepared()
         if f_name_training_sample is None:
-            f_name_training_sample = f_name_source_data[:f_name_source_data.rfind('/')+1] + 'prepared_' + f_name_source_data[f_name_source_data.rfind('/')+1:]
-            f_name_training_sample = f_name_training_sample.replace('.txt', '.pkl')
+            f_name_training_sample = f_name_prepared_data
         self.stp.prepare_all(f_name_source_data, f_name_training_sample)
 
         if f_name_source_subtitles is not None:
@@ -139,7 +213,7 @@ class TextToText:
         ''' Установка максимальной длины предложения (размера входа) для модели сети и загрузка обученной модели word2vec.
         1. name_dataset - имя используемого набора данных: plays_ru, subtitles_ru или conversations_ru
         2. f_name_w2v_model - имя .bin файла с обученной моделью wor2vec (по умолчанию data/+name_dataset+/w2v_model_+name_dataset+.bin)
-        3. f_name_enc_training_sample - имя .npz файла с векторным представлением слов в парах [вопрос,ответ] (по умолчанию data/+name_dataset+/encoded_+name_dataset+.npz) '''
+        3. f_name_enc_training_sample - имя закодированной выборки с векторным представлением слов в парах [вопрос,ответ] (по умолчанию data/+name_dataset+/encoded_+name_dataset+.npz) '''
 
         if not (name_dataset == 'plays_ru' or name_dataset == 'subtitles_ru' or name_dataset == 'conversations_ru'):
             print('\n[E] Неверное значение name_dataset. Возможные варианты: plays_ru, subtitles_ru или conversations_ru\n')
@@ -153,29 +227,41 @@ class TextToText:
                 return
         if f_name_enc_training_sample is None:
             f_name_enc_training_sample = 'data/' + name_dataset + '/encoded_' + name_dataset + '.npz'
-            if not os.path.isfile(f_name_enc_training_sample):
+            if not is_enc_training_sample(f_name_enc_training_sample):
                 print("\n[E] Файл '" + f_name_enc_training_sample + "' не существует\n")
                 return
 
         print('[i] Загрузка данных из %s' % f_name_enc_training_sample)
-        npzfile = np.load(f_name_enc_training_sample)
-        questions = npzfile['questions']
-        vec_size = questions.shape[1]
-        self.stp = SourceToPrepared(vec_size)
+        enc_training_sample = EncodedSample(f_name_enc_training_sample)
+        self.stp = SourceToPrepared(enc_training_sample.sequence_length)
 
         self.w2v = WordToVec(f_name_w2v_model)
 
 
-    def train(self, f_name_enc_training_sample, f_name_model=None, f_name_model_weights=None, depth_model=2, training_cycles=100, epochs=5):
-        ''' Запуск обучения и тестирования модели AttentionSeq2Seq.
-        1. f_name_enc_training_sample - имя .npz файла с векторным представлением слов в парах [вопрос,ответ]
+    def train(self, f_name_enc_training_sample, f_name_model=None, f_name_model_weights=None, depth_model=2, training_cycles=100, epochs=5,
+              batch_size=32, workers=1, max_queue_size=10, resume=True, f_name_telemetry=None, buckets=None):
+        ''' Запуск обучения и тестирования модели AttentionSeq2Seq. После каждого цикла обучения в фоне сохраняется контрольная точка (веса модели,
+        состояние оптимизатора и номер цикла, подробнее в checkpoint.py), по которой прерванное обучение продолжается при следующем запуске.
+        Показатели обучения (скорость, ошибка, память, время записи контрольных точек и оценки) записываются в f_name_telemetry.
+        Если заданы buckets, пары разбиваются на группы по длине: каждая пара обучается в наименьшей группе, в которую помещается, без лишних
+        <PAD>. Для каждой группы создаётся своя модель, веса которой (они не зависят от длины последовательности) копируются между моделями
+        перед обучением на группе, поэтому в итоге сохраняется одна модель полной длины.
+        1. f_name_enc_training_sample - имя закодированной выборки с векторным представлением слов в парах [вопрос,ответ]
         2. f_name_model - имя .json файла для сохранения модели сети (по умолчанию model_+f_name_enc_training_sample+.json)
         3. f_name_model_weights - имя .h5 файла для сохранения весов обученной модели (по умолчанию model_weights_+f_name_enc_training_sample+.h5)
         4. depth_model - глубина модели seq2seq, задаёт число входных и выходных LSTM-слоёв
         5. training_cycles - количество циклов обучения модели
-        6. epochs - количество эпох в одном цикле обучения модели '''
-
-        if (self.stp is None and self.w2v is None) or not os.path.isfile(f_name_enc_training_sample):
+        6. epochs - количество эпох в одном цикле обучения модели
+        7. batch_size - размер пакета
+        8. workers - количество потоков, которые готовят пакеты в фоне (0 - пакеты готовятся в основном потоке)
+        9. max_queue_size - максимальное количество заранее подготовленных пакетов
+        10. resume - True: продолжить обучение с контрольной точки, если она есть, False: начать обучение заново
+        11. f_name_telemetry - имя .jsonl файла для показателей обучения (по умолчанию training_telemetry_+f_name_enc_training_sample+.jsonl,
+        подробнее в training_telemetry.py)
+        12. buckets - None: без групп по длине, 'auto': подобрать группы автоматически (source_to_prepared.get_buckets()), list из длин групп
+        (полная длина добавляется автоматически) - только для выборки, закодированной в индексы слов '''
+
+        if (self.stp is None and self.w2v is None) or not is_enc_training_sample(f_name_enc_training_sample):
             print('[E] Перед обучением модели сети необходимо подготовить обучающие данные с помощью prepare().')
             return
 
@@ -185,42 +271,149 @@ class TextToText:
         if f_name_model_weights is None:
             f_name_model_weights = f_name_enc_training_sample.replace('encoded_', 'model_weights_')
             f_name_model_weights = f_name_model_weights.replace('.npz', '.h5')
+        if f_name_telemetry is None:
+            f_name_telemetry = get_f_name_telemetry(f_name_model_weights)
 
         start_time = time.time()
         print('[i] Загрузка данных из %s' % f_name_enc_training_sample)
-        npzfile = np.load(f_name_enc_training_sample)
-        questions, answers = npzfile['questions'], npzfile['answers']
-        questions = (questions + 1.0) * 0.5
-        answers = (answers + 1.0) * 0.5
-
-        num_examples, sequence_length, vec_size = questions.shape
+        enc_training_sample = EncodedSample(f_name_enc_training_sample)
+        num_examples = enc_training_sample.num_examples
+        sequence_length = enc_training_sample.sequence_length
+        vec_size = enc_training_sample.vec_size
         print('\tколичество примеров: %i' % num_examples)
         print('\tдлинна последовательности: %i' % sequence_length)
         print('\tразмер входа: %i' % vec_size)
 
         print('[i] Построение сети...\n')
-        #self.model = SimpleSeq2Seq(input_dim=vec_size, hidden_dim=vec_size, output_length=sequence_length, output_dim=vec_size, depth=depth_model)
-        self.model = AttentionSeq2Seq(input_dim=vec_size, hidden_dim=vec_size, input_length=sequence_length, output_length=sequence_length,
-                                      output_dim=vec_size, depth=depth_model, dropout=0.0)
-
-        self.model.compile(loss='mse', optimizer='rmsprop')
+        self.model = self.__build_model(vec_size, sequence_length, depth_model)
         self.__save_model(f_name_model)
+        self.f_name_model = f_name_model
         print(self.model.summary())
 
+        bucket_batches = self.__get_bucket_batches(enc_training_sample, buckets, batch_size, depth_model)
+
+        f_name_checkpoint = get_f_name_checkpoint(f_name_model_weights)
+        first_cycle = 1
+        if resume and os.path.isfile(f_name_checkpoint):
+            first_cycle = self.__load_checkpoint(f_name_checkpoint) + 1
+
+        telemetry = TrainingTelemetry(f_name_telemetry, {'depth_model': depth_model, 'vec_size': vec_size, 'sequence_length': sequence_length,
+                                                         'num_examples': num_examples, 'batch_size': batch_size, 'epochs': epochs,
+                                                         'training_cycles': training_cycles, 'first_cycle': first_cycle, 'workers': workers,
+                                                         'buckets': [ bucket[0] for bucket in bucket_batches ]})
+        telemetry_callback = TelemetryCallback(telemetry, num_examples)
+
         print('\n[i] Обучение сети...\n')
-        for i in range(1, training_cycles + 1):
-            self.model.fit(questions, answers, batch_size=32, epochs=epochs, verbose=1)
-            self.__save_model_weights(f_name_model_weights, training_cycles, i)
+        checkpoint_writer = CheckpointWriter(f_name_checkpoint, lambda cycle, write_time: telemetry.write('checkpoint', cycle=cycle,
+                                                                                                         write_time=write_time))
+        for i in range(first_cycle, training_cycles + 1):
+            telemetry_callback.cycle = i
+            cycle_start_time = time.time()
+            loss = self.__fit_buckets(bucket_batches, epochs, workers, max_queue_size, telemetry_callback)
+            cycle_time = time.time() - cycle_start_time
+            print('\n[i] Сохранение контрольной точки %i из %i...\n' % (i, training_cycles))
+            snapshot_start_time = time.time()
+            checkpoint_writer.wait() # предыдущая копия весов освобождается до создания следующей
+            checkpoint_writer.save(i, self.model.get_weights(), self.model.optimizer.get_weights())
+            telemetry.write('cycle', cycle=i, time=cycle_time, samples_per_second=num_examples * epochs / cycle_time,
+                            loss=loss, snapshot_time=time.time() - snapshot_start_time)
+        checkpoint_writer.close()
+        self.model.save_weights(f_name_model_weights)
+        if checkpoint_writer.error is None and os.path.isfile(f_name_checkpoint):
+            os.remove(f_name_checkpoint)
         print('[i] Обучение завершено')
         
         print('[i] Оценка сети...')
-        score = self.model.evaluate(questions, answers, batch_size=32, verbose=1)
+        batches = EncodedSampleSequence(enc_training_sample, batch_size, shuffle=False)
+        evaluation_start_time = time.time()
+        score = self.model.evaluate_generator(batches, steps=len(batches), workers=workers, max_queue_size=max_queue_size, use_multiprocessing=False)
+        telemetry.write('evaluation', loss=float(score), time=time.time() - evaluation_start_time)
         print('[i] Оценка точности модели на обучающей выборке: %.2f%%' % (score*100))
 
-        self.assessment_training_accuracy(f_name_enc_training_sample)
+        assessment_start_time = time.time()
+        accuracy = self.assessment_training_accuracy(f_name_enc_training_sample)
+        assessment_time = time.time() - assessment_start_time
+        telemetry.write('assessment', accuracy=accuracy, time=assessment_time, samples_per_second=num_examples / assessment_time)
+        telemetry.write('end', time=time.time() - start_time)
         print('[i] Время обучения: %.2f мин или %.2f ч' % ((time.time() - start_time)/60.0, ((time.time() - start_time)/60.0)/60.0))
         
 
+    def __build_model(self, vec_size, sequence_length, depth_model):
+        ''' Построение и компиляция модели AttentionSeq2Seq с длиной входной и выходной последовательности sequence_length. '''
+        #model = SimpleSeq2Seq(input_dim=vec_size, hidden_dim=vec_size, output_length=sequence_length, output_dim=vec_size, depth=depth_model)
+        model = AttentionSeq2Seq(input_dim=vec_size, hidden_dim=vec_size, input_length=sequence_length, output_length=sequence_length,
+                                 output_dim=vec_size, depth=depth_model, dropout=0.0)
+        model.compile(loss='mse', optimizer='rmsprop')
+        return model
+
+
+    def __get_bucket_batches(self, enc_training_sample, buckets, batch_size, depth_model):
+        ''' Разбиение выборки на группы по длине (подробнее в train()).
+        1. возвращает list из [длина группы, модель, EncodedSampleSequence] для каждой непустой группы '''
+
+        sequence_length = enc_training_sample.sequence_length
+        if buckets is None:
+            return [[sequence_length, self.model, EncodedSampleSequence(enc_training_sample, batch_size)]]
+        sequence_lengths = enc_training_sample.get_sequence_lengths()
+        if sequence_lengths is None:
+            print('[W] Группы по длине поддерживаются только для выборки, закодированной в индексы слов, обучение выполняется без них')
+            return [[sequence_length, self.model, EncodedSampleSequence(enc_training_sample, batch_size)]]
+
+        if buckets == 'auto':
+            buckets = get_buckets(sequence_lengths)
+        buckets = sorted(set([ min(length, sequence_length) for length in buckets ] + [sequence_length]))
+        bucket_lengths = assign_buckets(sequence_lengths, buckets)
+        bucket_batches = []
+        print('[i] Группы по длине:')
+        for length in buckets:
+            examples = np.flatnonzero(bucket_lengths == length)
+            print('\t%i слов: %i примеров' % (length, len(examples)))
+            if len(examples) == 0:
+                continue
+            model = self.model if length == sequence_length else self.__build_model(enc_training_sample.vec_size, length, depth_model)
+            # Переменные оптимизатора создаются вместе с функцией обучения, они нужны для копирования состояния оптимизатора между моделями
+            model._make_train_function()
+            bucket_batches.append([length, model, EncodedSampleSequence(enc_training_sample, batch_size, examples=examples, sequence_length=length)])
+        print('\tдоля <PAD> уменьшена с %.2f%% до %.2f%%' % ((1 - sequence_lengths.sum() / (sequence_length * len(sequence_lengths))) * 100,
+              (1 - sequence_lengths.sum() / bucket_lengths.sum()) * 100))
+        return bucket_batches
+
+
+    def __fit_buckets(self, bucket_batches, epochs, workers, max_queue_size, telemetry_callback):
+        ''' Один цикл обучения: epochs эпох, в каждой из которых модель по очереди обучается на всех группах по длине (веса и состояние
+        оптимизатора копируются из предыдущей модели в следующую, а после цикла - в self.model).
+        1. bucket_batches - list из [длина группы, модель, EncodedSampleSequence] (из __get_bucket_batches())
+        2. возвращает ошибку на последней эпохе (среднюю по всем примерам) '''
+
+        if len(bucket_batches) == 1 and bucket_batches[0][1] is self.model:
+            sequence_length, model, batches = bucket_batches[0]
+            telemetry_callback.num_examples = len(batches.examples)
+            telemetry_callback.sequence_length = sequence_length
+            history = self.model.fit_generator(batches, steps_per_epoch=len(batches), epochs=epochs, verbose=1, workers=workers,
+                                               max_queue_size=max_queue_size, use_multiprocessing=False, shuffle=False,
+                                               callbacks=[telemetry_callback])
+            return float(history.history['loss'][-1])
+
+        model_weights = self.model.get_weights()
+        optimizer_weights = self.model.optimizer.get_weights()
+        for epoch in range(epochs):
+            losses = []
+            for sequence_length, model, batches in bucket_batches:
+                model.set_weights(model_weights)
+                model.optimizer.set_weights(optimizer_weights)
+                telemetry_callback.num_examples = len(batches.examples)
+                telemetry_callback.sequence_length = sequence_length
+                history = model.fit_generator(batches, steps_per_epoch=len(batches), epochs=epoch+1, initial_epoch=epoch, verbose=1,
+                                              workers=workers, max_queue_size=max_queue_size, use_multiprocessing=False, shuffle=False,
+                                              callbacks=[telemetry_callback])
+                losses.append(history.history['loss'][-1] * len(batches.examples))
+                model_weights = model.get_weights()
+                optimizer_weights = model.optimizer.get_weights()
+        self.model.set_weights(model_weights)
+        self.model.optimizer.set_weights(optimizer_weights)
+        return float(sum(losses) / sum([ len(batches.examples) for sequence_length, model, batches in bucket_batches ]))
+
+
     def __save_compile_param(self, f_name_compile_param, loss, optimizer):
         ''' Сохранение параметров компиляции (loss и optimizer) модели сети в .json файл f_name_compile_param. '''
         with open(f_name_compile_param, 'w') as f_compile_param:
@@ -243,32 +436,36 @@ class TextToText:
 
     def __load_model(self, f_name_model):
         ''' Загрузка модели сети из .json файла f_name_model. '''
-        with open(f_name_model, 'r') as f_model:
-            self.model = model_from_json(f_model.read(), custom_objects={'RecurrentSequential': RecurrentSequential, 
-                                                                         '_OptionalInputPlaceHolder': _OptionalInputPlaceHolder,
-                                                                         'LSTMDecoderCell': LSTMDecoderCell,
-                                                                         'AttentionDecoderCell': AttentionDecoderCell})
-
-
-    def __save_model_weights(self, f_name_model_weights, training_cycles, i):
-        ''' Сохранение весов модели после каждой итерации обучения в .h5 файл f_name_model_weights. '''
-        print('\n[i] Сохранение результата %i из %i...\n' % (i, training_cycles))
-        if i == training_cycles:
-            self.model.save_weights(f_name_model_weights)
-            path_weights = os.path.join(os.path.abspath(os.path.dirname(__file__)), f_name_model_weights[:len(f_name_model_weights)-3] + '_%i.h5' % (i - 1))
-            os.remove(path_weights)
-        else:
-            self.model.save_weights(f_name_model_weights[:len(f_name_model_weights)-3] + '_%i.h5' % i)
-            if i > 1:
-                path_weights = os.path.join(os.path.abspath(os.path.dirname(__file__)), f_name_model_weights[:len(f_name_model_weights)-3] + '_%i.h5' % (i - 1))
-                os.remove(path_weights)
+        self.model = load_keras_model(f_name_model)
 
-    
-    def assessment_training_accuracy(self, f_name_enc_training_sample, f_name_wrong_answers=None):
+
+    def __load_checkpoint(self, f_name_checkpoint):
+        ''' Загрузка весов модели и состояния оптимизатора из контрольной точки f_name_checkpoint (модель должна быть скомпилирована).
+        1. возвращает номер выполненного цикла обучения или 0, если контрольная точка не подходит для модели '''
+
+        cycle, model_weights, optimizer_weights = load_checkpoint(f_name_checkpoint)
+        # Переменные оптимизатора создаются вместе с функцией обучения
+        self.model._make_train_function()
+        model_shapes = [ weight.shape for weight in self.model.get_weights() ]
+        optimizer_shapes = [ weight.shape for weight in self.model.optimizer.get_weights() ]
+        if model_shapes != [ weight.shape for weight in model_weights ] or optimizer_shapes != [ weight.shape for weight in optimizer_weights ]:
+            print('[W] Контрольная точка %s не подходит для модели, обучение начинается заново' % f_name_checkpoint)
+            return 0
+
+        self.model.set_weights(model_weights)
+        self.model.optimizer.set_weights(optimizer_weights)
+        print('[i] Обучение продолжается с контрольной точки %s (выполнено циклов: %i)' % (f_name_checkpoint, cycle))
+        return cycle
+
+
+    def assessment_training_accuracy(self, f_name_enc_training_sample, f_name_wrong_answers=None, batch_size=256):
         ''' Оценка точности обучения сети: подаёт на вход сети все вопросы из обучающей выборки и сравнивает полученный ответ сети с
-        ответом из обучающей выборки. 
-        1. f_name_enc_training_sample - имя .npz файла с векторным представлением слов в парах [вопрос,ответ]
-        2. f_name_wrong_answers - имя .txt файла для сохранения неправильных ответов сети (по умолчанию data/wrong_answers.txt) '''
+        ответом из обучающей выборки. Вопросы обрабатываются пакетами по batch_size, ответы сравниваются в виде индексов слов (индексы
+        правильных ответов вычисляются один раз, а если выборка закодирована в индексы по той же модели word2vec - берутся из неё).
+        1. f_name_enc_training_sample - имя закодированной выборки с векторным представлением слов в парах [вопрос,ответ]
+        2. f_name_wrong_answers - имя .txt файла для сохранения неправильных ответов сети (по умолчанию data/wrong_answers.txt)
+        3. batch_size - количество вопросов, обрабатываемых за один раз
+        4. возвращает точность в процентах '''
 
         if f_name_wrong_answers is None:
             f_name_wrong_answers = f_name_enc_training_sample.replace('encoded_', 'wrong_answers_')
@@ -276,42 +473,45 @@ class TextToText:
 
         print('[i] Оценка точности обучения модели...')
 
-        npzfile = np.load(f_name_enc_training_sample)
-        questions, answers = npzfile['questions'], npzfile['answers']
-        questions = (questions + 1.0) * 0.5
-        
+        enc_training_sample = EncodedSample(f_name_enc_training_sample)
+        len_questions = enc_training_sample.num_examples
+        same_ids = enc_training_sample.is_ids() and enc_training_sample.w2v.index2word == self.w2v.index2word
+        if same_ids:
+            answers_etalon_ids = np.asarray(enc_training_sample.answers)
+        else:
+            answers_etalon_ids = np.empty((len_questions, enc_training_sample.sequence_length), dtype=np.int64)
+            for i in range(0, len_questions, batch_size):
+                answers_etalon_ids[i:i+batch_size] = self.w2v.vec2ids(enc_training_sample.get_batch(i, i+batch_size)[1], exact=True)
+
         correct_answers = 0
         wrong_answers = []
-        len_questions = len(questions)
+        start_time = time.time()
         print('[i] Оценено 0 из %i, правильных ответов 0, текущая точность 0.00%%' % len_questions)
-        for i in range(len_questions):
-            if i % 10 == 0 and i > 0:       
-                os.write(sys.stdout.fileno(), curses.tigetstr('cuu1'))
-                print('[i] Оценено %i из %i, правильных ответов %i, текущая точность %.2f%%' % (i, len_questions, correct_answers, correct_answers/i*100))
-            answer = self.model.predict(questions[i][np.newaxis,:])
-            answer = answer * 2.0 - 1.0
-            answer = self.w2v.vec2word(answer[0])
-            #answer = self.stp.prepare_answer(answer)
-            answer_etalon = self.w2v.vec2word(answers[i])
-            #answer_etalon = self.stp.prepare_answer(answer_etalon)
-            if answer == answer_etalon:
-            #if np.all(answer[0] == answers[i]):
-                correct_answers += 1
-            else:
-                # Сохранение неправильных ответов для последующего вывода
-                quest = self.w2v.vec2word(questions[i])
-                quest = list(reversed(quest))
-                quest = self.stp.prepare_answer(quest)
-                
-                #answer = self.w2v.vec2word(answer[0])
-                answer = self.stp.prepare_answer(answer)
-                
-                wrong_answers.append([quest, answer])        
-        os.write(sys.stdout.fileno(), curses.tigetstr('cuu1'))
-        print('[i] Оценено %i из %i, правильных ответов %i, текущая точность %.2f%%' % (len_questions, len_questions, correct_answers, correct_answers/len_questions*100))
-
-        accuracy = correct_answers / len(answers) * 100
-        print('[i] Количество правильных ответов %i из %i, итоговая точность %.2f%%' % (correct_answers, len(answers), accuracy))
+        for i in range(0, len_questions, batch_size):
+            questions = enc_training_sample.get_batch(i, i+batch_size)[0]
+            answers = self.model.predict((questions + 1.0) * 0.5, batch_size=batch_size)
+            answers_ids = self.w2v.vec2ids(answers * 2.0 - 1.0)
+            is_correct = np.all(answers_ids == answers_etalon_ids[i:i+len(answers_ids)], axis=1)
+            correct_answers += int(np.sum(is_correct))
+
+            # Сохранение неправильных ответов для последующего вывода
+            wrong = np.flatnonzero(~is_correct)
+            if len(wrong) > 0:
+                if same_ids:
+                    questions_ids = np.asarray(enc_training_sample.questions[i:i+batch_size])[wrong]
+                else:
+                    questions_ids = self.w2v.vec2ids(questions[wrong], exact=True)
+                for question_ids, answer_ids in zip(questions_ids, answers_ids[wrong]):
+                    quest = list(reversed([ self.w2v.index2word[j] for j in question_ids ]))
+                    wrong_answers.append([self.stp.prepare_answer(quest), self.stp.prepare_answer([ self.w2v.index2word[j] for j in answer_ids ])])
+
+            number_assessed = i + len(answers_ids)
+            os.write(sys.stdout.fileno(), curses.tigetstr('cuu1'))
+            print('[i] Оценено %i из %i, правильных ответов %i, текущая точность %.2f%%, %.2f примеров/с' % (number_assessed, len_questions,
+                  correct_answers, correct_answers/number_assessed*100, number_assessed/(time.time() - start_time)))
+
+        accuracy = correct_answers / len_questions * 100
+        print('[i] Количество правильных ответов %i из %i, итоговая точность %.2f%%' % (correct_answers, len_questions, accuracy))
 
         if len(wrong_answers) < 50:
             i = 0
@@ -324,40 +524,365 @@ class TextToText:
             with open(f_name_wrong_answers, 'w') as f_wrong_answers:
                 for phrase in wrong_answers:
                     f_wrong_answers.write(phrase[0] + ' %% ' + phrase[1] + '\n')
+        return accuracy
+
+
+    def assessment_ann_index(self, f_name_enc_training_sample, f_name_ann_index=None, len_sample=1000, nprobes=(1, 2, 4, 8, 16, 32, 64)):
+        ''' Сравнение приближённого декодирования ответов сети с точным: для первых len_sample вопросов из обучающей выборки выводит recall@1
+        и время декодирования одного вектора для каждого значения nprobe (для выбора nprobe под конкретный набор данных).
+        1. f_name_enc_training_sample - имя закодированной выборки с векторным представлением слов в парах [вопрос,ответ]
+        2. f_name_ann_index - имя .npz файла с индексом (если None - используется загруженный в TextToText индекс)
+        3. len_sample - количество вопросов, на ответах к которым выполняется сравнение
+        4. nprobes - проверяемые значения nprobe
+        5. возвращает list из [nprobe, recall@1, время в мс на вектор] '''
+
+        if f_name_ann_index is not None:
+            ann_index = AnnIndex(f_name_ann_index)
+        else:
+            ann_index = self.w2v.ann_index
+        if ann_index is None:
+            print('[E] Индекс для приближённого декодирования не загружен')
+            return
+        if self.w2v.decode_ids is not None or ann_index.list_offsets[-1] != len(self.w2v.decode_matrix):
+            print('[E] Индекс построен для другого словаря (или декодирование ограничено словами из ответов)')
+            return
+
+        enc_training_sample = EncodedSample(f_name_enc_training_sample)
+        questions, answers = enc_training_sample.get_batch(0, min(len_sample, enc_training_sample.num_examples))
+        questions = (questions + 1.0) * 0.5
+
+        answers = self.model.predict(questions, batch_size=32)
+        answers = answers * 2.0 - 1.0
+        return ann_benchmark(self.w2v, ann_index, answers.reshape(-1, answers.shape[-1]), nprobes)
+
+
+    def assessment_quantization(self, f_name_enc_training_sample, quantization='int8', len_sample=None, batch_size=256):
+        ''' Сравнение ответов сети при использовании квантованной модели word2vec с ответами при использовании float32: вопросы из обучающей
+        выборки кодируются и ответы декодируются обеими моделями, выводится количество ответов, которые изменились.
+        1. f_name_enc_training_sample - имя закодированной выборки с векторным представлением слов в парах [вопрос,ответ]
+        2. quantization - проверяемый режим квантования: 'float16' или 'int8'
+        3. len_sample - количество проверяемых вопросов (если None - все вопросы из обучающей выборки)
+        4. batch_size - количество вопросов, обрабатываемых за один раз
+        5. возвращает количество изменившихся ответов '''
+
+        if self.w2v.quantization is not None:
+            print('[E] Для сравнения необходимо загрузить модель word2vec без квантования')
+            return
+
+        w2v_quantized = copy.copy(self.w2v)
+        w2v_quantized.ann_index = None
+        w2v_quantized.quantize(quantization)
+        if w2v_quantized.quantization is None:
+            return
+
+        print('[i] Сравнение ответов сети при использовании float32 и %s...' % quantization)
+        enc_training_sample = EncodedSample(f_name_enc_training_sample)
+        len_sample = enc_training_sample.num_examples if len_sample is None else min(len_sample, enc_training_sample.num_examples)
+        same_ids = enc_training_sample.is_ids() and enc_training_sample.w2v.index2word == self.w2v.index2word
+
+        number_changed = 0
+        number_changed_words = 0
+        number_words = 0
+        for i in range(0, len_sample, batch_size):
+            # Вопросы восстанавливаются до индексов слов (если выборка хранится в виде векторов) и кодируются заново каждой из моделей
+            if same_ids:
+                questions_ids = np.asarray(enc_training_sample.questions[i:min(i+batch_size, len_sample)])
+            else:
+                questions_ids = self.w2v.vec2ids(enc_training_sample.get_batch(i, min(i+batch_size, len_sample))[0], exact=True)
+            questions = (self.w2v.ids2vec(questions_ids) + 1.0) * 0.5
+            questions_quantized = (w2v_quantized.ids2vec(questions_ids) + 1.0) * 0.5
+
+            answers = self.model.predict(questions, batch_size=batch_size) * 2.0 - 1.0
+            answers_ids = self.w2v.vec2ids(answers, exact=True)
+            answers_quantized = self.model.predict(questions_quantized, batch_size=batch_size) * 2.0 - 1.0
+            answers_quantized_ids = w2v_quantized.vec2ids(answers_quantized, exact=True)
+
+            number_changed += int(np.sum(np.any(answers_ids != answers_quantized_ids, axis=1)))
+            number_changed_words += int(np.sum(answers_ids != answers_quantized_ids))
+            number_words += answers_ids.size
+
+        print('[i] Изменилось ответов: %i из %i (%.2f%%), изменилось слов: %i из %i' % (number_changed, len_sample,
+              number_changed/len_sample*100, number_changed_words, number_words))
+        return number_changed
+
+
+    def assessment_answer_vocabulary(self, f_name_enc_training_sample, f_name_training_sample, len_sample=1000, batch_size=256):
+        ''' Сравнение декодирования ответов сети по всему словарю word2vec и только по словам из ответов обучающей выборки (подробнее в
+        WordToVec.restrict_decoding()): выводится время декодирования одного вектора и количество ответов, которые изменились.
+        1. f_name_enc_training_sample - имя закодированной выборки с векторным представлением слов в парах [вопрос,ответ]
+        2. f_name_training_sample - имя .pkl файла с предварительно обработанными парами [вопрос,ответ], из ответов которых берутся слова
+        3. len_sample - количество проверяемых вопросов (если None - все вопросы из обучающей выборки)
+        4. batch_size - количество вопросов, обрабатываемых за один раз
+        5. возвращает количество изменившихся ответов '''
+
+        if self.w2v.decode_ids is not None:
+            print('[E] Для сравнения необходимо загрузить модель word2vec без ограничения декодирования')
+            return
+
+        w2v_restricted = copy.copy(self.w2v)
+        w2v_restricted.ann_index = None
+        w2v_restricted.restrict_decoding(f_name_training_sample)
+
+        print('[i] Сравнение декодирования по всему словарю и по словам из ответов...')
+        enc_training_sample = EncodedSample(f_name_enc_training_sample)
+        len_sample = enc_training_sample.num_examples if len_sample is None else min(len_sample, enc_training_sample.num_examples)
+
+        elapsed_time = 0.0
+        elapsed_time_restricted = 0.0
+        number_changed = 0
+        number_changed_words = 0
+        number_words = 0
+        for i in range(0, len_sample, batch_size):
+            questions = enc_training_sample.get_batch(i, min(i+batch_size, len_sample))[0]
+            answers = self.model.predict((questions + 1.0) * 0.5, batch_size=batch_size) * 2.0 - 1.0
+
+            # Сравниваются ответы до первого <EOS>, как при обычной работе predict_prepared()
+            start_time = time.time()
+            answers_ids = self.w2v.vec2ids_to_eos(answers, exact=True)
+            elapsed_time += time.time() - start_time
+            start_time = time.time()
+            answers_restricted_ids = w2v_restricted.vec2ids_to_eos(answers, exact=True)
+            elapsed_time_restricted += time.time() - start_time
+
+            number_changed += int(np.sum(np.any(answers_ids != answers_restricted_ids, axis=1)))
+            number_changed_words += int(np.sum(answers_ids != answers_restricted_ids))
+            number_words += answers_ids.size
+
+        print('[i] Время декодирования одного вектора: по всему словарю %.4f мс, по словам из ответов %.4f мс (в %.2f раз быстрее)' % (
+              elapsed_time / number_words * 1000, elapsed_time_restricted / number_words * 1000, elapsed_time / max(elapsed_time_restricted, 1e-12)))
+        print('[i] Изменилось ответов: %i из %i (%.2f%%), изменилось слов: %i из %i' % (number_changed, len_sample,
+              number_changed/len_sample*100, number_changed_words, number_words))
+        return number_changed
+
+
+    def load_model_weights(self, f_name_model_weights):
+        ''' Загрузка весов модели из .h5 файла f_name_model_weights. Версия модели (имя файла и время его изменения) входит в ключ кэша
+        ответов, поэтому сохранённые ответы старой модели удаляются (как и таблица ответов, построенная для других весов). '''
+        if isinstance(self.model, FrozenModel):
+            print('[E] Загрузка весов в замороженный граф не поддерживается')
+            return
+        self.model.load_weights(f_name_model_weights)
+        for model in self.bucket_models.values():
+            model.set_weights(self.model.get_weights())
+        self.model_version = (f_name_model_weights, os.path.getmtime(f_name_model_weights))
+        if self.response_cache is not None:
+            self.response_cache.clear()
+        if self.answer_table is not None and self.answer_table.model_version != self.model_version:
+            print('[W] Таблица ответов построена для других весов модели и больше не используется')
+            self.answer_table = None
+
+
+    def export_frozen_model(self, f_name_frozen_model):
+        ''' Экспорт загруженной модели в замороженный граф (подробнее в frozen_model.py) для быстрой загрузки с помощью
+        TextToText(f_name_frozen_model=...).
+        1. f_name_frozen_model - имя выходного .pb файла '''
+        if self.model is None or isinstance(self.model, (FrozenModel, NumpySeq2Seq)):
+            print('[E] Для экспорта необходимо загрузить модель keras из .json и .h5 файлов')
+            return
+        export_frozen_model(self.model, f_name_frozen_model, self.stp.max_sequence_length, self.model_version)
+
+
+    def load_answer_table(self, f_name_answer_table):
+        ''' Загрузка таблицы заранее вычисленных ответов на вопросы из обучающей выборки (строится с помощью answer_table.py): ответы на
+        вопросы, которые есть в таблице, выдаются без прохода через сеть. Таблица, построенная для других весов модели, не загружается.
+        1. f_name_answer_table - имя .json файла с таблицей ответов '''
+
+        answer_table = AnswerTable(f_name_answer_table)
+        if answer_table.model_version != self.model_version:
+            print('[W] Таблица ответов %s построена для других весов модели и не будет использоваться' % f_name_answer_table)
+            return
+        self.answer_table = answer_table
+
+
+    def enable_buckets(self, buckets):
+        ''' Включение получения ответов с помощью групп по длине: вопрос передаётся в сеть без лишних <PAD> в начале - обрезанным до наименьшей
+        длины из buckets, в которую он помещается (количество слов + 2), что уменьшает время прохода кодера и вычисления внимания. Длина ответа
+        не меняется. Для модели keras для каждой длины создаётся копия модели с теми же весами (из .json файла модели), NumpySeq2Seq
+        обрабатывает вопросы любой длины. Сеть должна быть обучена с группами по длине (train(buckets=...)), иначе ответы могут измениться.
+        1. buckets - list из длин групп '''
+
+        if self.model is None or isinstance(self.model, FrozenModel) or (not isinstance(self.model, NumpySeq2Seq) and self.f_name_model is None):
+            print('[E] Группы по длине поддерживаются только для модели, загруженной из .json и .h5 файлов')
+            return
+        max_sequence_length = self.stp.max_sequence_length
+        buckets = sorted(set([ length for length in buckets if length < max_sequence_length ]))
+        self.bucket_models = {}
+        if not isinstance(self.model, NumpySeq2Seq):
+            model_weights = self.model.get_weights()
+            for length in buckets:
+                self.bucket_models[length] = load_keras_model(self.f_name_model, length)
+                self.bucket_models[length].set_weights(model_weights)
+        self.buckets = buckets + [max_sequence_length]
+        print('[i] Используются группы по длине: %s' % ', '.join([ str(length) for length in self.buckets ]))
+
+
+    def enable_response_cache(self, max_size=10000, ttl=3600):
+        ''' Включение кэша ответов: ответ на вопрос, который после предварительной обработки (SourceToPrepared.prepare_question()) совпадает
+        с уже заданным, берётся из кэша без прохода через сеть. Ключ - последовательность слов вопроса и версия модели.
+        1. max_size - максимальное количество хранимых ответов
+        2. ttl - время жизни ответа в секундах (если None - не ограничено) '''
+        self.response_cache = ResponseCache(max_size, ttl)
+
+
+    def start_batch_scheduler(self, max_batch_size=32, max_delay_ms=5):
+        ''' Включение объединения одновременных запросов к сети в пакеты: predict() из разных потоков ставит вопрос в очередь, а отдельный
+        поток выполняет один проход сети для всех вопросов, накопившихся за max_delay_ms мс (но не больше max_batch_size). Должен вызываться
+        из потока, в котором была загружена модель.
+        1. max_batch_size - максимальный размер пакета
+        2. max_delay_ms - максимальное время ожидания следующего вопроса (в мс) после получения первого вопроса пакета '''
+
+        if self.model is None:
+            print('[E] Сеть не загружена')
+            return
+        if self.batch_scheduler is not None:
+            self.stop_batch_scheduler()
+        # NumpySeq2Seq не использует граф tensorflow
+        context = get_default_graph().as_default if keras_version is not None and not isinstance(self.model, NumpySeq2Seq) else None
+        self.batch_scheduler = BatchScheduler(lambda batch: self.__model_predict(batch, len(batch)), max_batch_size, max_delay_ms, context)
+
+
+    def stop_batch_scheduler(self):
+        ''' Отключение объединения запросов к сети в пакеты. '''
+        if self.batch_scheduler is not None:
+            self.batch_scheduler.stop()
+            self.batch_scheduler = None
+
+
+    def warm_up(self, questions):
+        ''' Прогрев модели до первого запроса: вопросы проходят через сеть по одному и одним пакетом (без таблицы и кэша ответов), поэтому
+        создание функций keras, финализация графа tensorflow, выделение памяти и первые вызовы BLAS выполняются заранее. При работе с группами
+        по длине через сеть дополнительно проходит по одному вопросу каждой длины.
+        1. questions - list из строк с вопросами
+        2. возвращает время прогрева в секундах '''
+
+        if self.stp is None or self.w2v is None or self.model is None:
+            print('[E] Сеть не загружена')
+            return
+
+        start_time = time.time()
+        prepared_questions = [ self.stp.prepare_question(question) for question in questions ]
+        if self.buckets is not None:
+            # Вопрос из length-1 слов попадает в группу length (подробнее в get_sequence_lengths())
+            words = [ word for question in prepared_questions for word in question if word != '<PAD>' and word in self.w2v.word_index ]
+            words = words if len(words) > 0 else ['<EOS>']
+            max_sequence_length = self.stp.max_sequence_length
+            for length in self.buckets:
+                bucket_words = [ words[i % len(words)] for i in range(length - 1) ]
+                prepared_questions.append(['<PAD>'] * (max_sequence_length - len(bucket_words)) + bucket_words)
+
+        for question in prepared_questions:
+            self.predict_prepared([question], use_lookups=False)
+        self.predict_prepared(prepared_questions, use_lookups=False)
+        return time.time() - start_time
 
 
     def predict(self, question, return_lost_words=False):
-        ''' Предварительная обработка вопроса к сети, перевод его в вектор, получение ответа от сети и перевод его в строку.
+        ''' Предварительная обработка вопроса к сети, перевод его в вектор, получение ответа от сети и перевод его в строку (подробнее в predict_many()).
         1. question - строка с вопросом к сети
         2. return_lost_words - True, что бы вернуть список потерянных слов (которые отсутствуют в словаре и были удалены из результирующей последовательности)
         3. возвращает строку с ответом сети или, если return_lost_words=True, строку с ответом сети и list из потерянных слов '''
+
+        result = self.predict_many([question], return_lost_words)
+        if result is None:
+            return
+        if return_lost_words:
+            return result[0][0], result[1][0]
+        else:
+            return result[0]
+
+
+    def predict_many(self, questions, return_lost_words=False, batch_size=64):
+        ''' Получение ответов сети на список вопросов: вопросы проходят предварительную обработку, после чего ответы на них получаются
+        с помощью predict_prepared().
+        1. questions - list из строк с вопросами к сети
+        2. return_lost_words - True, что бы вернуть для каждого вопроса список потерянных слов (которые отсутствуют в словаре и были удалены
+        из результирующей последовательности)
+        3. batch_size - количество вопросов, обрабатываемых за один раз
+        4. возвращает list из строк с ответами сети (в порядке questions) или, если return_lost_words=True, list из строк с ответами и
+        list из list потерянных слов '''
         
         if self.stp is None or self.w2v is None or self.model is None:
             print('[E] Сеть не загружена')
             return
         
-        question = self.stp.prepare_question(question)
+        prepared_questions = [ self.stp.prepare_question(question) for question in questions ]
+        answers = self.predict_prepared(prepared_questions, batch_size)
         if return_lost_words:
-            question, lost_words = self.w2v.word2vec(question, True)
+            lost_words = [ [ word for word in question if word not in self.w2v.word_index ] for question in prepared_questions ]
+            return answers, lost_words
         else:
-            question = self.w2v.word2vec(question)
-        question = (question + 1.0) * 0.5
+            return answers
+
+
+    def predict_prepared(self, prepared_questions, batch_size=64, use_lookups=True):
+        ''' Получение ответов сети на список вопросов после предварительной обработки (SourceToPrepared.prepare_question()). Ответ ищется
+        в таблице ответов (если она загружена), затем в кэше ответов (если он включён), остальные вопросы обрабатываются частями по batch_size:
+        каждая часть кодируется, проходит через сеть и декодируется одной операцией (если включено объединение запросов в пакеты, то части
+        передаются в BatchScheduler).
+        1. prepared_questions - list из вопросов, каждый из которых является list из слов фиксированной длины
+        2. batch_size - количество вопросов, обрабатываемых за один раз
+        3. use_lookups - False: не использовать таблицу и кэш ответов (все вопросы проходят через сеть)
+        4. возвращает list из строк с ответами сети (в порядке prepared_questions) '''
+
+        answers = [None] * len(prepared_questions)
+        keys = [ (tuple(question), self.model_version) for question in prepared_questions ]
+        if use_lookups and self.answer_table is not None:
+            answers = [ self.answer_table.get(question) for question in prepared_questions ]
+        if use_lookups and self.response_cache is not None:
+            answers = [ answer if answer is not None else self.response_cache.get(key) for answer, key in zip(answers, keys) ]
+        # Одинаковые после предварительной обработки вопросы проходят через сеть один раз
+        missing = OrderedDict()
+        for i, answer in enumerate(answers):
+            if answer is None:
+                missing.setdefault(keys[i], []).append(i)
+        missing_keys = list(missing)
+
+        for start in range(0, len(missing_keys), batch_size):
+            batch_keys = missing_keys[start:start+batch_size]
+            batch_ids = self.w2v.sentences2ids([ list(key[0]) for key in batch_keys ], sequence_length=self.stp.max_sequence_length)
+            batch = (self.w2v.ids2vec(batch_ids) + 1.0) * 0.5
+
+            #plt.matshow(batch[0], cmap='inferno')
+            #plt.show()
 
-        #plt.matshow(question, cmap='inferno')
-        #plt.show()
+            if self.buckets is None:
+                batch_answers = self.__predict_vectors(batch, batch_size)
+            else:
+                # Каждая группа вопросов одинаковой длины обрезается и проходит через сеть отдельно
+                bucket_lengths = assign_buckets(get_sequence_lengths(self.w2v.word_index['<PAD>'], batch_ids), self.buckets)
+                batch_answers = None
+                for length in np.unique(bucket_lengths):
+                    indexes = np.flatnonzero(bucket_lengths == length)
+                    bucket_answers = self.__predict_vectors(batch[indexes, -length:], batch_size)
+                    if batch_answers is None:
+                        batch_answers = np.empty((len(batch),) + bucket_answers.shape[1:], dtype=bucket_answers.dtype)
+                    batch_answers[indexes] = bucket_answers
+
+            #plt.matshow(batch_answers[0], cmap='inferno')
+            #plt.show()
 
-        answer = self.model.predict(question[np.newaxis,:])
+            batch_answers = batch_answers * 2.0 - 1.0
+            for key, answer in zip(batch_keys, self.w2v.vec2word(batch_answers, stop_at_eos=True)):
+                answer = self.stp.prepare_answer(answer)
+                for i in missing[key]:
+                    answers[i] = answer
+                if use_lookups and self.response_cache is not None:
+                    self.response_cache.put(key, answer)
+        return answers
 
-        #plt.matshow(answer[0], cmap='inferno')
-        #plt.show()
 
-        answer = answer * 2.0 - 1.0
-        answer = self.w2v.vec2word(answer[0])
-        answer = self.stp.prepare_answer(answer)
-        if return_lost_words:
-            return answer, lost_words
-        else:
-            return answer
+    def __predict_vectors(self, x, batch_size):
+        ''' Получение ответов сети на вопросы x в виде векторов (через BatchScheduler, если включено объединение запросов в пакеты). '''
+        if self.batch_scheduler is not None:
+            return np.asarray(self.batch_scheduler.predict_many(x))
+        return self.__model_predict(x, batch_size)
+
+
+    def __model_predict(self, x, batch_size):
+        ''' Проход сети для вопросов x одинаковой длины: для длины меньше полной используется модель соответствующей группы (подробнее в
+        enable_buckets()). '''
+        model = self.bucket_models.get(x.shape[1], self.model)
+        return model.predict(x, batch_size=batch_size)
 
 # Субтитры (batch_size=32):
 # При 250.000 обучающих примеров пиковое потребление оперативной памяти 19Гб (44Гб при сохранении результатов), обучение займёт примерно 112 часов
@@ -388,6 +913,38 @@ class TextToText:
 # Глубина 2, 5000 примеров, 500 циклов, 5 эпох - ошибка 0.1332 (4358 из 5000 правильных ответов, точность 87.16%), вектор 500, эпох 500, время 5.6ч+15.8ч
 # Глубина 2, 10000 примеров, 500 циклов, 5 эпох - ошибка 0.1432 (8111 из 10000 правильных ответов, точность 81.11%), вектор 500, эпох 500, время 32.28ч
 
+def load_keras_model(f_name_model, input_length=None):
+    ''' Загрузка модели сети keras из .json файла f_name_model (без весов).
+    1. f_name_model - имя .json файла с моделью сети
+    2. input_length - длина входной последовательности (если None - как в f_name_model), длина выходной последовательности не меняется '''
+    with open(f_name_model, 'r') as f_model:
+        model_json = f_model.read()
+    if input_length is not None:
+        model_json = json.dumps(set_model_input_length(json.loads(model_json), input_length))
+    return model_from_json(model_json, custom_objects={'RecurrentSequential': RecurrentSequential, 
+                                                       '_OptionalInputPlaceHolder': _OptionalInputPlaceHolder,
+                                                       'LSTMDecoderCell': LSTMDecoderCell,
+                                                       'AttentionDecoderCell': AttentionDecoderCell})
+
+
+def set_model_input_length(config, input_length):
+    ''' Замена длины входной последовательности в конфигурации модели keras (прочитанной из .json файла) на input_length: изменяются
+    трёхмерные batch_input_shape и параметры input_length всех слоёв (output_length не меняется). Веса модели от длины не зависят.
+    1. возвращает изменённую config '''
+    if isinstance(config, dict):
+        for key, value in config.items():
+            if key == 'batch_input_shape' and isinstance(value, list) and len(value) == 3:
+                value[1] = input_length
+            elif key == 'input_length' and value is not None:
+                config[key] = input_length
+            else:
+                set_model_input_length(value, input_length)
+    elif isinstance(config, list):
+        for value in config:
+            set_model_input_length(value, input_length)
+    return config
+
+
 def main():
     f_name_plays = 'data/plays_ru/plays_ru.txt'
     f_name_subtitles = 'data/subtitles_ru/subtitles_ru.txt'
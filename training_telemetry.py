@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#       OS : GNU/Linux Ubuntu 16.04 or 18.04
+# LANGUAGE : Python 3.5.2 or later
+#   AUTHOR : Klim V. O.
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+'''
+Сбор показателей обучения модели в .jsonl файл (одна запись на строку): скорость обучения, время и ошибка каждой эпохи и каждого цикла,
+пиковое потребление оперативной памяти, время записи контрольных точек и время оценки точности. Записи нескольких запусков обучения
+дописываются в один файл и различаются полем run. Сравнение запусков выполняется с помощью summarize_telemetry() (или
+python3 training_telemetry.py файл1.jsonl [файл2.jsonl ...]).
+'''
+
+import os
+import sys
+import json
+import time
+import threading
+try:
+    from keras.callbacks import Callback
+except ImportError:
+    Callback = object
+
+
+class TrainingTelemetry:
+    ''' Предназначен для записи показателей одного запуска обучения. Может использоваться из нескольких потоков одновременно.
+    1. f_name_telemetry - имя .jsonl файла (записи дописываются в конец)
+    2. parameters - dict с параметрами запуска (глубина модели, размер вектора, размер пакета и т.д.), сохраняется в первой записи '''
+    def __init__(self, f_name_telemetry, parameters):
+        self.f_name_telemetry = f_name_telemetry
+        self.run = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.__lock = threading.Lock()
+        self.write('start', **parameters)
+
+
+    def write(self, event, **values):
+        ''' Запись события event со значениями values (к ним добавляются имя запуска, время и пиковое потребление памяти). '''
+        record = {'run': self.run, 'event': event, 'timestamp': time.time(), 'peak_rss_mb': get_peak_rss_mb()}
+        record.update(values)
+        with self.__lock:
+            with open(self.f_name_telemetry, 'a') as f_telemetry:
+                f_telemetry.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+class TelemetryCallback(Callback):
+    ''' Callback для fit_generator(), записывающий показатели каждой эпохи.
+    1. telemetry - TrainingTelemetry
+    2. num_examples - количество примеров в одной эпохе
+    3. sequence_length - длина последовательностей (при обучении с группами по длине задаётся перед обучением на каждой группе) '''
+    def __init__(self, telemetry, num_examples, sequence_length=None):
+        super().__init__()
+        self.telemetry = telemetry
+        self.num_examples = num_examples
+        self.sequence_length = sequence_length
+        self.cycle = 0
+        self.epoch_start_time = None
+
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch_start_time = time.time()
+
+
+    def on_epoch_end(self, epoch, logs=None):
+        epoch_time = time.time() - self.epoch_start_time
+        self.telemetry.write('epoch', cycle=self.cycle, epoch=epoch + 1, sequence_length=self.sequence_length, time=epoch_time,
+                             samples_per_second=self.num_examples / epoch_time, loss=float((logs or {}).get('loss', float('nan'))))
+
+
+def get_peak_rss_mb():
+    ''' Возвращает пиковый объём оперативной памяти, занятый текущим процессом (VmHWM из /proc/self/status), в Мб. '''
+    with open('/proc/self/status', 'r') as f_status:
+        for line in f_status:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def get_f_name_telemetry(f_name_model_weights):
+    ''' Возвращает имя .jsonl файла с показателями обучения для весов модели f_name_model_weights (например, для
+    data/plays_ru/model_weights_plays_ru.h5 - data/plays_ru/training_telemetry_plays_ru.jsonl). '''
+    f_name_telemetry = f_name_model_weights[:f_name_model_weights.rfind('/')+1] + \
+                       f_name_model_weights[f_name_model_weights.rfind('/')+1:].replace('model_weights_', 'training_telemetry_')
+    return os.path.splitext(f_name_telemetry)[0] + '.jsonl'
+
+
+def summarize_telemetry(f_names_telemetry):
+    ''' Вывод сводной таблицы по всем запускам обучения из .jsonl файлов f_names_telemetry: параметры запуска, средняя скорость обучения,
+    среднее время эпохи, последняя ошибка, пиковое потребление памяти, среднее время записи контрольной точки, время и результат оценки.
+    1. f_names_telemetry - list из имён .jsonl файлов (или имя одного файла)
+    2. возвращает list из dict с показателями каждого запуска '''
+
+    if isinstance(f_names_telemetry, str):
+        f_names_telemetry = [f_names_telemetry]
+    runs = {}
+    for f_name_telemetry in f_names_telemetry:
+        with open(f_name_telemetry, 'r') as f_telemetry:
+            for line in f_telemetry:
+                if line.strip():
+                    record = json.loads(line)
+                    runs.setdefault((f_name_telemetry, record['run']), []).append(record)
+
+    summaries = []
+    for (f_name_telemetry, run), records in runs.items():
+        parameters = next(( record for record in records if record['event'] == 'start' ), {})
+        epochs = [ record for record in records if record['event'] == 'epoch' ]
+        checkpoints = [ record for record in records if record['event'] == 'checkpoint' ]
+        assessments = [ record for record in records if record['event'] == 'assessment' ]
+        summaries.append({'f_name_telemetry': f_name_telemetry, 'run': run,
+                          'depth_model': parameters.get('depth_model'), 'vec_size': parameters.get('vec_size'),
+                          'batch_size': parameters.get('batch_size'), 'num_examples': parameters.get('num_examples'),
+                          'number_epochs': len(epochs),
+                          'samples_per_second': mean([ record['samples_per_second'] for record in epochs ]),
+                          'epoch_time': mean([ record['time'] for record in epochs ]),
+                          'loss': epochs[-1]['loss'] if len(epochs) > 0 else None,
+                          'peak_rss_mb': max([ record['peak_rss_mb'] for record in records ]),
+                          'checkpoint_write_time': mean([ record['write_time'] for record in checkpoints ]),
+                          'assessment_time': assessments[-1]['time'] if len(assessments) > 0 else None,
+                          'accuracy': assessments[-1]['accuracy'] if len(assessments) > 0 else None})
+
+    print('[i] Сравнение запусков обучения:')
+    for summary in summaries:
+        print('\t%s (%s): глубина %s, вектор %s, пакет %s, примеров %s' % (summary['run'], summary['f_name_telemetry'], summary['depth_model'],
+              summary['vec_size'], summary['batch_size'], summary['num_examples']))
+        print('\t\tэпох %i, %s примеров/с, эпоха %s с, ошибка %s, пиковая память %.2f Мб, запись контрольной точки %s с' % (
+              summary['number_epochs'], format_value(summary['samples_per_second']), format_value(summary['epoch_time']),
+              format_value(summary['loss'], '%.4f'), summary['peak_rss_mb'], format_value(summary['checkpoint_write_time'])))
+        if summary['accuracy'] is not None:
+            print('\t\tоценка точности: %.2f%% за %.2f с' % (summary['accuracy'], summary['assessment_time']))
+    return summaries
+
+
+def mean(values):
+    ''' Возвращает среднее значение values или None, если values пуст. '''
+    return sum(values) / len(values) if len(values) > 0 else None
+
+
+def format_value(value, format_string='%.2f'):
+    ''' Возвращает value в виде строки по format_string или '-', если value равно None. '''
+    return format_string % value if value is not None else '-'
+
+
+def main():
+    if len(sys.argv) > 1:
+        summarize_telemetry(sys.argv[1:])
+    else:
+        summarize_telemetry('data/plays_ru/training_telemetry_plays_ru.jsonl')
+
+
+if __name__ == '__main__':
+    main()
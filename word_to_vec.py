@@ -11,14 +11,23 @@
 кодировщик word2vec из библиотеки gensim.
 '''
 
-import pickle
+import json
 import multiprocessing
 import os
 import sys
+import time
 import curses
 import logging as log
 import numpy as np
-from gensim.models import word2vec
+try:
+    from gensim.models import word2vec
+except ImportError:
+    # Без gensim доступна только загрузка модели, сохранённой с помощью save_w2v_store() (обучение и загрузка .bin модели недоступны)
+    word2vec = None
+
+from ann_index import AnnIndex, get_f_name_ann_index
+from encoded_sample import get_f_names_enc_training_sample, get_f_name_enc_training_sample_info
+from prepared_corpus import PreparedCorpus, iter_prepared_pairs, load_prepared_pairs, write_prepared_pairs
 
 
 curses.setupterm()
@@ -26,14 +35,37 @@ curses.setupterm()
 
 class WordToVec:
     ''' Позволяет переводить последовательности слов (предложений) в вектора и наоборот. Если объект класса используется только для
-    кодирования предложений для работы с обученной сетью, то нужно указать имя файла с .bin моделью f_name_w2v_model. '''
-    def __init__(self, f_name_w2v_model=None):
+    кодирования предложений для работы с обученной сетью, то нужно указать имя файла с .bin моделью f_name_w2v_model. Если рядом с .bin
+    моделью есть её копия в формате .npy (создаётся при первой загрузке .bin модели или с помощью save_w2v_store()), то загружается она:
+    матрица векторов открывается через mmap и разделяется всеми процессами, которые её используют.
+    quantization - режим хранения векторов: None (float32), 'float16' или 'int8' (с масштабом для каждой строки матрицы), используется и для
+    кодирования, и для декодирования (подробнее в quantize()) '''
+    def __init__(self, f_name_w2v_model=None, quantization=None):
+        self.model = None
+        self.f_name_w2v_store = None
+        self.ann_index = None
+        self.quantization = None
+        self.vectors_scale = None
+        self.decode_scale = None
+        self.decode_ids = None
         if f_name_w2v_model is not None:
-            print('[i] Загрузка модели word2vec из %s...' % f_name_w2v_model)
-            self.model = word2vec.Word2VecKeyedVectors.load_word2vec_format(f_name_w2v_model, binary=True)
-            #self.model.init_sims(replace=True) # Оптимизация, что бы модель word2vec занимала в оперативной памяти меньше места
-            vocabulary = [ w for w in self.model.wv.vocab.keys() ]
-            print('[i] Размер словаря word2vec: %i слов' % len(vocabulary))
+            f_name_w2v_store = get_f_name_w2v_store(f_name_w2v_model)
+            if os.path.isfile(f_name_w2v_store) and (not os.path.isfile(f_name_w2v_model) or \
+                                                     os.path.getmtime(f_name_w2v_store) >= os.path.getmtime(f_name_w2v_model)):
+                self.__load_w2v_store(f_name_w2v_store)
+            else:
+                print('[i] Загрузка модели word2vec из %s...' % f_name_w2v_model)
+                self.model = word2vec.Word2VecKeyedVectors.load_word2vec_format(f_name_w2v_model, binary=True)
+                #self.model.init_sims(replace=True) # Оптимизация, что бы модель word2vec занимала в оперативной памяти меньше места
+                self.__build_matrices()
+                # При следующих запусках модель будет загружаться через mmap
+                try:
+                    self.save_w2v_store(f_name_w2v_model)
+                except OSError as error:
+                    print('[W] Не удалось сохранить модель word2vec для быстрой загрузки: %s' % error)
+            print('[i] Размер словаря word2vec: %i слов' % len(self.index2word))
+            if quantization is not None:
+                self.quantize(quantization)
 
 
     def build_word2vec(self, f_name_training_sample, f_name_prepared_subtitles=None, f_name_enc_training_sample=None, f_name_w2v_model=None, 
@@ -41,7 +73,7 @@ class WordToVec:
         ''' Предназначен для построения модели word2vec и кодирования обучающей выборки в вектора.
         1. f_name_training_sample - имя входного .pkl файла с предварительно обработанными парами [вопрос,ответ]
         2. f_name_prepared_subtitles - имя .pkl файла с предварительно обработанными субтитрами (для расширения словаря модели word2vec)
-        3. f_name_enc_training_sample - имя выходного .npz файла с векторным представлением слов в парах [вопрос,ответ] (по умолчанию encoded_+f_name_training_sample+.npz)
+        3. f_name_enc_training_sample - имя выходной закодированной выборки с векторным представлением слов в парах [вопрос,ответ] (по умолчанию encoded_+f_name_training_sample+.npz)
         4. f_name_w2v_model - имя .bin файла для сохранения обученной модели word2vec (по умолчанию w2v_model_+f_name_training_sample+.bin)
         5. f_name_w2v_vocab - имя .txt файла для сохранения словаря word2vec (по умолчанию w2v_vocabulary_+f_name_training_sample+.txt)
         6. len_encode - если None: закодировать весь f_name_training_sample, иначе - первые len_encode элементов
@@ -54,6 +86,93 @@ class WordToVec:
         Входные предложения должны иметь вид, например: [['<PAD>', ..., '<PAD>', '?', 'класс', 'этот', 'нужен', 'Зачем', '<GO>'], 
         ['Для', 'кодирования', 'предложений', '<EOS>', '<PAD>', ..., '<PAD>']] '''
         
+        f_name_enc_training_sample, f_name_w2v_model, f_name_w2v_vocab = self.__get_f_names(f_name_training_sample, f_name_enc_training_sample,
+                                                                                           f_name_w2v_model, f_name_w2v_vocab)
+
+        # Предложения читаются из .pkl файлов потоком при каждом проходе, поэтому субтитры не загружаются в оперативную память целиком
+        corpus = PreparedCorpus([f_name_prepared_subtitles, f_name_training_sample])
+        print('[i] Чтение данных из %s' % ', '.join(corpus.f_names_prepared))
+        vocabulary = corpus.count_vocabulary()
+        print('\tпредполагаемый размер полного словаря: %i слов' % len(vocabulary))
+
+        self.__w2v_fit(corpus, vocabulary, f_name_w2v_model, min_count_repeat, size, window, epochs, logging)
+        del vocabulary
+        self.__build_matrices()
+        self.save_w2v_store(f_name_w2v_model)
+
+        print('[i] Загрузка данных из %s' % f_name_training_sample)
+        dataset = load_prepared_pairs(f_name_training_sample, len_encode)
+        print('\tколичество предложений: %i пар' % len(dataset))
+        print('\tдлинна предложений: %i слов' % len(dataset[0][0]))
+
+        print('[i] Размер словаря word2vec: %i слов' % len(self.index2word))
+        self.__save_vocabulary(f_name_w2v_vocab)
+
+        # Оптимизация, что бы модель word2vec занимала в оперативной памяти меньше места (почему-то искажает декодировку векторов в слова)
+        #self.model = self.model.wv
+        #self.model.init_sims(replace=True)
+
+        self.data_w2v_encode(dataset, f_name_enc_training_sample, len_encode)
+
+
+    def update_word2vec(self, f_name_new_training_sample, f_name_training_sample, f_name_enc_training_sample=None, f_name_w2v_model=None,
+                        f_name_w2v_vocab=None, epochs=5, logging=False):
+        ''' Предназначен для дополнения уже построенной модели word2vec и закодированной обучающей выборки новыми парами [вопрос,ответ] без
+        переобучения с нуля. Загружается полная модель word2vec (сохраняется build_word2vec() рядом с .bin моделью), её словарь дополняется
+        новыми словами, после чего модель дообучается только на новых парах. Новые слова добавляются в конец словаря, поэтому индексы уже
+        закодированных слов не меняются: кодируются только новые пары, которые дописываются в конец закодированной выборки и в конец
+        f_name_training_sample.
+        1. f_name_new_training_sample - имя .pkl файла с новыми предварительно обработанными парами [вопрос,ответ] (той же длины, что и в
+        f_name_training_sample)
+        2. f_name_training_sample - имя .pkl файла с парами, на которых была построена модель word2vec (используется для имён файлов по умолчанию)
+        3. f_name_enc_training_sample - имя закодированной выборки (по умолчанию encoded_+f_name_training_sample+.npz)
+        4. f_name_w2v_model - имя .bin файла с моделью word2vec (по умолчанию w2v_model_+f_name_training_sample+.bin)
+        5. f_name_w2v_vocab - имя .txt файла для сохранения словаря word2vec (по умолчанию w2v_vocabulary_+f_name_training_sample+.txt)
+        6. epochs - число эпох дообучения модели word2vec на новых парах
+        7. logging - включение вывода данных в процессе обучения модели word2vec '''
+
+        f_name_enc_training_sample, f_name_w2v_model, f_name_w2v_vocab = self.__get_f_names(f_name_training_sample, f_name_enc_training_sample,
+                                                                                           f_name_w2v_model, f_name_w2v_vocab)
+        f_name_w2v_full_model = get_f_name_w2v_full_model(f_name_w2v_model)
+        if not os.path.isfile(f_name_w2v_full_model):
+            print("[E] Файл '%s' не существует, модель word2vec необходимо построить с помощью build_word2vec()" % f_name_w2v_full_model)
+            return
+
+        if logging:
+            log.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=log.INFO)
+        print('[i] Загрузка модели word2vec из %s...' % f_name_w2v_full_model)
+        self.model = word2vec.Word2Vec.load(f_name_w2v_full_model)
+        old_vocabulary_size = len(self.model.wv.index2word)
+
+        corpus = PreparedCorpus(f_name_new_training_sample)
+        print('[i] Чтение данных из %s' % f_name_new_training_sample)
+        vocabulary = corpus.count_vocabulary()
+        self.model.build_vocab_from_freq(vocabulary, corpus_count=corpus.number_sentences, update=True)
+        del vocabulary
+        print('[i] Добавлено в словарь word2vec: %i слов' % (len(self.model.wv.index2word) - old_vocabulary_size))
+
+        print('[i] Дообучение модели word2vec...')
+        self.model.train(corpus, epochs=epochs, total_examples=corpus.number_sentences)
+        self.model.save(f_name_w2v_full_model)
+        self.model.wv.save_word2vec_format(f_name_w2v_model, binary=True)
+        self.__build_matrices()
+        self.save_w2v_store(f_name_w2v_model)
+        print('[i] Размер словаря word2vec: %i слов' % len(self.index2word))
+        self.__save_vocabulary(f_name_w2v_vocab)
+        if os.path.isfile(get_f_name_ann_index(f_name_w2v_model)):
+            print('[W] Индекс %s построен для старого словаря, его необходимо построить заново' % get_f_name_ann_index(f_name_w2v_model))
+
+        print('[i] Загрузка данных из %s' % f_name_new_training_sample)
+        dataset = load_prepared_pairs(f_name_new_training_sample)
+        print('\tколичество предложений: %i пар' % len(dataset))
+        if self.data_w2v_encode(dataset, f_name_enc_training_sample, append=True):
+            print('[i] Добавление новых пар в %s' % f_name_training_sample)
+            write_prepared_pairs(dataset, f_name_training_sample, append=True)
+
+
+    def __get_f_names(self, f_name_training_sample, f_name_enc_training_sample, f_name_w2v_model, f_name_w2v_vocab):
+        ''' Возвращает имена закодированной выборки, .bin файла модели word2vec и .txt файла словаря (заданные или по умолчанию, на основе
+        f_name_training_sample). '''
         if f_name_enc_training_sample is None:
             f_name_enc_training_sample = f_name_training_sample.replace('prepared_', 'encoded_')
             f_name_enc_training_sample = f_name_enc_training_sample.replace('.pkl', '.npz')
@@ -63,59 +182,15 @@ class WordToVec:
         if f_name_w2v_vocab is None:
             f_name_w2v_vocab = f_name_training_sample.replace('prepared_', 'w2v_vocabulary_')
             f_name_w2v_vocab = f_name_w2v_vocab.replace('.pkl', '.txt')
+        return f_name_enc_training_sample, f_name_w2v_model, f_name_w2v_vocab
 
-        if f_name_prepared_subtitles is not None:
-            print('[i] Загрузка субтитров из %s' % f_name_prepared_subtitles)
-            with open(f_name_prepared_subtitles, 'rb') as f_subtitles:
-                subtitles = pickle.load(f_subtitles)
 
-            print('\tколичество предложений: %i пар' % len(subtitles))
-            print('\tдлинна предложений: %i слов' % len(subtitles[0][0]))
-
-        print('[i] Загрузка данных из %s' % f_name_training_sample)
-        with open(f_name_training_sample, 'rb') as f_training_sample:
-            training_sample = pickle.load(f_training_sample)
-
-        print('\tколичество предложений: %i пар' % len(training_sample))
-        print('\tдлинна предложений: %i слов' % len(training_sample[0][0]))
-        
-        if f_name_prepared_subtitles is not None:
-            print('[i] Объединение...')
-            dataset = subtitles + training_sample
-        else:
-            dataset = training_sample
-
-        print('[i] Подсчёт размера полного словаря...')
-        i = 0
-        vocabulary = []
-        for pair in dataset:
-            if i % 1000 == 0 or i == len(dataset) - 1:
-                os.write(sys.stdout.fileno(), curses.tigetstr('cuu1'))
-                print('[i] Подсчёт размера полного словаря... %i из %i' % (i, len(dataset)))
-            for sentence in pair:
-                for word in sentence:
-                    vocabulary.append(word)
-            i += 1
-        os.write(sys.stdout.fileno(), curses.tigetstr('cuu1'))
-        print('[i] Подсчёт размера полного словаря... %i из %i' % (len(dataset), len(dataset)))
-        vocabulary = set(vocabulary)
-        print('\tпредполагаемый размер полного словаря: %i слов' % len(vocabulary))
-        
-        self.__w2v_fit(dataset, f_name_w2v_model, min_count_repeat, size, window, epochs, logging)
-        dataset = training_sample
-
-        vocabulary = [ w for w in self.model.wv.vocab.keys() ]
-        print('[i] Размер словаря word2vec: %i слов' % len(vocabulary))
+    def __save_vocabulary(self, f_name_w2v_vocab):
+        ''' Сохранение словаря word2vec в .txt файл f_name_w2v_vocab (одно слово в строке). '''
         with open(f_name_w2v_vocab, 'w') as f_w2v_vocab:
-            for word in vocabulary:
+            for word in self.index2word:
                 print(word, file=f_w2v_vocab)
 
-        # Оптимизация, что бы модель word2vec занимала в оперативной памяти меньше места (почему-то искажает декодировку векторов в слова)
-        #self.model = self.model.wv
-        #self.model.init_sims(replace=True)
-
-        self.data_w2v_encode(dataset, f_name_enc_training_sample, len_encode)
-
 
     def word2vec(self, sentence, return_lost_words=False):
         ''' Кодирует последовательность фиксированного размера в вектор. 
@@ -123,127 +198,492 @@ class WordToVec:
         2. return_lost_words - True, что бы вернуть список потерянных слов (которые отсутствуют в словаре и были удалены из результирующей последовательности)
         2. возвращает вектор в виде array или, если return_lost_words=True, вектор в виде array и list из потерянных слов '''
 
-        result = []
-        lost_words = []
-        for word in sentence:
-            try:
-                result.append(self.model[word])
-            except KeyError:
-                lost_words.append(word)
-                result.insert(0, self.model['<PAD>'])
+        ids, lost_words = self.sentences2ids([sentence], return_lost_words=True)
         if return_lost_words:
-            return np.array(result), lost_words
+            return self.ids2vec(ids[0]), lost_words
         else:
-            return np.array(result)
-
-
-    def vec2word(self, answer):
-        ''' Декодирует вектор в последовательность фиксированного размера. 
-        1. answer - ответ сети в виде вектора
-        2. возвращает последовательность фиксированного размера '''
-        answ_seq = [ self.model.similar_by_vector(v)[0][0] for v in answer ]
-        return answ_seq
+            return self.ids2vec(ids[0])
+
+
+    def sentences2ids(self, sentences, is_answers=False, return_lost_words=False, sequence_length=None):
+        ''' Переводит пакет последовательностей фиксированного размера в матрицу индексов слов (для последующего перевода в вектора с помощью
+        ids2vec() одной операцией). Слова, которых нет в словаре, удаляются, а вместо них добавляется <PAD>: в начало вопроса или перед последним
+        уже закодированным словом ответа. Последовательности другой длины приводятся к sequence_length: у вопроса удаляются или добавляются <PAD>
+        слова в начале, у ответа - в конце.
+        1. sentences - list из последовательностей фиксированного размера
+        2. is_answers - True, если sentences - ответы (влияет на место добавления <PAD>)
+        3. return_lost_words - True, что бы вернуть список потерянных слов
+        4. sequence_length - длина последовательностей (None - длина самой длинной последовательности)
+        5. возвращает array из индексов размерностью (len(sentences), sequence_length) или, если return_lost_words=True, array из индексов
+        и list из потерянных слов '''
+
+        if sequence_length is None:
+            sequence_length = max([ len(sentence) for sentence in sentences ] + [0])
+        if any([ len(sentence) != sequence_length for sentence in sentences ]):
+            sentences = [ self.__fit_length(sentence, sequence_length, is_answers) for sentence in sentences ]
+
+        word_index = self.word_index
+        ids = np.array([ [ word_index.get(word, -1) for word in sentence ] for sentence in sentences ], dtype=np.int32)
+        ids = ids.reshape(len(sentences), -1)
 
+        lost_words = []
+        pad_id = word_index['<PAD>']
+        for i in np.flatnonzero((ids < 0).any(axis=1)):
+            lost_words += [ sentences[i][j] for j in np.flatnonzero(ids[i] < 0) ]
+            current_sentence = []
+            for word_id in ids[i]:
+                if word_id >= 0:
+                    current_sentence.append(word_id)
+                elif is_answers:
+                    current_sentence.insert(-1, pad_id)
+                else:
+                    current_sentence.insert(0, pad_id)
+            ids[i] = current_sentence
 
-    def __w2v_fit(self, dataset, f_name_w2v_model, min_count_repeat, v_size, window_size, epochs, logging):
+        if return_lost_words:
+            return ids, lost_words
+        else:
+            return ids
+
+
+    def __fit_length(self, sentence, sequence_length, is_answer=False):
+        ''' Приведение последовательности к длине sequence_length: у вопроса удаляются слова или добавляется <PAD> в начале (последним
+        остаётся <GO>), у ответа - в конце. '''
+        if is_answer:
+            return list(sentence[:sequence_length]) + ['<PAD>'] * (sequence_length - len(sentence))
+        return ['<PAD>'] * (sequence_length - len(sentence)) + list(sentence[max(len(sentence) - sequence_length, 0):])
+
+
+    def vec2word(self, answer, exact=False, stop_at_eos=False):
+        ''' Декодирует вектор в последовательность фиксированного размера. Поиск ближайших слов для всех позиций выполняется одним
+        матричным умножением на матрицу нормированных векторов словаря (или с помощью индекса, если он загружен).
+        1. answer - ответ сети в виде вектора размерностью (max_sequence_length, size) или пакет ответов (batch_size, max_sequence_length, size)
+        2. exact - True: всегда использовать точный поиск, даже если загружен индекс для приближённого поиска
+        3. stop_at_eos - True: не декодировать позиции после первого <EOS> (вместо них возвращается <PAD>, подробнее в vec2ids_to_eos())
+        4. возвращает последовательность фиксированного размера или list из последовательностей для пакета ответов '''
+        ids = self.vec2ids_to_eos(answer, exact) if stop_at_eos else self.vec2ids(answer, exact)
+        if ids.ndim == 1:
+            return [ self.index2word[i] for i in ids ]
+        return [ [ self.index2word[i] for i in answ_ids ] for answ_ids in ids ]
+
+
+    def vec2ids(self, answer, exact=False, max_scores_size=2**24):
+        ''' Поиск индексов ближайших (по косинусному расстоянию) слов в словаре для каждого вектора из answer.
+        1. answer - array из векторов любой размерности, последнее измерение - size
+        2. exact - True: всегда использовать точный поиск, даже если загружен индекс для приближённого поиска
+        3. max_scores_size - максимальный размер промежуточной матрицы схожести (ограничивает потребление памяти при декодировании больших пакетов)
+        4. возвращает array из индексов слов размерностью answer.shape[:-1] '''
+
+        answer = np.asarray(answer, dtype=np.float32)
+        vectors = answer.reshape(-1, answer.shape[-1])
+        if self.ann_index is not None and not exact:
+            return self.ann_index.search(vectors, self.decode_matrix, decode_scale=self.decode_scale).reshape(answer.shape[:-1])
+
+        ids = np.empty(len(vectors), dtype=np.int64)
+        if self.decode_matrix.dtype == np.float32:
+            step = max(1, max_scores_size // len(self.decode_matrix))
+            for i in range(0, len(vectors), step):
+                ids[i:i+step] = np.dot(vectors[i:i+step], self.decode_matrix.T).argmax(axis=1)
+        else:
+            # Квантованная матрица переводится в float32 по частям, что бы не создавать её полную копию
+            best_scores = np.full(len(vectors), -np.inf, dtype=np.float32)
+            step = max(1, min(2**16, max_scores_size // max(1, len(vectors))))
+            for i in range(0, len(self.decode_matrix), step):
+                scores = self.__decode_scores(vectors, i, i+step)
+                chunk_ids = scores.argmax(axis=1)
+                chunk_best_scores = scores[np.arange(len(vectors)), chunk_ids]
+                better = chunk_best_scores > best_scores
+                ids[better] = chunk_ids[better] + i
+                best_scores[better] = chunk_best_scores[better]
+        if self.decode_ids is not None:
+            ids = self.decode_ids[ids]
+        return ids.reshape(answer.shape[:-1])
+
+
+    def vec2ids_to_eos(self, answer, exact=False, eos_threshold=0.5, segment_size=4):
+        ''' Поиск индексов ближайших слов только до первого <EOS> в каждом ответе (SourceToPrepared.prepare_answer() всё равно отбрасывает
+        слова после него). Предполагаемая позиция <EOS> - первая позиция, косинусная близость которой к вектору <EOS> не меньше eos_threshold
+        (одно скалярное произведение на позицию). Позиции до неё декодируются полностью; если <EOS> среди них не оказалось, следующие позиции
+        декодируются частями по segment_size до первого <EOS>, поэтому результат до <EOS> всегда совпадает с vec2ids().
+        1. answer - ответ сети размерностью (max_sequence_length, size) или пакет ответов (batch_size, max_sequence_length, size)
+        2. exact - True: всегда использовать точный поиск, даже если загружен индекс для приближённого поиска
+        3. eos_threshold - порог косинусной близости к <EOS>
+        4. segment_size - количество позиций, декодируемых за раз после неверно предсказанной позиции <EOS>
+        5. возвращает array из индексов слов размерностью answer.shape[:-1], где все позиции после первого <EOS> равны <PAD> '''
+
+        answer = np.asarray(answer, dtype=np.float32)
+        answers = answer.reshape((-1,) + answer.shape[-2:])
+        number_answers, sequence_length = answers.shape[:2]
+        eos_id = self.word_index['<EOS>']
+        pad_id = self.word_index['<PAD>']
+
+        eos_vector = self.ids2vec(eos_id)
+        eos_similarity = np.dot(answers, eos_vector) / (np.linalg.norm(answers, axis=2) * np.linalg.norm(eos_vector) + 1e-12)
+        is_candidate = eos_similarity >= eos_threshold
+        end = np.where(is_candidate.any(axis=1), is_candidate.argmax(axis=1) + 1, sequence_length)
+
+        ids = np.full((number_answers, sequence_length), pad_id, dtype=np.int64)
+        number_decoded = np.zeros(number_answers, dtype=np.int64)
+        active = np.arange(number_answers)
+        while len(active) > 0:
+            rows = np.repeat(active, end[active] - number_decoded[active])
+            columns = np.concatenate([ np.arange(number_decoded[i], end[i]) for i in active ])
+            ids[rows, columns] = self.vec2ids(answers[rows, columns], exact)
+            number_decoded[active] = end[active]
+            is_done = (ids[active] == eos_id).any(axis=1) | (number_decoded[active] >= sequence_length)
+            active = active[~is_done]
+            end[active] = np.minimum(number_decoded[active] + segment_size, sequence_length)
+
+        # Слова после первого <EOS> (декодированные в той же части) заменяются на <PAD>
+        is_eos = ids == eos_id
+        first_eos = np.where(is_eos.any(axis=1), is_eos.argmax(axis=1), sequence_length)
+        ids[np.arange(sequence_length) > first_eos[:, np.newaxis]] = pad_id
+        return ids.reshape(answer.shape[:-1])
+
+
+    def ids2vec(self, ids):
+        ''' Перевод индексов слов в вектора (для квантованной матрицы векторов - с восстановлением масштаба).
+        1. ids - индекс слова или array из индексов любой размерности
+        2. возвращает array из векторов float32 размерностью ids.shape + (size,) '''
+        result = np.asarray(self.vectors[ids], dtype=np.float32)
+        if self.vectors_scale is not None:
+            result = result * self.vectors_scale[ids][..., np.newaxis]
+        return result
+
+
+    def quantize(self, quantization):
+        ''' Перевод матрицы векторов и матрицы нормированных векторов в более компактный формат. Уменьшает объём занимаемой памяти в 2 раза
+        для 'float16' и в 4 раза для 'int8'. Квантованные матрицы хранятся в памяти процесса (не через mmap).
+        1. quantization - 'float16' или 'int8' (каждая строка матрицы хранится в int8 вместе с масштабом max(abs(строка))/127) '''
+
+        if self.quantization is not None:
+            print('[E] Модель word2vec уже квантована (%s)' % self.quantization)
+            return
+        if quantization == 'float16':
+            self.vectors = np.asarray(self.vectors, dtype=np.float16)
+            self.decode_matrix = np.asarray(self.decode_matrix, dtype=np.float16)
+        elif quantization == 'int8':
+            self.vectors, self.vectors_scale = self.__quantize_int8(self.vectors)
+            self.decode_matrix, self.decode_scale = self.__quantize_int8(self.decode_matrix)
+        else:
+            print("[E] Неподдерживаемый режим квантования '%s', возможные варианты: float16, int8" % quantization)
+            return
+        self.quantization = quantization
+        print('[i] Модель word2vec квантована в %s, размер матриц: %.2f Мб' % (quantization, (self.vectors.nbytes + self.decode_matrix.nbytes)/1024/1024))
+
+
+    def __quantize_int8(self, matrix, step=2**16):
+        ''' Квантование матрицы в int8 с отдельным масштабом для каждой строки (выполняется по частям). '''
+        result = np.empty(matrix.shape, dtype=np.int8)
+        scale = np.empty(len(matrix), dtype=np.float32)
+        for i in range(0, len(matrix), step):
+            rows = np.asarray(matrix[i:i+step], dtype=np.float32)
+            max_abs = np.abs(rows).max(axis=1)
+            max_abs[max_abs == 0.0] = 1.0
+            scale[i:i+step] = max_abs / 127.0
+            result[i:i+step] = np.round(rows / scale[i:i+step, np.newaxis])
+        return result, scale
+
+
+    def __decode_scores(self, vectors, start, end):
+        ''' Вычисление схожести vectors со словами из строк start:end матрицы нормированных векторов (с учётом квантования). '''
+        scores = np.dot(vectors, np.asarray(self.decode_matrix[start:end], dtype=np.float32).T)
+        if self.decode_scale is not None:
+            scores *= self.decode_scale[start:end]
+        return scores
+
+
+    def restrict_decoding(self, f_name_training_sample):
+        ''' Ограничение декодирования словами, которые встречаются в ответах обучающей выборки (и служебными словами <PAD>, <GO>, <EOS>):
+        из матрицы нормированных векторов остаются только их строки. Слова, добавленные в словарь только для улучшения word2vec (например, из
+        субтитров), сеть всё равно не учится выдавать, а поиск по меньшей матрице выполняется быстрее. Кодирование вопросов не меняется.
+        1. f_name_training_sample - имя .pkl файла с предварительно обработанными парами [вопрос,ответ] '''
+
+        if self.decode_ids is not None:
+            print('[E] Декодирование уже ограничено словами из ответов')
+            return
+
+        words = set(['<PAD>', '<GO>', '<EOS>'])
+        for question, answer in iter_prepared_pairs(f_name_training_sample):
+            words.update(answer)
+        decode_ids = np.array(sorted([ self.word_index[word] for word in words if word in self.word_index ]), dtype=np.int64)
+
+        number_words = len(self.decode_matrix)
+        self.decode_matrix = np.asarray(self.decode_matrix[decode_ids])
+        if self.decode_scale is not None:
+            self.decode_scale = self.decode_scale[decode_ids]
+        self.decode_ids = decode_ids
+        if self.ann_index is not None:
+            print('[W] Индекс для приближённого поиска построен для полного словаря и больше не используется')
+            self.ann_index = None
+        print('[i] Декодирование ограничено словами из ответов: %i из %i слов' % (len(decode_ids), number_words))
+
+
+    def load_ann_index(self, f_name_ann_index, nprobe=8):
+        ''' Загрузка индекса для приближённого поиска ближайших слов (строится заранее с помощью ann_index.py). После загрузки vec2word()
+        по умолчанию использует приближённый поиск.
+        1. f_name_ann_index - имя .npz файла с индексом
+        2. nprobe - количество просматриваемых при поиске кластеров '''
+        if self.decode_ids is not None:
+            print('[E] Индекс для приближённого поиска не поддерживается при декодировании, ограниченном словами из ответов')
+            return
+        self.ann_index = AnnIndex(f_name_ann_index, nprobe)
+        if self.ann_index.list_offsets[-1] != len(self.decode_matrix):
+            print('[E] Индекс %s построен для другой модели word2vec' % f_name_ann_index)
+            self.ann_index = None
+
+
+    def save_w2v_store(self, f_name_w2v_model):
+        ''' Сохранение загруженной модели word2vec в формате, который загружается через mmap: матрица векторов в .npy, матрица нормированных
+        векторов в _norm.npy и словарь в _vocab.txt (одно слово в строке, в порядке строк матрицы). Например, для data/plays_ru/w2v_model_plays_ru.bin
+        будут созданы data/plays_ru/w2v_model_plays_ru.npy, data/plays_ru/w2v_model_plays_ru_norm.npy и data/plays_ru/w2v_model_plays_ru_vocab.txt
+        1. f_name_w2v_model - имя .bin файла с моделью word2vec, рядом с которым нужно сохранить результат '''
+
+        if self.quantization is not None:
+            print('[E] Сохранение квантованной модели word2vec не поддерживается')
+            return
+        if self.decode_ids is not None:
+            print('[E] Сохранение модели word2vec с ограниченным декодированием не поддерживается')
+            return
+
+        f_name_w2v_store = get_f_name_w2v_store(f_name_w2v_model)
+        print('[i] Сохранение модели word2vec в %s' % f_name_w2v_store)
+        with open(f_name_w2v_store.replace('.npy', '_vocab.txt'), 'w') as f_w2v_vocab:
+            for word in self.index2word:
+                print(word, file=f_w2v_vocab)
+        np.save(f_name_w2v_store.replace('.npy', '_norm.npy'), self.decode_matrix)
+        # Файл с векторами сохраняется последним, т.к. по нему проверяется наличие и актуальность сохранённой модели
+        np.save(f_name_w2v_store, np.asarray(self.vectors, dtype=np.float32))
+        self.f_name_w2v_store = f_name_w2v_store
+
+
+    def __load_w2v_store(self, f_name_w2v_store):
+        ''' Загрузка модели word2vec, сохранённой с помощью save_w2v_store(). Матрицы открываются только для чтения через mmap, поэтому
+        загрузка почти мгновенная, а все процессы, использующие одну и ту же модель, разделяют одну копию в страничном кэше. '''
+        print('[i] Загрузка модели word2vec из %s...' % f_name_w2v_store)
+        with open(f_name_w2v_store.replace('.npy', '_vocab.txt'), 'r') as f_w2v_vocab:
+            self.index2word = f_w2v_vocab.read().split('\n')[:-1]
+        self.word_index = { word:i for i, word in enumerate(self.index2word) }
+        self.vectors = np.load(f_name_w2v_store, mmap_mode='r')
+        self.decode_matrix = np.load(f_name_w2v_store.replace('.npy', '_norm.npy'), mmap_mode='r')
+        self.f_name_w2v_store = f_name_w2v_store
+
+
+    def __build_matrices(self):
+        ''' Построение словаря, матрицы векторов и матрицы нормированных векторов (float32) для декодирования векторов в слова. Выполняется один
+        раз после загрузки или обучения модели, что бы не нормировать словарь при каждом поиске. '''
+        self.index2word = self.model.wv.index2word
+        self.word_index = { word:i for i, word in enumerate(self.index2word) }
+        self.vectors = self.model.wv.vectors
+        self.decode_matrix = np.array(self.vectors, dtype=np.float32)
+        norms = np.linalg.norm(self.decode_matrix, axis=1, keepdims=True)
+        norms[norms == 0.0] = 1.0
+        self.decode_matrix /= norms
+
+
+    def __w2v_fit(self, corpus, vocabulary, f_name_w2v_model, min_count_repeat, v_size, window_size, epochs, logging):
         ''' Обучение модели word2vec и сохранение полученной модели в f_name_w2v_model.
-        1. dataset - list из преложений, каждое из которых является list из слов (один элемент list[i][j] = одно слово)
-        2. f_name_w2v_model - имя .bin файла для сохранения обученной модели word2vec
-        3. min_count_repeat - минимальное количество повторений (частота повторений) слова, что бы оно было включено в словарь
-        4. v_size - размерность вектора, которым кодируется одно слово
-        5. window_size - максимальное расстояние между текущим и прогнозируемым словом в предложении
-        6. epochs - число эпох обучения модели word2vec (если None, используется внутренний итератор)
-        7. logging - вывод данных в процессе обучения модели word2vec '''
+        1. corpus - перезапускаемый итератор по предложениям (PreparedCorpus), каждое из которых является list из слов
+        2. vocabulary - частота слов в corpus (результат PreparedCorpus.count_vocabulary()), по ней строится словарь без отдельного прохода по corpus
+        3. f_name_w2v_model - имя .bin файла для сохранения обученной модели word2vec
+        4. min_count_repeat - минимальное количество повторений (частота повторений) слова, что бы оно было включено в словарь
+        5. v_size - размерность вектора, которым кодируется одно слово
+        6. window_size - максимальное расстояние между текущим и прогнозируемым словом в предложении
+        7. epochs - число эпох обучения модели word2vec (если None, используется внутренний итератор)
+        8. logging - вывод данных в процессе обучения модели word2vec '''
 
         if logging:
             log.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=log.INFO)
         print('[i] Обучение модели word2vec...')
 
-        '''
-        # Удаление слов-наполнителей, слов-маркеров и объединение вопросов с ответами
-        clear_dataset = []
-        for pair in dataset:
-            clear_dataset.append([])
-            for word in pair[0]:                
-                if not (word in '<PAD>' or word in '<GO>' or word in '<EOS>'):
-                    clear_dataset[-1].append(word)
-            for word in pair[1]:                
-                if not (word in '<PAD>' or word in '<GO>' or word in '<EOS>'):
-                    clear_dataset[-1].append(word)
-        clear_dataset.append(['<PAD>', '<GO>', '<EOS>'])
-        '''
-
-        sentences = [ q + a for [q,a] in dataset ]
         self.model = word2vec.Word2Vec(min_count=min_count_repeat, size=v_size, window=window_size, workers=multiprocessing.cpu_count())
         # Используется модель skip-gram (результат нулевой)
         #model = word2vec.Word2Vec(min_count=min_count_repeat, size=w_size, window=window_size, workers=multiprocessing.cpu_count(), sg=1)
-        self.model.build_vocab(sentences)
+        self.model.build_vocab_from_freq(vocabulary, corpus_count=corpus.number_sentences)
 
         if epochs is None:
             epochs = self.model.iter
-        self.model.train(sentences, epochs=epochs, total_examples=len(sentences))
+        self.model.train(corpus, epochs=epochs, total_examples=corpus.number_sentences)
 
         self.model.wv.save_word2vec_format(f_name_w2v_model, binary=True)
+        # Полная модель (вместе с весами выходного слоя) нужна для дообучения с помощью update_word2vec()
+        self.model.save(get_f_name_w2v_full_model(f_name_w2v_model))
 
 
-    def data_w2v_encode(self, dataset, f_name_enc_training_sample, len_enc_training_sample=None):
-        ''' Кодирование предложений из dataset в вектор.
+    def data_w2v_encode(self, dataset, f_name_enc_training_sample, len_enc_training_sample=None, chunk_size=1000, encode_to_ids=True,
+                        number_processes=None, append=False):
+        ''' Кодирование предложений из dataset в вектор. Пары кодируются частями по chunk_size и сразу записываются в заранее созданные .npy файлы
+        (через mmap), поэтому потребление памяти не зависит от размера выборки. Части кодируются параллельно в number_processes процессах, которые
+        получают словарь, матрицу векторов и dataset от родительского процесса без копирования (fork) и пишут результат в одни и те же .npy файлы.
+        Для чтения результата используется EncodedSample.
         1. dataset - предварительно обработанные пары [вопрос,ответ]
-        2. f_name_enc_training_sample - имя выходного .npz файла с векторным представлением слов в парах [вопрос,ответ]
-        3. len_enc_training_sample - если None: закодировать весь dataset, иначе - первые len_enc_training_sample элементов '''
+        2. f_name_enc_training_sample - имя закодированной выборки (по нему определяются имена выходных .npy файлов с векторным представлением 
+        вопросов и ответов, например для encoded_plays_ru.npz - encoded_plays_ru_questions.npy и encoded_plays_ru_answers.npy)
+        3. len_enc_training_sample - если None: закодировать весь dataset, иначе - первые len_enc_training_sample элементов
+        4. chunk_size - количество пар, кодируемых за один раз
+        5. encode_to_ids - True: сохранять индексы слов (int32) и ссылку на матрицу векторов модели word2vec (в .json файле с именем выборки),
+        вектора получаются из индексов при чтении (размер выборки меньше в size раз), False: сохранять вектора (float32)
+        6. number_processes - количество процессов для кодирования (по умолчанию равно количеству CPU, 1 - кодирование в текущем процессе)
+        7. append - True: дописать закодированные пары в конец существующей выборки (формат выборки, индексы или вектора, определяется по ней,
+        encode_to_ids игнорируется)
+        8. возвращает True, если выборка успешно закодирована '''
         
-        print('[i] Кодирование обучающей выборки...')
-        questions = [ q for [q, a] in dataset ]
-        answers = [ a for [q, a] in dataset ]
-
         if len_enc_training_sample is None or len_enc_training_sample > len(dataset):
             len_enc_training_sample = len(dataset)
+        f_name_questions, f_name_answers = get_f_names_enc_training_sample(f_name_enc_training_sample)
+        number_old_examples = 0
+        if append:
+            if os.path.isfile(f_name_questions) and os.path.isfile(f_name_answers):
+                old_questions = np.load(f_name_questions, mmap_mode='r')
+                old_answers = np.load(f_name_answers, mmap_mode='r')
+                number_old_examples = len(old_questions)
+                encode_to_ids = old_questions.ndim == 2
+            elif os.path.isfile(f_name_enc_training_sample):
+                print('[E] Дополнение выборки в старом формате (%s) не поддерживается, её необходимо закодировать заново' % f_name_enc_training_sample)
+                return
+            else:
+                append = False
+        if encode_to_ids and self.f_name_w2v_store is None:
+            print('[E] Для кодирования в индексы слов модель word2vec необходимо сохранить с помощью save_w2v_store()')
+            return
+        if number_processes is None:
+            number_processes = multiprocessing.cpu_count()
+        chunks = [ (i, min(i+chunk_size, len_enc_training_sample)) for i in range(0, len_enc_training_sample, chunk_size) ]
+        number_processes = max(1, min(number_processes, len(chunks)))
+
+        if encode_to_ids:
+            shape = (len_enc_training_sample, len(dataset[0][0]))
+            dtype = np.int32
+        else:
+            shape = (len_enc_training_sample, len(dataset[0][0]), self.vectors.shape[1])
+            dtype = np.float32
+
+        # При дополнении выборки результат сначала записывается во временные файлы, которые заменяют старые только после завершения кодирования
+        f_names_output = [f_name_questions, f_name_answers]
+        if append:
+            if old_questions.shape[1:] != shape[1:]:
+                print('[E] Размерность пар %s не совпадает с размерностью выборки %s' % (shape[1:], old_questions.shape[1:]))
+                return
+            f_names_output = [ f_name[:-len('.npy')] + '_tmp.npy' for f_name in f_names_output ]
+        print('[i] Кодирование обучающей выборки в %s и %s' % (f_name_questions, f_name_answers))
+        print('\tразмер результата: %.2f Мб' % (2 * np.prod(shape) * 4 / 1024 / 1024))
+        if append:
+            print('\tдополняемая выборка: %i пар' % number_old_examples)
+        print('\tколичество процессов: %i' % number_processes)
+        for f_name, old_data in zip(f_names_output, [old_questions, old_answers] if append else [None, None]):
+            enc_data = np.lib.format.open_memmap(f_name, mode='w+', dtype=dtype, shape=(number_old_examples + shape[0],) + shape[1:])
+            for i in range(0, number_old_examples, chunk_size):
+                enc_data[i:min(i+chunk_size, number_old_examples)] = old_data[i:i+chunk_size]
+            enc_data.flush()
+            del enc_data
 
-        i = 0
-        lost_words = []
-        while i < len_enc_training_sample:
-            if i % 1000 == 0 or i == len(questions) - 1:
-                os.write(sys.stdout.fileno(), curses.tigetstr('cuu1'))
-                print('[i] Кодирование обучающей выборки... %i из %i' % (i, len(questions)))
-            current_sentence = []
-            for word in questions[i]:
-                try:
-                    current_sentence.append(self.model[word])
-                except KeyError:
-                    lost_words.append(word)
-                    current_sentence.insert(0, self.model['<PAD>'])
-            questions[i] = np.asarray(current_sentence)
-
-            current_sentence = []
-            for word in answers[i]:
-                try:
-                    current_sentence.append(self.model[word])
-                except KeyError:
-                    lost_words.append(word)
-                    current_sentence.insert(-1, self.model['<PAD>'])
-            answers[i] = np.asarray(current_sentence)
-            i += 1
-        questions = questions[:len_enc_training_sample]
-        answers = answers[:len_enc_training_sample]
-        os.write(sys.stdout.fileno(), curses.tigetstr('cuu1'))
-        print('[i] Кодирование обучающей выборки... %i из %i    ' % (len(questions), len(questions)))
-
-        if len(lost_words) > 0:
-            print('[i] Количество потерянных слов: %i' % len(lost_words))
-        
-        print('[i] Сохранение закодированной обучащей выборки в %s' % f_name_enc_training_sample)
-        np.savez_compressed(f_name_enc_training_sample, questions=questions, answers=answers)
-
-
-    def w2v_test(self, test_word):
+        print('[i] Кодирование обучающей выборки...')
+        start_time = time.time()
+        number_encoded = 0
+        number_lost_words = 0
+        encode_args = (self, dataset, f_names_output[0], f_names_output[1], encode_to_ids, number_old_examples)
+        if number_processes > 1:
+            pool = multiprocessing.get_context('fork').Pool(number_processes, _init_encode_worker, encode_args)
+            results = pool.imap_unordered(_encode_chunk, chunks)
+        else:
+            pool = None
+            _init_encode_worker(*encode_args)
+            results = map(_encode_chunk, chunks)
+
+        for number_pairs, current_number_lost_words, chunk_time in results:
+            number_encoded += number_pairs
+            number_lost_words += current_number_lost_words
+            chunk_time = max(chunk_time, 1e-6)
+            total_time = max(time.time() - start_time, 1e-6)
+            os.write(sys.stdout.fileno(), curses.tigetstr('cuu1'))
+            print('[i] Кодирование обучающей выборки... %i из %i (%.0f пар/с в процессе, всего %.0f пар/с, %.2f Мб/с)    ' % (number_encoded,
+                  len_enc_training_sample, number_pairs / chunk_time, number_encoded / total_time, 
+                  2 * number_encoded * np.prod(shape[1:]) * 4 / 1024 / 1024 / total_time))
+        if pool is not None:
+            pool.close()
+            pool.join()
+        else:
+            _encode_state.clear()
+        if append:
+            del old_questions, old_answers
+            os.replace(f_names_output[0], f_name_questions)
+            os.replace(f_names_output[1], f_name_answers)
+        print('[i] Время кодирования: %.2f мин' % ((time.time() - start_time)/60.0))
+
+        if number_lost_words > 0:
+            print('[i] Количество потерянных слов: %i' % number_lost_words)
+
+        f_name_enc_training_sample_info = get_f_name_enc_training_sample_info(f_name_enc_training_sample)
+        if encode_to_ids:
+            with open(f_name_enc_training_sample_info, 'w') as f_enc_training_sample_info:
+                json.dump({'f_name_w2v_model': self.f_name_w2v_store, 'vocabulary_size': len(self.index2word)}, f_enc_training_sample_info)
+        elif os.path.isfile(f_name_enc_training_sample_info):
+            os.remove(f_name_enc_training_sample_info)
+        return True
+
+
+    def w2v_test(self, test_word, topn=10):
         ''' Тестирование обученной модели: поиск похожих на test_word слов в словаре.
         1. test_word - строка со словом
-        2. возвращает list из 10 ближайших слов или 'not_found' если слова нет в словаре '''
+        2. topn - количество возвращаемых слов
+        3. возвращает list из topn ближайших слов в виде (слово, схожесть) или 'not_found' если слова нет в словаре '''
 
-        try:
-            return self.model.most_similar([test_word])
-        except KeyError:
+        if test_word not in self.word_index:
             return 'not_found'
+        test_vector = self.ids2vec(self.word_index[test_word])
+        test_vector = test_vector / (np.linalg.norm(test_vector) + 1e-12)
+        scores = self.__decode_scores(test_vector[np.newaxis], 0, len(self.decode_matrix))[0]
+        word_ids = self.decode_ids if self.decode_ids is not None else np.arange(len(scores))
+        scores[word_ids == self.word_index[test_word]] = -np.inf
+        ids = np.argsort(-scores)[:topn]
+        return [ (self.index2word[word_ids[i]], float(scores[i])) for i in ids ]
+
+
+# Состояние процесса, кодирующего обучающую выборку (задаётся в _init_encode_worker())
+_encode_state = {}
+
+
+def _init_encode_worker(w2v, dataset, f_name_questions, f_name_answers, encode_to_ids, offset=0):
+    ''' Инициализация процесса для кодирования обучающей выборки: открытие выходных .npy файлов на запись через mmap (пара dataset[i]
+    записывается в строку offset+i). '''
+    _encode_state['w2v'] = w2v
+    _encode_state['dataset'] = dataset
+    _encode_state['questions'] = np.load(f_name_questions, mmap_mode='r+')
+    _encode_state['answers'] = np.load(f_name_answers, mmap_mode='r+')
+    _encode_state['encode_to_ids'] = encode_to_ids
+    _encode_state['offset'] = offset
+
+
+def _encode_chunk(chunk):
+    ''' Кодирование пар с индексами chunk[0]:chunk[1] и запись результата в выходные .npy файлы.
+    1. возвращает количество закодированных пар, количество потерянных слов и время кодирования '''
+    start_time = time.time()
+    start, end = chunk
+    w2v = _encode_state['w2v']
+    pairs = _encode_state['dataset'][start:end]
+    output_start, output_end = start + _encode_state['offset'], end + _encode_state['offset']
+    questions_ids, lost_words_questions = w2v.sentences2ids([ q for [q, a] in pairs ], return_lost_words=True)
+    answers_ids, lost_words_answers = w2v.sentences2ids([ a for [q, a] in pairs ], is_answers=True, return_lost_words=True)
+    if _encode_state['encode_to_ids']:
+        _encode_state['questions'][output_start:output_end] = questions_ids
+        _encode_state['answers'][output_start:output_end] = answers_ids
+    else:
+        _encode_state['questions'][output_start:output_end] = w2v.ids2vec(questions_ids)
+        _encode_state['answers'][output_start:output_end] = w2v.ids2vec(answers_ids)
+    _encode_state['questions'].flush()
+    _encode_state['answers'].flush()
+    return end - start, len(lost_words_questions) + len(lost_words_answers), time.time() - start_time
+
+
+def get_f_name_w2v_full_model(f_name_w2v_model):
+    ''' Возвращает имя файла с полной моделью word2vec (для дообучения) для .bin модели f_name_w2v_model (например, для
+    data/plays_ru/w2v_model_plays_ru.bin - data/plays_ru/w2v_model_plays_ru.model). '''
+    return os.path.splitext(f_name_w2v_model)[0] + '.model'
+
+
+def get_f_name_w2v_store(f_name_w2v_model):
+    ''' Возвращает имя .npy файла с матрицей векторов для модели word2vec f_name_w2v_model (например, data/plays_ru/w2v_model_plays_ru.npy). '''
+    return f_name_w2v_model[:f_name_w2v_model.rfind('.')] + '.npy'
 
 
 # Пиковое потребление оперативной памяти при кодировании субтитров в вектора (во время обучения - 8Гб):
@@ -283,12 +723,12 @@ def main():
     w2v = WordToVec()
     #w2v.build_word2vec(f_name_prepared_conversations, f_name_prepared_subtitles, len_encode=5000, size=500, epochs=None, logging=True)
     # size=500 или 1000 для набора данных из 1500-1600 обучающих пар, если size=300 - не удаётся обучить сеть с точностью >60-70%
+    #w2v.update_word2vec('data/conversations_ru/prepared_new_conversations_ru.pkl', f_name_prepared_conversations) # дополнение новыми парами
 
-    new_w2v = WordToVec(f_name_w2v_model_subtitles)
+    new_w2v = WordToVec(f_name_w2v_model_subtitles) # при первой загрузке .bin модели сохраняется её копия для быстрой загрузки через mmap
 
     #print('[i] Загрузка данных из %s' % f_name_prepared_conversations)
-    #with open(f_name_prepared_conversations, 'rb') as f_training_sample:
-    #    dataset = pickle.load(f_training_sample)
+    #dataset = load_prepared_pairs(f_name_prepared_conversations, 10000)
     #new_w2v.data_w2v_encode(dataset, f_name_enc_conversations, 10000)
 
     while True:
@@ -303,4 +743,9 @@ def main():
 
 if __name__ == '__main__':
     print('[i] Количество CPU: %i' % multiprocessing.cpu_count() )
-    main()
\ No newline at end of file
+    if len(sys.argv) > 1:
+        # Сохранение .bin моделей для быстрой загрузки через mmap (если ещё не сохранены): python3 word_to_vec.py w2v_model_plays_ru.bin ...
+        for f_name_w2v_model in sys.argv[1:]:
+            WordToVec(f_name_w2v_model)
+    else:
+        main()
\ No newline at end of file